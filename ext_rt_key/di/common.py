@@ -33,6 +33,80 @@ class Settings(BaseSettings):
 
     DB_URL: str | None = None
 
+    # Кодек JSON: orjson или stdlib
+    JSON_CODEC: str = "orjson"
+
+    # Адрес локального стенда Rt (tools/rt_stub.py), все запросы к Rt перенаправляются на него
+    RT_STUB_URL: str | None = None
+
+    # Пул соединений к хостам Rt
+    UPSTREAM_MAX_CONNECTIONS_PER_HOST: int = 20
+    UPSTREAM_MAX_KEEPALIVE_PER_HOST: int = 10
+    UPSTREAM_KEEPALIVE_EXPIRY: float = 30.0
+
+    # Таймауты запросов к Rt (в секундах)
+    UPSTREAM_CALL_TIMEOUT: float = 10.0
+    UPSTREAM_CONNECT_TIMEOUT: float = 3.0
+
+    # Предохранитель и адаптивный лимит запросов на хост Rt
+    UPSTREAM_BREAKER_FAILURE_THRESHOLD: int = 5
+    UPSTREAM_BREAKER_RECOVERY_TIMEOUT: float = 30.0
+    UPSTREAM_LIMIT_INITIAL: int = 10
+    UPSTREAM_LIMIT_MIN: int = 1
+    UPSTREAM_LIMIT_MAX: int = 20
+    UPSTREAM_LIMIT_LATENCY_TARGET: float = 2.0
+
+    # Кэш списка камер по логинам
+    CAMERAS_CACHE_TTL: float = 60.0
+    CAMERAS_CACHE_MAX_SIZE: int = 1000
+
+    # Кэш списков устройств для маршрутов чтения (сбрасывается синхронизацией)
+    READ_CACHE_TTL: float = 300.0
+    READ_CACHE_MAX_SIZE: int = 30000
+
+    # Хелперы Rt логинов: сколько секунд хранится хелпер без обращений и сколько их всего
+    RT_HELPERS_TTL: float = 3600.0
+    RT_HELPERS_MAX_SIZE: int = 10000
+
+    # Сколько секунд помнить токены, которые Rt отклонил (401)
+    INVALID_TOKENS_TTL: float = 300.0
+    INVALID_TOKENS_MAX_SIZE: int = 10000
+
+    # Ограничение запросов к авторизации Rt
+    AUTH_LOGIN_REQUESTS_PER_MINUTE: float = 5.0
+    AUTH_LOGIN_BURST: int = 5
+    AUTH_GLOBAL_REQUESTS_PER_SECOND: float = 10.0
+    AUTH_GLOBAL_BURST: int = 20
+    AUTH_COOLDOWN_INITIAL: float = 60.0
+    AUTH_COOLDOWN_MAX: float = 900.0
+
+    # Фоновая синхронизация устройств всех логинов (интервалы в секундах). Расписание запускается
+    # в каждом воркере, но ведет его только один (advisory-блокировка PostgreSQL)
+    SYNC_ENABLED: bool = True
+    SYNC_INTERVAL: float = 900.0
+    SYNC_IDLE_INTERVAL: float = 3600.0
+    SYNC_ACTIVE_WINDOW: float = 3600.0
+    SYNC_JITTER: float = 0.2
+    SYNC_CONCURRENCY: int = 4
+    # Сколько синхронизаций может ждать очереди или выполняться одновременно
+    SYNC_QUEUE_SIZE: int = 100
+    SYNC_BACKOFF_MAX: float = 21600.0
+    SYNC_POLL_INTERVAL: float = 30.0
+    # Бюджет времени одной синхронизации и сколько хранится ее результат
+    SYNC_BUDGET: float = 60.0
+    SYNC_JOBS_TTL: float = 3600.0
+
+    # Массовая синхронизация (ext-rt-key-bulk-sync): логинов одновременно и логинов в транзакции
+    BULK_SYNC_CONCURRENCY: int = 16
+    BULK_SYNC_BATCH_SIZE: int = 200
+
+    # Бюджет времени маршрута на все запросы к Rt (в секундах)
+    ROUTE_DEADLINE_DEFAULT: float = 15.0
+    ROUTE_DEADLINES: dict[str, float] = {
+        "/auth/request_code": 10.0,
+        "/auth/request_token": 10.0,
+    }
+
     @field_validator("DB_URL", mode="before")
     @staticmethod
     def assemble_db_connection(_v: str, values: ValidationInfo) -> str:
@@ -5,8 +5,9 @@
 """
 
 import time
-from collections.abc import AsyncGenerator
+from collections.abc import AsyncGenerator, Iterator
 from contextlib import asynccontextmanager
+from http import HTTPStatus
 from logging import Logger
 from typing import Any, cast
 
@@ -14,17 +15,34 @@ from dependency_injector import containers, providers
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi_offline import FastAPIOffline
-from pydantic_settings import BaseSettings
 from sqlalchemy import create_engine
 
 from ext_rt_key import __appname__, __version__
-from ext_rt_key.di.common import CommonDI
+from ext_rt_key.di.common import CommonDI, Settings
+from ext_rt_key.models.request import BadResponse
 from ext_rt_key.rest.auth.auth_router import AuthRouter
-from ext_rt_key.rest.common import RoutsCommon
+from ext_rt_key.rest.common import FastJSONResponse, RoutsCommon
+from ext_rt_key.rest.devices.cache import DevicesReadCache
 from ext_rt_key.rest.devices.devices_router import DevicesRouter
 from ext_rt_key.rest.manager import RTManger
+from ext_rt_key.rest.monitoring.monitoring_router import MonitoringRouter
+from ext_rt_key.rest.sync.jobs import SyncJobs
+from ext_rt_key.rest.sync.scheduler import SyncScheduler
+from ext_rt_key.rest.upstream.cache import TTLCache
+from ext_rt_key.rest.upstream.client import UpstreamClient
+from ext_rt_key.rest.upstream.deadline import deadline_scope
+from ext_rt_key.rest.upstream.errors import (
+    DeadlineExceededError,
+    UpstreamError,
+    UpstreamUnavailableError,
+)
+from ext_rt_key.rest.upstream.pool import UpstreamPool
+from ext_rt_key.rest.upstream.rate_limit import AuthRateLimiter
+from ext_rt_key.rest.upstream.resilience import HostGuards
 from ext_rt_key.rest.video.video_router import VideoRouter
+from ext_rt_key.utils import json_codec
 from ext_rt_key.utils.db_helper import DBHelper
+from ext_rt_key.utils.metrics import DEFAULT_TIME_BUCKETS, REGISTRY
 
 __all__ = ("RestDI",)
 
@@ -38,7 +56,9 @@ class CustomFastAPIType(FastAPI):
 def init_rest_app(
     routers: list[type[RoutsCommon]],
     logger: Logger,
-    settings: BaseSettings,
+    settings: Settings,
+    rt_manger: RTManger,
+    sync_scheduler: SyncScheduler,
 ) -> FastAPI:
     """
     Инициализация Rest интерфейса
@@ -46,12 +66,23 @@ def init_rest_app(
 
     :return: Экземпляр :class:`FastAPIOffline`
     """
+    json_codec.set_codec(settings.JSON_CODEC)
+    # Метки: route, method
+    route_latency = rt_manger.client.metrics.meter.create_histogram(
+        "rt_route_duration_seconds",
+        description="Время выполнения маршрута сервиса",
+        explicit_bucket_boundaries_advisory=DEFAULT_TIME_BUCKETS,
+    )
 
     @asynccontextmanager
-    async def lifespan(app: FastAPI) -> AsyncGenerator[Any]:  # noqa: ARG001, RUF029
+    async def lifespan(app: FastAPI) -> AsyncGenerator[Any]:  # noqa: ARG001
         # Ожидание запуска сервисов от которых зависит приложение
         logger.info("Приложение инициализировано", extra={"settings": settings.model_dump_json()})
+        if settings.SYNC_ENABLED:
+            sync_scheduler.start()
         yield
+        await sync_scheduler.stop()
+        await rt_manger.aclose()
 
     app: CustomFastAPIType = cast(
         CustomFastAPIType, FastAPIOffline(version=__version__, lifespan=lifespan)
@@ -70,6 +101,39 @@ def init_rest_app(
 
     app.logger = logger
 
+    @app.exception_handler(UpstreamError)
+    async def upstream_error_handler(request: Request, exc: UpstreamError) -> FastJSONResponse:  # noqa: RUF029
+        """Ошибка при обращении к Rt не должна превращаться в 500"""
+        logger.warning(f"Маршрут {request.url.path}: {exc}")
+        return FastJSONResponse(
+            status_code=HTTPStatus.BAD_GATEWAY,
+            content=BadResponse(message=exc.message).model_dump(),
+        )
+
+    @app.exception_handler(UpstreamUnavailableError)
+    async def upstream_unavailable_handler(  # noqa: RUF029
+        request: Request,
+        exc: UpstreamUnavailableError,
+    ) -> FastJSONResponse:
+        """Хост Rt деградировал, запрос отклонен без обращения к нему"""
+        logger.warning(f"Маршрут {request.url.path}: {exc}")
+        return FastJSONResponse(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            content=BadResponse(message=exc.message).model_dump(),
+        )
+
+    @app.exception_handler(DeadlineExceededError)
+    async def deadline_exceeded_handler(  # noqa: RUF029
+        request: Request,
+        exc: DeadlineExceededError,
+    ) -> FastJSONResponse:
+        """Бюджет маршрута на запросы к Rt исчерпан"""
+        logger.warning(f"Маршрут {request.url.path}: исчерпан бюджет {exc.budget} сек.")
+        return FastJSONResponse(
+            status_code=HTTPStatus.GATEWAY_TIMEOUT,
+            content=BadResponse(message=exc.message, data={"budget": exc.budget}).model_dump(),
+        )
+
     @app.middleware("http")
     async def timing_middleware(request: Request, call_next: Any) -> Any:
         """Middleware для автоматического замера времени выполнения ВСЕХ маршрутов в FastAPI."""
@@ -81,9 +145,22 @@ def init_rest_app(
         logger.info(
             f"Маршрут {request.url.path} выполнен за {duration:.4f} секунд.",
         )
+        # Шаблон маршрута вместо пути, чтобы параметры пути не плодили метки
+        route = request.scope.get("route")
+        route_latency.record(
+            duration,
+            {"route": getattr(route, "path", "unmatched"), "method": request.method},
+        )
 
         return response
 
+    @app.middleware("http")
+    async def deadline_middleware(request: Request, call_next: Any) -> Any:
+        """Назначение маршруту бюджета времени на запросы к Rt"""
+        budget = settings.ROUTE_DEADLINES.get(request.url.path, settings.ROUTE_DEADLINE_DEFAULT)
+        with deadline_scope(budget):
+            return await call_next(request)
+
     logger.info("Зарегистрированные routs", extra={"routs": str(app.router.routes)})
     return app
 
@@ -92,7 +169,7 @@ def get_db_helper(
     url: str,
     pool_size: int | None = None,
     max_overflow: int | None = None,
-) -> DBHelper:
+) -> Iterator[DBHelper]:
     pool_size = pool_size or 5
     max_overflow = max_overflow or 10
     engine = create_engine(
@@ -103,7 +180,11 @@ def get_db_helper(
         connect_args={"application_name": __appname__},
     )
 
-    return DBHelper(engine=engine)
+    # Соединения пула закрываются при `shutdown_resources` контейнера
+    try:
+        yield DBHelper(engine=engine)
+    finally:
+        engine.dispose()
 
 
 class RestDI(containers.DeclarativeContainer):
@@ -116,10 +197,99 @@ class RestDI(containers.DeclarativeContainer):
         url=common_di.settings.provided().DB_URL,
     )
 
+    metrics = providers.Object(REGISTRY)
+
+    upstream_pool = providers.Singleton(
+        UpstreamPool,
+        max_connections_per_host=common_di.settings.provided.UPSTREAM_MAX_CONNECTIONS_PER_HOST,
+        max_keepalive_per_host=common_di.settings.provided.UPSTREAM_MAX_KEEPALIVE_PER_HOST,
+        keepalive_expiry=common_di.settings.provided.UPSTREAM_KEEPALIVE_EXPIRY,
+    )
+
+    upstream_guards = providers.Singleton(
+        HostGuards,
+        failure_threshold=common_di.settings.provided.UPSTREAM_BREAKER_FAILURE_THRESHOLD,
+        recovery_timeout=common_di.settings.provided.UPSTREAM_BREAKER_RECOVERY_TIMEOUT,
+        initial_limit=common_di.settings.provided.UPSTREAM_LIMIT_INITIAL,
+        min_limit=common_di.settings.provided.UPSTREAM_LIMIT_MIN,
+        max_limit=common_di.settings.provided.UPSTREAM_LIMIT_MAX,
+        latency_target=common_di.settings.provided.UPSTREAM_LIMIT_LATENCY_TARGET,
+    )
+
+    upstream_client = providers.Singleton(
+        UpstreamClient,
+        pool=upstream_pool,
+        guards=upstream_guards,
+        metrics=metrics,
+        call_timeout=common_di.settings.provided.UPSTREAM_CALL_TIMEOUT,
+        connect_timeout=common_di.settings.provided.UPSTREAM_CONNECT_TIMEOUT,
+        base_url_override=common_di.settings.provided.RT_STUB_URL,
+        logger=common_di.logger,
+    )
+
+    cameras_cache: providers.Singleton[TTLCache[str, list[dict[str, Any]]]] = providers.Singleton(
+        TTLCache,
+        ttl=common_di.settings.provided.CAMERAS_CACHE_TTL,
+        max_size=common_di.settings.provided.CAMERAS_CACHE_MAX_SIZE,
+    )
+
+    auth_limiter = providers.Singleton(
+        AuthRateLimiter,
+        login_rate_per_minute=common_di.settings.provided.AUTH_LOGIN_REQUESTS_PER_MINUTE,
+        login_burst=common_di.settings.provided.AUTH_LOGIN_BURST,
+        global_rate_per_second=common_di.settings.provided.AUTH_GLOBAL_REQUESTS_PER_SECOND,
+        global_burst=common_di.settings.provided.AUTH_GLOBAL_BURST,
+        cooldown_initial=common_di.settings.provided.AUTH_COOLDOWN_INITIAL,
+        cooldown_max=common_di.settings.provided.AUTH_COOLDOWN_MAX,
+    )
+
+    invalid_tokens: providers.Singleton[TTLCache[str, bool]] = providers.Singleton(
+        TTLCache,
+        ttl=common_di.settings.provided.INVALID_TOKENS_TTL,
+        max_size=common_di.settings.provided.INVALID_TOKENS_MAX_SIZE,
+    )
+
+    read_cache = providers.Singleton(
+        DevicesReadCache,
+        ttl=common_di.settings.provided.READ_CACHE_TTL,
+        max_size=common_di.settings.provided.READ_CACHE_MAX_SIZE,
+        metrics=metrics,
+    )
+
+    sync_jobs = providers.Singleton(
+        SyncJobs,
+        budget=common_di.settings.provided.SYNC_BUDGET,
+        ttl=common_di.settings.provided.SYNC_JOBS_TTL,
+        logger=common_di.logger,
+    )
+
     rt_manger = providers.Singleton(
         RTManger,
         logger=common_di.logger,
         db_helper=db_helper,
+        client=upstream_client,
+        cameras_cache=cameras_cache,
+        auth_limiter=auth_limiter,
+        invalid_tokens=invalid_tokens,
+        sync_jobs=sync_jobs,
+        read_cache=read_cache,
+        helpers_ttl=common_di.settings.provided.RT_HELPERS_TTL,
+        helpers_max_size=common_di.settings.provided.RT_HELPERS_MAX_SIZE,
+    )
+
+    sync_scheduler = providers.Singleton(
+        SyncScheduler,
+        rt_manger=rt_manger,
+        db_helper=db_helper,
+        interval=common_di.settings.provided.SYNC_INTERVAL,
+        idle_interval=common_di.settings.provided.SYNC_IDLE_INTERVAL,
+        active_window=common_di.settings.provided.SYNC_ACTIVE_WINDOW,
+        jitter=common_di.settings.provided.SYNC_JITTER,
+        concurrency=common_di.settings.provided.SYNC_CONCURRENCY,
+        queue_size=common_di.settings.provided.SYNC_QUEUE_SIZE,
+        backoff_max=common_di.settings.provided.SYNC_BACKOFF_MAX,
+        poll_interval=common_di.settings.provided.SYNC_POLL_INTERVAL,
+        logger=common_di.logger,
     )
 
     auth_router = providers.Singleton(
@@ -146,13 +316,24 @@ class RestDI(containers.DeclarativeContainer):
         db_helper=db_helper,
     )
 
+    monitoring_router = providers.Singleton(
+        MonitoringRouter,
+        rt_manger=rt_manger,
+        prefix="/monitoring",
+        tags=["monitoring"],
+        db_helper=db_helper,
+    )
+
     app = providers.Factory(
         init_rest_app,
         routers=[
             auth_router,
             video_router,
             devices_router,
+            monitoring_router,
         ],
         logger=common_di.logger,
         settings=common_di.settings,
+        rt_manger=rt_manger,
+        sync_scheduler=sync_scheduler,
     )
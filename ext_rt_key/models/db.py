@@ -8,8 +8,24 @@ import datetime
 from enum import Enum
 from typing import Any
 
-from sqlalchemy import Boolean, DateTime, Enum as SQLEnum, ForeignKey, Integer, String
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship, Session
+from sqlalchemy import (
+    Boolean,
+    DateTime,
+    Enum as SQLEnum,
+    ForeignKey,
+    Integer,
+    LargeBinary,
+    String,
+    UniqueConstraint,
+)
+from sqlalchemy.orm import (
+    DeclarativeBase,
+    Mapped,
+    mapped_column,
+    relationship,
+    selectinload,
+    Session,
+)
 
 from ext_rt_key.utils.jwt_helper import JWTHelper
 
@@ -97,22 +113,43 @@ class Login(Base):
         nullable=True,
     )
 
+    needs_reauth: Mapped[bool] = mapped_column(
+        Boolean,
+        default=False,
+        server_default="false",
+        doc="Rt отклонил токен, требуется повторная авторизация",
+    )
+
+    cameras_fingerprint: Mapped[str | None] = mapped_column(
+        String,
+        nullable=True,
+        doc="Отпечаток последнего сохраненного списка камер из Rt",
+    )
+
+    devices_fingerprint: Mapped[str | None] = mapped_column(
+        String,
+        nullable=True,
+        doc="Отпечаток последнего сохраненного списка устройств из Rt",
+    )
+
     user: Mapped["User"] = relationship(
         "User",
         back_populates="logins",
         uselist=False,
     )
 
+    # Списки загружаются только по обращению: логин читается и для проверок доступа, где
+    # устройства не нужны. Для выдачи списков используется `LOGIN_DEVICES_LOADING`
     devices: Mapped[list["Devices"]] = relationship(
         "Devices",
         back_populates="login",
-        lazy="joined",
+        order_by="Devices.id",
     )
 
     cameras: Mapped[list["Cameras"]] = relationship(
         "Cameras",
         back_populates="login",
-        lazy="joined",
+        order_by="Cameras.id",
     )
 
     def is_expired(self) -> bool:
@@ -172,6 +209,11 @@ class Cameras(Base):
         String,
         doc="Токен для получения видео трансляции",
     )
+    content_hash: Mapped[str | None] = mapped_column(
+        String,
+        doc="Хэш данных камеры из Rt",
+        nullable=True,
+    )
 
     login_id: Mapped[int] = mapped_column(
         Integer, ForeignKey("login.id", ondelete="CASCADE"), nullable=False
@@ -248,6 +290,12 @@ class Devices(Base):
         nullable=True,
     )
 
+    content_hash: Mapped[str | None] = mapped_column(
+        String,
+        doc="Хэш данных устройства из Rt",
+        nullable=True,
+    )
+
     login: Mapped["Cameras"] = relationship(
         Login,
         back_populates="devices",
@@ -273,3 +321,42 @@ class Devices(Base):
             "name_by_user": self.name_by_user,
             "camera": self.camera.to_json() if self.camera else None,
         }
+
+
+# Загрузка логина для выдачи списков устройств: по одному запросу на логин, камеры,
+# устройства и камеры устройств, независимо от их количества
+LOGIN_DEVICES_LOADING = (
+    selectinload(Login.cameras),
+    selectinload(Login.devices).selectinload(Devices.camera),
+)
+
+
+class DeviceSnapshot(Base):
+    """Готовый к отправке ответ со списком устройств логина (собирается синхронизацией)"""
+
+    __tablename__ = "device_snapshots"
+    __table_args__ = (UniqueConstraint("login_id", "kind"),)
+
+    login_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("login.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+
+    kind: Mapped[str] = mapped_column(
+        String,
+        doc="Вид списка (cameras, intercom, barrier)",
+        nullable=False,
+    )
+
+    payload: Mapped[bytes] = mapped_column(
+        LargeBinary,
+        doc="Тело ответа в JSON (utf-8)",
+        nullable=False,
+    )
+
+    updated_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime,
+        default=lambda: datetime.datetime.now(datetime.UTC),
+        nullable=False,
+    )
@@ -25,7 +25,7 @@ class AuthRouter(RoutsCommon):
         data: RequestCode,
     ) -> GoodResponse | BadResponse:
         """Запрос кода авторизации"""
-        rt_helper = self.rt_manger.add_helper(data.login)
+        rt_helper = await self.rt_manger.helper(data.login)
         return await rt_helper.request_code(
             captcha_id=data.captcha_id,
             captcha_code=data.captcha_code,
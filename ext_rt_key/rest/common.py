@@ -8,17 +8,27 @@ from abc import ABC, abstractmethod
 from collections.abc import Callable
 from enum import Enum
 from logging import getLogger, Logger
-from typing import Any
+from typing import Any, override
 
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
 from sqlalchemy import and_
 
 from ext_rt_key.models import db as models
 from ext_rt_key.models.request import BadResponse, GoodResponse
 from ext_rt_key.rest.manager import RTManger
+from ext_rt_key.utils import json_codec
 from ext_rt_key.utils.db_helper import DBHelper
 
 
+class FastJSONResponse(JSONResponse):
+    """JSON ответ, сериализуемый текущим кодеком :mod:`json_codec` (по умолчанию orjson)"""
+
+    @override
+    def render(self, content: Any) -> bytes:
+        return json_codec.dumps(content)
+
+
 class CustomAPIRouter(APIRouter):
     """Расширенный APIRouter"""
 
@@ -45,7 +55,11 @@ class RoutsCommon(ABC):
         :param prefix: Префикс для всех маршрутов в этом роутере.
         :param tags: Теги, используемые для группировки маршрутов в документации.
         """
-        self._router = CustomAPIRouter(prefix=prefix, tags=tags)
+        self._router = CustomAPIRouter(
+            prefix=prefix,
+            tags=tags,
+            default_response_class=FastJSONResponse,
+        )
         self.logger = logger or getLogger(__name__)
         self.rt_manger = rt_manger
         self.db_helper = db_helper
@@ -127,13 +141,13 @@ class RoutsCommon(ABC):
     ) -> list[str] | None:
         """Получает внутренний id user если он есть"""
         with self.db_helper.sessionmanager() as session:
-            user_logins_model = (
-                session.query(self.models.Login)
+            user_logins = (
+                session.query(self.models.Login.login)
                 .join(self.models.User, self.models.User.id == self.models.Login.user_id)
                 .filter(self.models.User.jwt_token == jwt_token)
                 .all()
             )
-            return [user.login for user in user_logins_model]
+            return [login for (login,) in user_logins]
 
     def get_user_login(
         self,
@@ -141,26 +155,26 @@ class RoutsCommon(ABC):
     ) -> str | None:
         """Возвращает login по его Id"""
         with self.db_helper.sessionmanager() as session:
-            user_login_model: models.Login | None = session.query(self.models.Login).get(login_id)
-            if user_login_model:
-                return user_login_model.login
-            return None
+            login: str | None = (
+                session.query(self.models.Login.login)
+                .filter(self.models.Login.id == login_id)
+                .scalar()
+            )
+            return login
 
     def access_check(
         self,
         jwt_token: str,
         login_id: int,
     ) -> bool:
-        """Проверяет доступ к логину"""
+        """Проверяет доступ к логину (один запрос, без загрузки моделей)"""
         with self.db_helper.sessionmanager() as session:
-            user_id = self.get_user_id(jwt_token)
-            if not user_id:
-                return False
             login = (
-                session.query(self.models.Login)
+                session.query(self.models.Login.id)
+                .join(self.models.User, self.models.User.id == self.models.Login.user_id)
                 .filter(
                     and_(
-                        self.models.Login.user_id == user_id,
+                        self.models.User.jwt_token == jwt_token,
                         self.models.Login.id == login_id,
                     )
                 )
@@ -0,0 +1,88 @@
+"""
+:mod:`cache` -- Кэш списков устройств для маршрутов чтения
+===================================
+.. moduleauthor:: ilya Barinov <i-barinov@it-serv.ru>
+"""
+
+from collections.abc import Callable
+from typing import Any
+
+from ext_rt_key.rest.upstream.cache import TTLCache
+from ext_rt_key.utils.metrics import MetricsRegistry, REGISTRY
+
+__all__ = ("DevicesReadCache",)
+
+
+class DevicesReadCache:
+    """
+    Кэш готовых к отправке списков устройств логина (cameras, intercom, barrier)
+
+    У каждого логина есть версия, которую синхронизация увеличивает после записи в базу.
+    Запись кэша помнит версию, с которой она была прочитана из базы, и после увеличения версии
+    считается устаревшей. Версия берется до чтения из базы, поэтому данные, прочитанные во время
+    синхронизации, в кэше не задерживаются. Время жизни ограничивает устаревание в случаях,
+    когда база меняется в обход этого процесса (другой воркер, массовая синхронизация)
+    """
+
+    def __init__(
+        self,
+        ttl: float = 300.0,
+        max_size: int = 10000,
+        metrics: MetricsRegistry | None = None,
+    ) -> None:
+        """
+        :param ttl: Время жизни записи в секундах
+        :param max_size: Максимальное количество записей
+        :param metrics: Реестр метрик (по умолчанию реестр процесса)
+        """
+        self._entries: TTLCache[tuple[int, str], tuple[int, Any]] = TTLCache(
+            ttl=ttl, max_size=max_size
+        )
+        self._versions: dict[int, int] = {}
+        # Метки: kind, result
+        self.requests = (metrics or REGISTRY).meter.create_counter(
+            "rt_devices_read_cache_requests_total",
+            description="Обращения к кэшу списков устройств",
+        )
+
+    def version(self, login_id: int) -> int:
+        """Текущая версия данных логина"""
+        return self._versions.get(login_id, 0)
+
+    def invalidate(self, login_id: int) -> None:
+        """Данные логина в базе изменились, все его записи устаревают"""
+        self._versions[login_id] = self.version(login_id) + 1
+
+    def get(self, login_id: int, kind: str) -> Any | None:
+        """Список из кэша, None если записи нет или она устарела"""
+        entry = self._entries.get((login_id, kind))
+        if entry is None or entry[0] != self.version(login_id):
+            self.requests.add(1, {"kind": kind, "result": "miss"})
+            return None
+
+        self.requests.add(1, {"kind": kind, "result": "hit"})
+        return entry[1]
+
+    def get_or_load(self, login_id: int, kind: str, load: Callable[[], Any]) -> Any:
+        """
+        Список из кэша или из базы
+
+        :param login_id: Id логина
+        :param kind: Вид списка
+        :param load: Чтение списка из базы
+        """
+        value = self.get(login_id, kind)
+        if value is not None:
+            return value
+
+        version = self.version(login_id)
+        value = load()
+        self._entries.set((login_id, kind), (version, value))
+        return value
+
+    def stats(self) -> dict[str, Any]:
+        """Статистика кэша"""
+        return {
+            **self._entries.stats(),
+            "logins": len(self._versions),
+        }
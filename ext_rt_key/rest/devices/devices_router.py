@@ -4,12 +4,24 @@
 .. moduleauthor:: ilya Barinov <i-barinov@it-serv.ru>
 """
 
+from fastapi import Response
+
 from ext_rt_key.models.request import BadResponse, GoodResponse
 from ext_rt_key.rest.common import RoutsCommon
 from ext_rt_key.rest.devices.models import LoadDevices
+from ext_rt_key.rest.devices.queries import (
+    all_devices_query,
+    CURSOR_COLUMN,
+    device_page_query,
+    LIST_FIELDS,
+    page_items,
+)
 
 __all__ = ("DevicesRouter",)
 
+# Максимальный размер страницы списка устройств
+PAGE_LIMIT_MAX = 500
+
 
 class DevicesRouter(RoutsCommon):
     """Роутер для авторизации и видео трансляции"""
@@ -17,35 +29,130 @@ class DevicesRouter(RoutsCommon):
     def setup_routes(self) -> None:
         """Функция назначения маршрутов"""
         self._router.add_api_route("/load_devices", self.load_devices, methods=["POST"])
-        self._router.add_api_route("/get_cameras", self.get_cameras, methods=["GET"])
-        self._router.add_api_route("/get_intercom", self.get_intercom, methods=["GET"])
-        self._router.add_api_route("/get_barrier", self.get_barrier, methods=["GET"])
+        self._router.add_api_route("/sync_status/{job_id}", self.sync_status, methods=["GET"])
+        self._router.add_api_route("/all", self.get_all, methods=["GET"])
+        # Полные списки отдаются готовыми байтами, модель ответа указывается для документации.
+        # С `fields`, `cursor` или `limit` список читается из базы по колонкам
+        for path, endpoint in (
+            ("/get_cameras", self.get_cameras),
+            ("/get_intercom", self.get_intercom),
+            ("/get_barrier", self.get_barrier),
+        ):
+            self._router.add_api_route(
+                path,
+                endpoint,
+                methods=["GET"],
+                response_model=GoodResponse | BadResponse,
+            )
+
+    def device_list(self, login_id: int, kind: str) -> Response | BadResponse:
+        """
+        Готовый ответ со списком устройств логина: из кэша, при промахе - из базы
+
+        :param login_id: Id логина
+        :param kind: Вид списка (cameras, intercom, barrier)
+        """
+        payload = self.rt_manger.read_cache.get_or_load(
+            login_id,
+            kind,
+            lambda: self.rt_manger.snapshots.get(login_id, kind),
+        )
+        if payload is None:
+            return self.bad_response(message="Логин не найден")
+
+        return Response(content=payload, media_type="application/json")
+
+    def device_page(
+        self,
+        login_id: int,
+        kind: str,
+        fields: str | None = None,
+        cursor: int | None = None,
+        limit: int | None = None,
+    ) -> GoodResponse | BadResponse:
+        """
+        Страница списка устройств логина с выбранными полями
+
+        :param login_id: Id логина
+        :param kind: Вид списка (cameras, intercom, barrier)
+        :param fields: Поля через запятую (по умолчанию все)
+        :param cursor: `next_cursor` из предыдущей страницы
+        :param limit: Размер страницы (по умолчанию весь список после курсора)
+        """
+        allowed = LIST_FIELDS[kind]
+        selected = allowed
+        if fields is not None:
+            selected = tuple(
+                dict.fromkeys(name.strip() for name in fields.split(",") if name.strip())
+            )
+            unknown = [name for name in selected if name not in allowed]
+            if unknown or not selected:
+                return self.bad_response(
+                    message=f"Неизвестные поля: {', '.join(unknown)}",
+                    data={"fields": list(allowed)},
+                )
+        if limit is not None:
+            limit = max(1, min(limit, PAGE_LIMIT_MAX))
+
+        with self.db_helper.sessionmanager() as session:
+            rows = session.execute(
+                device_page_query(kind, login_id, selected, cursor=cursor, limit=limit)
+            ).all()
+
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = rows[-1]._mapping[CURSOR_COLUMN]
+
+        return self.good_response(
+            data={kind: page_items(rows, selected), "next_cursor": next_cursor}
+        )
 
     async def load_devices(
         self,
         data: LoadDevices,
     ) -> GoodResponse | BadResponse:
-        """Выгрузка всех устройств с Rt"""
+        """
+        Запуск выгрузки всех устройств с Rt
+
+        Выгрузка идет в фоне, ответ содержит id задачи для `/devices/sync_status/{job_id}`.
+        Если выгрузка по логину уже идет, возвращается ее задача
+        """
         if self.access_check(jwt_token=data.token, login_id=data.login_id) is False:
             return self.bad_response(message="Недостаточно прав")
+        self.rt_manger.mark_active(data.login_id)
 
         login = self.get_user_login(data.login_id)
         if not login:
             return self.bad_response(message="Не найдены данные авторизации")
 
-        rt_helper = self.rt_manger.add_helper(login)
+        self.logger.info("Начало выгрузки устройств для", extra={"login": login})
+        job = self.rt_manger.sync(data.login_id, login)
+        return self.good_response(message="Выгрузка запущена", data=job.to_json())
 
-        if rt_helper:
-            self.logger.info("Начало выгрузки устройств для", extra={"login": login})
-            return await rt_helper.load_devices()
+    async def sync_status(
+        self,
+        job_id: str,
+        jwt_token: str,
+    ) -> GoodResponse | BadResponse:
+        """Состояние задачи выгрузки устройств"""
+        job = self.rt_manger.sync_jobs.get(job_id)
+        if job is None:
+            return self.bad_response(message="Задача не найдена")
+
+        if self.access_check(jwt_token=jwt_token, login_id=job.login_id) is False:
+            return self.bad_response(message="Недостаточно прав")
 
-        return self.bad_response()
+        return self.good_response(data=job.to_json())
 
     async def get_cameras(
         self,
         jwt_token: str,
         login_id: int,
-    ) -> GoodResponse | BadResponse:
+        fields: str | None = None,
+        cursor: int | None = None,
+        limit: int | None = None,
+    ) -> Response | GoodResponse | BadResponse:
         """Получение списка камер"""
         if (
             self.access_check(
@@ -55,18 +162,20 @@ class DevicesRouter(RoutsCommon):
             is False
         ):
             return self.bad_response(message="Недостаточно прав")
+        self.rt_manger.mark_active(login_id)
 
-        with self.db_helper.sessionmanager() as session:
-            login_model = session.query(self.models.Login).get(login_id)
-            return self.good_response(data={"cameras": login_model.all_cameras})
-
-        return self.bad_response()
+        if fields is None and cursor is None and limit is None:
+            return self.device_list(login_id, "cameras")
+        return self.device_page(login_id, "cameras", fields, cursor, limit)
 
     async def get_intercom(
         self,
         jwt_token: str,
         login_id: int,
-    ) -> GoodResponse | BadResponse:
+        fields: str | None = None,
+        cursor: int | None = None,
+        limit: int | None = None,
+    ) -> Response | GoodResponse | BadResponse:
         """Получение списка шлагбаумов/ворот"""
         if (
             self.access_check(
@@ -76,18 +185,20 @@ class DevicesRouter(RoutsCommon):
             is False
         ):
             return self.bad_response(message="Недостаточно прав")
+        self.rt_manger.mark_active(login_id)
 
-        with self.db_helper.sessionmanager() as session:
-            login_model = session.query(self.models.Login).get(login_id)
-            return self.good_response(data={"intercom": login_model.intercom})
-
-        return self.bad_response()
+        if fields is None and cursor is None and limit is None:
+            return self.device_list(login_id, "intercom")
+        return self.device_page(login_id, "intercom", fields, cursor, limit)
 
     async def get_barrier(
         self,
         jwt_token: str,
         login_id: int,
-    ) -> GoodResponse | BadResponse:
+        fields: str | None = None,
+        cursor: int | None = None,
+        limit: int | None = None,
+    ) -> Response | GoodResponse | BadResponse:
         """Получение списка домофонов и камер при наличии"""
         if (
             self.access_check(
@@ -97,9 +208,40 @@ class DevicesRouter(RoutsCommon):
             is False
         ):
             return self.bad_response(message="Недостаточно прав")
+        self.rt_manger.mark_active(login_id)
+
+        if fields is None and cursor is None and limit is None:
+            return self.device_list(login_id, "barrier")
+        return self.device_page(login_id, "barrier", fields, cursor, limit)
 
+    async def get_all(
+        self,
+        jwt_token: str,
+        login_id: int | None = None,
+    ) -> GoodResponse | BadResponse:
+        """
+        Камеры, домофоны и шлагбаумы одним запросом к базе
+
+        Без `login_id` возвращаются устройства всех логинов пользователя
+        """
         with self.db_helper.sessionmanager() as session:
-            login_model = session.query(self.models.Login).get(login_id)
-            return self.good_response(data={"barrier": login_model.barrier})
+            rows = session.execute(all_devices_query(jwt_token, login_id)).all()
+
+        # Пустой результат: чужой логин или неизвестный токен (пользователь без логинов
+        # получает пустой список)
+        if not rows and (login_id is not None or self.get_user_id(jwt_token) is None):
+            return self.bad_response(message="Недостаточно прав")
 
-        return self.bad_response()
+        logins = []
+        for row in rows:
+            self.rt_manger.mark_active(row.id)
+            logins.append(
+                {
+                    "login_id": row.id,
+                    "login": row.login,
+                    "cameras": row.cameras,
+                    "intercom": row.intercom,
+                    "barrier": row.barrier,
+                }
+            )
+        return self.good_response(data={"logins": logins})
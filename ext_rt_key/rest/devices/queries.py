@@ -0,0 +1,178 @@
+"""
+:mod:`queries` -- Списки устройств, собираемые в JSON на стороне базы
+===================================
+.. moduleauthor:: ilya Barinov <i-barinov@it-serv.ru>
+"""
+
+from collections.abc import Sequence
+from enum import Enum
+from itertools import chain
+from typing import Any
+
+from sqlalchemy import case, ColumnElement, func, literal, literal_column, null, Select, select
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.orm import aliased
+
+from ext_rt_key.models import db as models
+
+__all__ = (
+    "LIST_FIELDS",
+    "all_devices_query",
+    "device_page_query",
+    "page_items",
+)
+
+# Поля JSON совпадают с `Cameras.to_json` и `Devices.to_json`
+CAMERA_FIELDS = (
+    "id",
+    "rt_id",
+    "archive_length",
+    "screenshot_url_template",
+    "screenshot_token",
+    "streamer_token",
+)
+DEVICE_FIELDS = (
+    "id",
+    "rt_id",
+    "device_type",
+    "login_id",
+    "camera_id",
+    "description",
+    "is_favorite",
+    "name_by_user",
+)
+
+# Поля, которые можно запросить в `fields=` по виду списка (camera - камера устройства)
+LIST_FIELDS = {
+    "cameras": CAMERA_FIELDS,
+    "intercom": (*DEVICE_FIELDS, "camera"),
+    "barrier": (*DEVICE_FIELDS, "camera"),
+}
+# Метка колонки с id строки, по которой строится курсор следующей страницы
+CURSOR_COLUMN = "cursor_id"
+
+EMPTY_LIST: ColumnElement[Any] = literal_column("'[]'::json")
+
+
+def _json_object(model: Any, fields: tuple[str, ...], **extra: Any) -> ColumnElement[Any]:
+    """json_build_object из колонок модели"""
+    pairs = [*((name, getattr(model, name)) for name in fields), *extra.items()]
+    return func.json_build_object(
+        *chain.from_iterable((literal(name), value) for name, value in pairs)
+    )
+
+
+def _cameras_list() -> ColumnElement[Any]:
+    """Камеры логина из внешнего запроса"""
+    cameras = models.Cameras
+    camera_json = _json_object(cameras, CAMERA_FIELDS)
+    return func.coalesce(
+        select(func.json_agg(aggregate_order_by(camera_json, cameras.id)))
+        .where(cameras.login_id == models.Login.id)
+        .scalar_subquery(),
+        EMPTY_LIST,
+    )
+
+
+def _camera_json(camera: Any) -> ColumnElement[Any]:
+    """Камера устройства в JSON (null, если камеры нет)"""
+    return case(
+        (camera.id.is_(None), null()),
+        else_=_json_object(camera, CAMERA_FIELDS),
+    )
+
+
+def _devices_list(device_type: models.DeviceType) -> ColumnElement[Any]:
+    """Устройства логина из внешнего запроса с привязанными камерами"""
+    devices = models.Devices
+    camera = aliased(models.Cameras)
+    device_json = _json_object(devices, DEVICE_FIELDS, camera=_camera_json(camera))
+    return func.coalesce(
+        select(func.json_agg(aggregate_order_by(device_json, devices.id)))
+        .select_from(devices)
+        .outerjoin(camera, camera.rt_id == devices.camera_id)
+        .where(
+            devices.login_id == models.Login.id,
+            devices.device_type == device_type,
+        )
+        .scalar_subquery(),
+        EMPTY_LIST,
+    )
+
+
+def all_devices_query(jwt_token: str, login_id: int | None = None) -> Select[Any]:
+    """
+    Камеры, домофоны и шлагбаумы логинов пользователя одним запросом
+
+    Проверка доступа входит в запрос: выбираются только логины пользователя с этим токеном
+
+    :param jwt_token: Токен пользователя
+    :param login_id: Id логина (по умолчанию все логины пользователя)
+    :return: Строки (id, login, cameras, intercom, barrier)
+    """
+    login = models.Login
+    stmt = (
+        select(
+            login.id,
+            login.login,
+            _cameras_list().label("cameras"),
+            _devices_list(models.DeviceType.intercom).label("intercom"),
+            _devices_list(models.DeviceType.barrier).label("barrier"),
+        )
+        .join(models.User, models.User.id == login.user_id)
+        .where(models.User.jwt_token == jwt_token)
+        .order_by(login.id)
+    )
+    if login_id is not None:
+        stmt = stmt.where(login.id == login_id)
+    return stmt
+
+
+def device_page_query(
+    kind: str,
+    login_id: int,
+    fields: tuple[str, ...],
+    cursor: int | None = None,
+    limit: int | None = None,
+) -> Select[Any]:
+    """
+    Страница списка устройств логина: только запрошенные колонки, по возрастанию id
+
+    :param kind: Вид списка (cameras, intercom, barrier)
+    :param login_id: Id логина
+    :param fields: Поля из `LIST_FIELDS[kind]`
+    :param cursor: Id последней строки предыдущей страницы
+    :param limit: Размер страницы (выбирается на одну строку больше, чтобы узнать,
+        есть ли следующая страница)
+    :return: Строки с колонками `fields` и `CURSOR_COLUMN`
+    """
+    model: Any = models.Cameras if kind == "cameras" else models.Devices
+    stmt = select(
+        model.id.label(CURSOR_COLUMN),
+        *(getattr(model, field).label(field) for field in fields if field != "camera"),
+    ).where(model.login_id == login_id)
+
+    if kind != "cameras":
+        stmt = stmt.where(model.device_type == models.DeviceType(kind))
+    if "camera" in fields:
+        camera = aliased(models.Cameras)
+        stmt = stmt.add_columns(_camera_json(camera).label("camera")).outerjoin(
+            camera, camera.rt_id == model.camera_id
+        )
+    if cursor is not None:
+        stmt = stmt.where(model.id > cursor)
+
+    stmt = stmt.order_by(model.id)
+    if limit is not None:
+        stmt = stmt.limit(limit + 1)
+    return stmt
+
+
+def page_items(rows: Sequence[Any], fields: tuple[str, ...]) -> list[dict[str, Any]]:
+    """Строки :func:`device_page_query` в виде словарей с полями в запрошенном порядке"""
+
+    def plain(value: Any) -> Any:
+        # device_type приходит как DeviceType
+        return value.value if isinstance(value, Enum) else value
+
+    return [{field: plain(row._mapping[field]) for field in fields} for row in rows]
@@ -0,0 +1,124 @@
+"""
+:mod:`snapshots` -- Готовые ответы со списками устройств логина
+===================================
+.. moduleauthor:: ilya Barinov <i-barinov@it-serv.ru>
+"""
+
+import datetime
+from collections.abc import Iterable
+from typing import Any
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from ext_rt_key.models import db as models
+from ext_rt_key.models.request import GoodResponse
+from ext_rt_key.utils import json_codec
+from ext_rt_key.utils.db_helper import DBHelper
+
+__all__ = (
+    "DEVICE_LISTS",
+    "DeviceSnapshots",
+    "render_response",
+)
+
+# Вид списка устройств -> свойство `Login`, из которого он строится
+DEVICE_LISTS = {
+    "cameras": "all_cameras",
+    "intercom": "intercom",
+    "barrier": "barrier",
+}
+
+
+def render_response(kind: str, items: list[dict[str, Any]]) -> bytes:
+    """
+    Тело ответа маршрута `/devices/get_<kind>` в JSON
+
+    Совпадает с тем, что маршрут отдал бы для ``good_response(data={kind: items})``
+    """
+    return json_codec.dumps(GoodResponse(message="Успешно", data={kind: items}).model_dump())
+
+
+class DeviceSnapshots:
+    """
+    Ответы со списками устройств, сохраненные в таблицу `device_snapshots`
+
+    Синхронизация после записи устройств собирает ответы логина один раз, маршруты чтения
+    отдают сохраненные байты без загрузки моделей и повторной сериализации. Если ответа
+    нет (логин еще не синхронизировался или массовая синхронизация еще не собрала ответы),
+    маршрут собирает его из базы, но не сохраняет: в базу ответы пишет только синхронизация
+    """
+
+    def __init__(self, db_helper: DBHelper) -> None:
+        """:param db_helper: Подключение к базе"""
+        self.db_helper = db_helper
+
+    @staticmethod
+    def build(
+        session: Session,
+        login_id: int,
+        kinds: Iterable[str] = DEVICE_LISTS,
+    ) -> dict[str, bytes]:
+        """
+        Сборка ответов логина по данным из базы
+
+        :param session: Сессия
+        :param login_id: Id логина
+        :param kinds: Виды списков (по умолчанию все)
+        :return: Тело ответа по виду списка (пусто, если логина нет)
+        """
+        login = session.get(models.Login, login_id, options=models.LOGIN_DEVICES_LOADING)
+        if login is None:
+            return {}
+
+        return {kind: render_response(kind, getattr(login, DEVICE_LISTS[kind])) for kind in kinds}
+
+    def materialize(self, login_id: int) -> dict[str, bytes]:
+        """
+        Сборка и сохранение ответов логина
+
+        :param login_id: Id логина
+        :return: Тело ответа по виду списка
+        """
+        snapshots = models.DeviceSnapshot
+        with self.db_helper.sessionmanager() as session:
+            payloads = self.build(session, login_id)
+            if payloads:
+                stmt = insert(snapshots).values(
+                    [
+                        {"login_id": login_id, "kind": kind, "payload": payload}
+                        for kind, payload in payloads.items()
+                    ]
+                )
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[snapshots.login_id, snapshots.kind],
+                    set_={
+                        "payload": stmt.excluded.payload,
+                        "updated_at": datetime.datetime.now(datetime.UTC),
+                    },
+                )
+                session.execute(stmt)
+
+        return payloads
+
+    def get(self, login_id: int, kind: str) -> bytes | None:
+        """
+        Сохраненный ответ логина, при отсутствии - собранный заново (без сохранения)
+
+        :param login_id: Id логина
+        :param kind: Вид списка (cameras, intercom, barrier)
+        :return: Тело ответа, None если логина нет
+        """
+        snapshots = models.DeviceSnapshot
+        with self.db_helper.sessionmanager() as session:
+            payload = session.execute(
+                select(snapshots.payload).where(
+                    snapshots.login_id == login_id,
+                    snapshots.kind == kind,
+                )
+            ).scalar_one_or_none()
+            if payload is None:
+                return self.build(session, login_id, (kind,)).get(kind)
+
+        return bytes(payload)
@@ -4,17 +4,31 @@
 .. moduleauthor:: ilya Barinov <i-barinov@it-serv.ru>
 """
 
+import asyncio
+import hashlib
+import json
+import math
 import uuid
+from collections.abc import AsyncGenerator, Callable, Iterator
 from dataclasses import dataclass
 from http import HTTPStatus
+from itertools import islice
 from logging import getLogger, Logger
-from typing import Any
+from time import monotonic
+from typing import Any, cast
 
-import requests
-from sqlalchemy import and_
+from sqlalchemy import and_, Boolean, CursorResult, delete, exists, literal_column, or_, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
 
 from ext_rt_key.models import db as models
 from ext_rt_key.models.request import BadResponse, GoodResponse
+from ext_rt_key.rest.devices.cache import DevicesReadCache
+from ext_rt_key.rest.devices.snapshots import DeviceSnapshots
+from ext_rt_key.rest.upstream.cache import TTLCache
+from ext_rt_key.rest.upstream.client import UpstreamClient
+from ext_rt_key.rest.upstream.errors import UpstreamStatusError
+from ext_rt_key.rest.upstream.rate_limit import AuthRateLimiter
 from ext_rt_key.utils.db_helper import DBHelper
 
 # region AUTH
@@ -24,15 +38,76 @@ URL_OPEN = "https://household.key.rt.ru/api/v2/app/devices/30359/open"
 # endregion
 
 # region DEVISES
-URL_GET_ALL_CAMERAS = "https://vc.key.rt.ru/api/v1/cameras?limit=100&offset=0"
+URL_GET_ALL_CAMERAS = "https://vc.key.rt.ru/api/v1/cameras"
 URL_GET_INTERCOM = "https://household.key.rt.ru/api/v2/app/devices/intercom"
 URL_GET_BARRIER = "https://household.key.rt.ru/api/v2/app/devices/barrier"
 URL_OPEN_DEVICE = "https://household.key.rt.ru/api/v2/app/devices/{}/open"
 # endregion
 
+# region METRICS
+# Метки эндпоинтов Rt в метриках upstream запросов
+ENDPOINT_GET_CODE = "send_code"
+ENDPOINT_LOGIN = "login"
+ENDPOINT_OPEN = "open"
+ENDPOINT_CAMERAS = "cameras"
+ENDPOINT_DEVICES = {
+    URL_GET_INTERCOM: "intercom",
+    URL_GET_BARRIER: "barrier",
+}
+# endregion
+
+TOKEN_INVALID_MESSAGE = "Токен устарел, необходимо пройти авторизацию заново"
+
+# region PAGINATION
+# Размер страницы списка камер
+CAMERAS_PAGE_SIZE = 100
+# Сколько страниц камер запрашивается одновременно
+CAMERAS_PAGES_CONCURRENCY = 4
+# Списки камер длиннее этого значения не кэшируются: кэш живет между запросами, и большие списки
+# занимали бы память до истечения TTL (на время одной синхронизации список собирается целиком)
+CAMERAS_CACHE_MAX_ITEMS = 1000
+# endregion
+
+# region UPSERT
+# Колонки камеры, которые обновляются данными Rt (login_id остается за первым владельцем)
+CAMERA_UPDATE_COLUMNS = (
+    "archive_length",
+    "screenshot_url_template",
+    "screenshot_token",
+    "streamer_token",
+)
+# Колонки устройства из ответа Rt: по ним считается хэш строки, и все они перезаписываются,
+# когда хэш изменился (is_favorite только повышается, см. `RTHelper._save_devices`)
+DEVICE_HASH_COLUMNS = (
+    "device_type",
+    "camera_id",
+    "description",
+    "is_favorite",
+    "name_by_user",
+)
+# endregion
+
 
 __all__ = ("RTHelper",)
 
+# Камеры, домофоны и шлагбаумы из Rt (None - список получить не удалось)
+DeviceLists = tuple[
+    list[dict[str, Any]] | None,
+    list[dict[str, Any]] | None,
+    list[dict[str, Any]] | None,
+]
+
+
+def content_hash(values: Any) -> str:
+    """Хэш данных Rt, не зависящий от порядка ключей"""
+    raw = json.dumps(values, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+
+def rows_fingerprint(rows: dict[str, dict[str, Any]]) -> str:
+    """Отпечаток списка строк по их хэшам, не зависящий от порядка строк в ответе Rt"""
+    return content_hash(sorted((rt_id, row["content_hash"]) for rt_id, row in rows.items()))
+
 
 @dataclass
 class AuthSession:
@@ -95,6 +170,12 @@ class RTHelper:
         db_helper: DBHelper,
         login: str = "79534499755",
         logger: Logger | None = None,
+        client: UpstreamClient | None = None,
+        cameras_cache: TTLCache[str, list[dict[str, Any]]] | None = None,
+        auth_limiter: AuthRateLimiter | None = None,
+        invalid_tokens: TTLCache[str, bool] | None = None,
+        read_cache: DevicesReadCache | None = None,
+        snapshots: DeviceSnapshots | None = None,
     ) -> None:
         """
         Init метод
@@ -105,9 +186,27 @@ class RTHelper:
         :type login: _type_, optional
         :param logger: _description_, defaults to None
         :type logger: _type_, optional
+        :param client: Общий асинхронный клиент к API Rt, defaults to None
+        :type client: UpstreamClient, optional
+        :param cameras_cache: Общий кэш списка камер по логинам, defaults to None
+        :type cameras_cache: TTLCache, optional
+        :param auth_limiter: Общий ограничитель запросов к авторизации Rt, defaults to None
+        :type auth_limiter: AuthRateLimiter, optional
+        :param invalid_tokens: Общий кэш токенов, которые Rt отклонил (401), defaults to None
+        :type invalid_tokens: TTLCache, optional
+        :param read_cache: Общий кэш списков устройств для маршрутов чтения, defaults to None
+        :type read_cache: DevicesReadCache, optional
+        :param snapshots: Готовые ответы со списками устройств, defaults to None
+        :type snapshots: DeviceSnapshots, optional
         """
         self.login = login
         self.logger = logger or getLogger(__name__)
+        self.client = client or UpstreamClient(logger=self.logger)
+        self.cameras_cache = cameras_cache if cameras_cache is not None else TTLCache()
+        self.auth_limiter = auth_limiter or AuthRateLimiter()
+        self.invalid_tokens = invalid_tokens if invalid_tokens is not None else TTLCache()
+        self.read_cache = read_cache or DevicesReadCache()
+        self.snapshots = snapshots or DeviceSnapshots(db_helper)
         self.auth_manager = AuthManager(db_helper)
         self.db_helper = db_helper
         self.models = models
@@ -122,30 +221,38 @@ class RTHelper:
     ) -> None:
         """Инициализация менеджера авторизации при инициализации класса"""
         with db_helper.sessionmanager() as session:
-            login_model = (
-                session.query(self.models.Login).filter(self.models.Login.login == login).first()
+            token = (
+                session.query(self.models.Login.token)
+                .filter(self.models.Login.login == login)
+                .scalar()
             )
-            if not login_model:
+            if not token:
                 return None
-            auth_manager.authorization_token = login_model.token
+            auth_manager.authorization_token = token
 
     async def request_token(self, code: str) -> GoodResponse | BadResponse:
         """Получение токена авторизации"""
         self.logger.debug(f"Запрос токена для {self.login}")
 
+        if rate_limited := self._auth_rate_limited():
+            return rate_limited
+
         payload = {
             "code": code,
             "codeId": self.auth_manager.session.code_id,
         }
 
-        response = requests.post(
-            URL_LOGIN, json=payload, headers=self.auth_manager.headers_process_auth
+        response = await self.client.post(
+            URL_LOGIN,
+            json=payload,
+            headers=self.auth_manager.headers_process_auth,
+            endpoint=ENDPOINT_LOGIN,
         )
 
         response_data = response.json()
 
         if response.status_code == HTTPStatus.OK:
-            token_auth = response.json().get("data", {}).get("accessToken")
+            token_auth = response_data.get("data", {}).get("accessToken")
             if token_auth:
                 with self.db_helper.sessionmanager() as session:
                     user = (
@@ -156,6 +263,15 @@ class RTHelper:
                     )
 
                     if user:
+                        # Новый токен Rt снимает отметку о необходимости авторизации
+                        session.query(self.models.Login).filter(
+                            self.models.Login.login == self.login
+                        ).update(
+                            {
+                                self.models.Login.token: token_auth,
+                                self.models.Login.needs_reauth: False,
+                            }
+                        )
                         jwt = user.create_token(session=session)
                     else:
                         # TODO: Не срочно сделать так чоб время жизни токена rt сохранялось
@@ -173,6 +289,10 @@ class RTHelper:
                         session.add(new_login)
                         session.commit()
 
+                # Кэш камер собран со старым токеном
+                self.auth_manager.authorization_token = token_auth
+                self.invalidate_cameras()
+
                 return GoodResponse(
                     message="Токен получен успешно",
                     data={"token": jwt},
@@ -188,20 +308,26 @@ class RTHelper:
         """Запрос кода авторизации"""
         self.logger.info(f"Начало авторизации для {self.login}")
 
+        if rate_limited := self._auth_rate_limited():
+            return rate_limited
+
         payload: dict[str, Any] = {"phoneNumber": self.login}
 
         if captcha_id and captcha_code:
             payload["captchaAnswer"] = {"id": captcha_id, "code": captcha_code}
 
-        init_auth_session = requests.post(
+        init_auth_session = await self.client.post(
             URL_GET_CODE,
             headers=self.auth_manager.headers_process_auth,
             json=payload,
+            endpoint=ENDPOINT_GET_CODE,
         )
+        response_data = init_auth_session.json()
 
         if init_auth_session.status_code == HTTPStatus.OK:
-            self.auth_manager.code_id = init_auth_session.json().get("data", {}).get("codeId")
+            self.auth_manager.code_id = response_data.get("data", {}).get("codeId")
             if self.auth_manager.code_id:
+                self.auth_limiter.on_success(self.login)
                 # -> "{data: {codeId: 8tDNvd7m03sKgHvY6XMGJ7HRPn5cRRFMYmmuSTmeH2NTk8SeVSfLhpcWJ2jLUVrHyEmQQN2sVfwOqsfstGy828wO2B4nJbMMd4nh,timeout: 180}}"  # noqa
                 return GoodResponse(message="На ваше устройство отправлен код")
 
@@ -218,7 +344,6 @@ class RTHelper:
             #         }
             #     }
             # }
-            response_data = init_auth_session.json()
             if response_data.get("error", {}).get("captchaAnswer"):
                 captcha_data = (
                     response_data.get("error", {}).get("captchaAnswer", {}).get("captcha")
@@ -227,124 +352,603 @@ class RTHelper:
 
             # -> {"error": {"sso": {"intervalExceeded": {}}}}
             if response_data.get("error", {}).get("sso"):
-                return BadResponse(message="Слишком много запросов, немного подождите")
+                retry_after = self.auth_limiter.on_interval_exceeded(self.login)
+                return BadResponse(
+                    message="Слишком много запросов, немного подождите",
+                    data={"retry_after": math.ceil(retry_after)},
+                )
         return BadResponse(message=response_data.get("message"))
 
-    async def load_devices(self) -> GoodResponse | BadResponse:
-        """Загрузка всех устройств"""
-        status_dict: dict[str, bool] = {}
-        status_dict["CAMERAS"] = isinstance(await self._download_cameras(), GoodResponse)
-        status_dict["INTERCOM"] = isinstance(
-            await self._download_devices(URL_GET_INTERCOM), GoodResponse
-        )
-        status_dict["BARRIER"] = isinstance(
-            await self._download_devices(URL_GET_BARRIER), GoodResponse
+    def _auth_rate_limited(self) -> BadResponse | None:
+        """Отказ без обращения к Rt, если лимит запросов к авторизации исчерпан"""
+        retry_after = self.auth_limiter.acquire(self.login)
+        if retry_after <= 0:
+            return None
+
+        self.logger.info(f"Запрос авторизации для {self.login} отклонен локально")
+        return BadResponse(
+            message="Слишком много запросов, немного подождите",
+            data={"retry_after": math.ceil(retry_after)},
         )
 
+    async def load_devices(
+        self,
+        progress: Callable[[str], None] | None = None,
+    ) -> GoodResponse | BadResponse:
+        """
+        Загрузка всех устройств
+
+        Списки камер, домофонов и шлагбаумов запрашиваются из Rt одновременно, камеры -
+        один раз. Затем данные сохраняются с учетом зависимостей: сначала камеры, потом
+        устройства (устройство ссылается на камеру по `camera_id`). Если список камер не получен,
+        устройства не сохраняются, причина возвращается в `DEVICES_NOT_SAVED`
+
+        :param progress: Вызывается с названием этапа (fetch, save_cameras, save_devices,
+            snapshots) в начале каждого этапа
+        :return: Статусы списков, количество изменений и время каждого этапа (сек.)
+        """
+        if token_rejected := self._token_rejected():
+            return token_rejected
+
+        def phase(name: str) -> float:
+            if progress is not None:
+                progress(name)
+            return monotonic()
+
+        timings: dict[str, float] = {}
+        started = phase("fetch")
+        try:
+            cameras, intercom, barrier = await self.fetch_device_lists()
+        except UpstreamStatusError:
+            return BadResponse(message=TOKEN_INVALID_MESSAGE)
+        timings["fetch"] = monotonic() - started
+
+        status_dict: dict[str, Any] = {
+            "CAMERAS": cameras is not None,
+            "INTERCOM": intercom is not None,
+            "BARRIER": barrier is not None,
+        }
+
+        # Готовые ответы собираются после записи списков, а также если их нет (массовая
+        # синхронизация не смогла их собрать)
+        (
+            login_id,
+            cameras_fingerprint,
+            devices_fingerprint,
+            build_snapshots,
+        ) = await asyncio.to_thread(self._sync_state)
+        # Списки, которые совпали с сохраненными и не записывались
+        skipped: list[str] = []
+
+        started = phase("save_cameras")
+        if cameras is not None:
+            camera_rows = self.camera_rows(cameras, login_id)
+            camera_fingerprint = rows_fingerprint(camera_rows)
+            if camera_fingerprint == cameras_fingerprint:
+                skipped.append("cameras")
+            else:
+                status_dict["CAMERAS_DELETED"] = await asyncio.to_thread(
+                    self._save_cameras, camera_rows, login_id, camera_fingerprint
+                )
+                build_snapshots = True
+        timings["save_cameras"] = monotonic() - started
+
+        started = phase("save_devices")
+        if reason := self._devices_not_saved(cameras, intercom, barrier):
+            status_dict["DEVICES_NOT_SAVED"] = reason
+        else:
+            status_dict["COUNTS"], saved = await self._sync_devices(
+                [*(intercom or []), *(barrier or [])],
+                login_id,
+                # Камеры удалились вместе с устройствами, список устройств записывается заново
+                None if status_dict.get("CAMERAS_DELETED") else devices_fingerprint,
+                complete=intercom is not None and barrier is not None,
+            )
+            if saved:
+                build_snapshots = True
+            else:
+                skipped.append("devices")
+        timings["save_devices"] = monotonic() - started
+
+        if build_snapshots:
+            started = phase("snapshots")
+            await asyncio.to_thread(self.snapshots.materialize, login_id)
+            # Версия увеличивается после сборки, чтобы кэш не запомнил старые ответы
+            self.read_cache.invalidate(login_id)
+            timings["snapshots"] = monotonic() - started
+
+        status_dict["SKIPPED"] = skipped
+        status_dict["TIMINGS"] = {phase: round(value, 4) for phase, value in timings.items()}
         return GoodResponse(
             message="Данные успешно обновлены",
             data=status_dict,
         )
 
-    @property
-    def login_id(self) -> int:
-        """Получение login id"""
+    async def fetch_device_lists(self) -> DeviceLists:
+        """
+        Списки камер, домофонов и шлагбаумов из Rt (запрашиваются одновременно)
+
+        :raises UpstreamStatusError: Rt отклонил токен (401)
+        :raises UpstreamError: Ошибка соединения с Rt
+        :return: Камеры, домофоны и шлагбаумы, None вместо списка, который Rt не отдал
+        """
+        results = await asyncio.gather(
+            self._fetch_all_cameras(),
+            self._fetch_devices(URL_GET_INTERCOM),
+            self._fetch_devices(URL_GET_BARRIER),
+            return_exceptions=True,
+        )
+
+        for result in results:
+            if isinstance(result, BaseException) and not isinstance(result, UpstreamStatusError):
+                raise result
+        for result in results:
+            if (
+                isinstance(result, UpstreamStatusError)
+                and result.status_code == HTTPStatus.UNAUTHORIZED
+            ):
+                raise result
+
+        cameras, intercom, barrier = (
+            None if isinstance(result, BaseException) else result for result in results
+        )
+        return cameras, intercom, barrier
+
+    def _token_rejected(self) -> BadResponse | None:
+        """Отказ без обращения к Rt, если Rt недавно уже отклонил текущий токен"""
+        token = self.auth_manager.authorization_token
+        if token is not None and self.invalid_tokens.get(token):
+            return BadResponse(message=TOKEN_INVALID_MESSAGE)
+        return None
+
+    async def _on_token_invalid(self) -> BadResponse:
+        """
+        Rt ответил 401 (token_invalid)
+
+        Токен запоминается как недействительный, а логин помечается как требующий повторной
+        авторизации, чтобы следующие запросы не уходили в Rt. Одновременные 401 (например,
+        страницы списка камер) записывают отметку в базу один раз на токен
+        """
+        token = self.auth_manager.authorization_token
+        if token is not None:
+            if self.invalid_tokens.get(token):
+                return BadResponse(message=TOKEN_INVALID_MESSAGE)
+            self.invalid_tokens.set(token, True)
+
+        self.logger.warning(f"Rt отклонил токен {self.login}, требуется повторная авторизация")
+        self.invalidate_cameras()
+        await asyncio.to_thread(self._mark_needs_reauth)
+
+        return BadResponse(message=TOKEN_INVALID_MESSAGE)
+
+    def _mark_needs_reauth(self) -> None:
+        """Отметка логина как требующего повторной авторизации"""
         with self.db_helper.sessionmanager() as session:
-            login: models.Login | None = (
-                session.query(self.models.Login)
+            session.query(self.models.Login).filter(self.models.Login.login == self.login).update(
+                {self.models.Login.needs_reauth: True}
+            )
+
+    def _sync_state(self) -> tuple[int, str | None, str | None, bool]:
+        """
+        Id логина, отпечатки последних сохраненных списков камер и устройств и признак того,
+        что у логина нет готовых ответов
+        """
+        with self.db_helper.sessionmanager() as session:
+            login_id, cameras_fingerprint, devices_fingerprint, snapshots_missing = (
+                session.query(
+                    self.models.Login.id,
+                    self.models.Login.cameras_fingerprint,
+                    self.models.Login.devices_fingerprint,
+                    ~exists().where(self.models.DeviceSnapshot.login_id == self.models.Login.id),
+                )
                 .filter(self.models.Login.login == self.login)
-                .first()
+                .one()
             )
-            return login.id  # type: ignore
+            return login_id, cameras_fingerprint, devices_fingerprint, snapshots_missing
+
+    async def fetch_cameras(self) -> list[dict[str, Any]] | None:
+        """
+        Список камер логина из Rt
+
+        Запрос тяжелый, поэтому ответ кэшируется на логин и переиспользуется и выгрузкой
+        устройств, и видео трансляцией
+
+        :return: Список камер, None если Rt ответил ошибкой
+        """
+        try:
+            return await self._fetch_all_cameras()
+        except UpstreamStatusError:
+            return None
+
+    async def _fetch_all_cameras(self) -> list[dict[str, Any]]:
+        """
+        Все страницы списка камер одним списком
+
+        Страницы не сохраняются по мере получения: отпечаток списка, по которому пропускается
+        запись, и удаление пропавших камер требуют полного списка, а камеры и их удаление
+        записываются одной транзакцией. Поэтому на время синхронизации весь список камер логина
+        находится в памяти
+
+        :raises UpstreamStatusError: Rt ответил ошибкой
+        """
+        return [camera async for page in self.iter_camera_pages() for camera in page]
+
+    async def _fetch_cameras_page(self, offset: int) -> tuple[list[dict[str, Any]], int | None]:
+        """
+        Одна страница списка камер
 
-    async def _download_cameras(self) -> GoodResponse | BadResponse:
-        """Выгрузка в базу всех камер"""
-        response = requests.get(
+        :param offset: Смещение от начала списка
+        :raises UpstreamStatusError: Rt ответил ошибкой
+        :return: Камеры страницы и общее количество камер (если Rt его вернул)
+        """
+        response = await self.client.get(
             URL_GET_ALL_CAMERAS,
             headers=self.auth_manager.headers_auth,
+            params={"limit": CAMERAS_PAGE_SIZE, "offset": offset},
+            endpoint=ENDPOINT_CAMERAS,
         )
-        if response.status_code == HTTPStatus.OK:
-            response_data = response.json().get("data").get("items")
-
-            with self.db_helper.sessionmanager() as session:
-                for camera in response_data:
-                    id_ = camera.get("id", {})
-                    camera_model = (
-                        session.query(self.models.Cameras)
-                        .filter(self.models.Cameras.rt_id == id_)
-                        .first()
-                    )
+        if response.status_code == HTTPStatus.UNAUTHORIZED:
+            await self._on_token_invalid()
+        if response.status_code != HTTPStatus.OK:
+            raise UpstreamStatusError(response.url, response.status_code)
 
-                    if camera_model:
-                        camera_model.archive_length = camera.get("archive_length")
-                        camera_model.screenshot_url_template = camera.get("screenshot_url_template")
-                        camera_model.screenshot_token = camera.get("screenshot_token")
-                        camera_model.streamer_token = camera.get("streamer_token", {})
+        data = response.json().get("data", {})
+        return data.get("items", []), data.get("total")
 
-                    else:
-                        new_camera = self.models.Cameras(
-                            archive_length=camera.get("archive_length"),
-                            rt_id=id_,
-                            screenshot_url_template=camera.get("screenshot_url_template"),
-                            screenshot_token=camera.get("screenshot_token"),
-                            streamer_token=camera.get("streamer_token", {}),
-                            login_id=self.login_id,
-                        )
-                        session.add(new_camera)
-                session.commit()
+    async def iter_camera_pages(self) -> AsyncGenerator[list[dict[str, Any]]]:
+        """
+        Постраничная выгрузка камер из Rt
 
-            return GoodResponse(message="Данные камер успешно обновлены")
+        Первая страница сообщает общее количество камер, после чего остальные страницы
+        запрашиваются параллельно (не больше `CAMERAS_PAGES_CONCURRENCY` одновременно) и отдаются
+        по мере получения. Если Rt не вернул общее количество - страницы запрашиваются
+        последовательно до первой неполной
 
-        return BadResponse(message="")
+        :raises UpstreamStatusError: Rt ответил ошибкой
+        """
+        cached = self.cameras_cache.get(self.login)
+        if cached is not None:
+            yield cached
+            return
+
+        if self._token_rejected():
+            raise UpstreamStatusError(URL_GET_ALL_CAMERAS, HTTPStatus.UNAUTHORIZED)
+
+        items, total = await self._fetch_cameras_page(0)
+        # Полный список собирается для кэша, пока не превышен лимит
+        collected: list[dict[str, Any]] | None = list(items)
+        yield items
+
+        async for page in self._iter_next_camera_pages(items, total):
+            if collected is not None:
+                collected.extend(page)
+                if len(collected) > CAMERAS_CACHE_MAX_ITEMS:
+                    collected = None
+            yield page
+
+        if collected is not None:
+            self.cameras_cache.set(self.login, collected)
+
+    async def _iter_next_camera_pages(
+        self,
+        first_page: list[dict[str, Any]],
+        total: int | None,
+    ) -> AsyncGenerator[list[dict[str, Any]]]:
+        """Страницы камер после первой"""
+        if total is None:
+            offset, items = CAMERAS_PAGE_SIZE, first_page
+            while len(items) >= CAMERAS_PAGE_SIZE:
+                items, _ = await self._fetch_cameras_page(offset)
+                offset += CAMERAS_PAGE_SIZE
+                if items:
+                    yield items
+            return
+
+        offsets = iter(range(CAMERAS_PAGE_SIZE, total, CAMERAS_PAGE_SIZE))
+        pending: set[asyncio.Task[tuple[list[dict[str, Any]], int | None]]] = set()
+
+        def schedule(offsets: Iterator[int]) -> None:
+            for offset in islice(offsets, CAMERAS_PAGES_CONCURRENCY - len(pending)):
+                pending.add(asyncio.ensure_future(self._fetch_cameras_page(offset)))
+
+        schedule(offsets)
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                pending.difference_update(done)
+                for task in done:
+                    items, _ = task.result()
+                    yield items
+                schedule(offsets)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def invalidate_cameras(self) -> None:
+        """Сброс кэша камер логина"""
+        self.cameras_cache.invalidate(self.login)
+
+    @staticmethod
+    def camera_rows(
+        response_data: list[dict[str, Any]],
+        login_id: int,
+    ) -> dict[str, dict[str, Any]]:
+        """
+        Строки таблицы камер из ответа Rt с хэшем данных каждой камеры
 
-    async def _download_devices(
+        Повтор rt_id в одном INSERT ... ON CONFLICT недопустим, остается последний
+        """
+        rows: dict[str, dict[str, Any]] = {}
+        for camera in response_data:
+            if not camera.get("id"):
+                continue
+            values = {column: camera.get(column) for column in CAMERA_UPDATE_COLUMNS}
+            rows[camera["id"]] = {
+                "rt_id": camera["id"],
+                "login_id": login_id,
+                **values,
+                "content_hash": content_hash(values),
+            }
+        return rows
+
+    def _save_cameras(
         self,
-        target_url: str,
-    ) -> GoodResponse | BadResponse:
-        """Выгрузка домофонов"""
-        await self._download_cameras()
-        response = requests.get(target_url, headers=self.auth_manager.headers_auth)
-        if response.status_code == HTTPStatus.OK:
-            intercoms = response.json().get("data", {}).get("devices", [])
-            with self.db_helper.sessionmanager() as session:
-                for intercom in intercoms:
-                    intercom_model = (
-                        session.query(self.models.Devices)
-                        .filter(
-                            and_(
-                                self.models.Devices.rt_id == intercom.get("id"),
-                                self.models.Devices.login_id == self.login_id,
-                            )
-                        )
-                        .first()
+        rows: dict[str, dict[str, Any]],
+        login_id: int,
+        fingerprint: str | None = None,
+    ) -> int:
+        """
+        Сохранение камер в базу одним запросом INSERT ... ON CONFLICT (rt_id) DO UPDATE
+
+        Перезаписываются только строки, хэш которых отличается от сохраненного.
+        Если передан отпечаток (список полный), камеры логина, которых нет в списке, удаляются
+        вместе с устройствами, которые на них ссылаются. Устройства могут принадлежать и другим
+        логинам (камера закреплена за первым владельцем): у таких логинов сбрасываются оба
+        отпечатка и готовые ответы, чтобы следующая синхронизация заново сохранила и камеру,
+        и устройства
+
+        :param rows: Строки из :meth:`camera_rows`
+        :param login_id: Логин, за которым закрепляются новые камеры
+        :param fingerprint: Отпечаток полного списка, сохраняется в той же транзакции
+        :return: Количество удаленных камер
+        """
+        cameras = self.models.Cameras
+        deleted = 0
+        others: set[int] = set()
+        with self.db_helper.sessionmanager() as session:
+            if rows:
+                stmt = insert(cameras).values(list(rows.values()))
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[cameras.rt_id],
+                    set_={
+                        column: stmt.excluded[column]
+                        for column in (*CAMERA_UPDATE_COLUMNS, "content_hash")
+                    },
+                    where=cameras.content_hash.is_distinct_from(stmt.excluded.content_hash),
+                )
+                session.execute(stmt)
+
+            if fingerprint is not None:
+                cascaded = self._cascaded_logins(session, rows, login_id)
+                deleted = self._delete_missing(session, cameras, rows, login_id)
+                values: dict[Any, str | None] = {self.models.Login.cameras_fingerprint: fingerprint}
+                if login_id in cascaded:
+                    # Вместе с камерами каскадно удалены устройства, список устройств надо
+                    # сохранить заново даже если он не изменился
+                    values[self.models.Login.devices_fingerprint] = None
+                session.query(self.models.Login).filter(self.models.Login.id == login_id).update(
+                    values
+                )
+
+                others = cascaded - {login_id}
+                if others:
+                    session.query(self.models.Login).filter(
+                        self.models.Login.id.in_(others)
+                    ).update(
+                        {
+                            self.models.Login.cameras_fingerprint: None,
+                            self.models.Login.devices_fingerprint: None,
+                        }
                     )
-                    if intercom_model:
-                        intercom_model.description = intercom.get("description")
-                        # Добавляем в избранное ток если новое пришло True а тут False
-                        if not intercom_model.is_favorite and intercom.get("is_favorite"):
-                            intercom_model.is_favorite = intercom.get("is_favorite")
-                    else:
-                        intercom_model = self.models.Devices(
-                            rt_id=intercom.get("id"),
-                            device_type=self.models.DeviceType(intercom.get("device_type")),
-                            login_id=self.login_id,
-                            camera_id=intercom.get("camera_id"),
-                            description=intercom.get("description"),
-                            is_favorite=intercom.get("is_favorite"),
-                            name_by_user=intercom.get("name_by_user"),
+                    session.execute(
+                        delete(self.models.DeviceSnapshot).where(
+                            self.models.DeviceSnapshot.login_id.in_(others)
                         )
+                    )
+
+        # Готовые ответы других логинов удалены, их кэш чтения тоже устарел
+        for other in others:
+            self.read_cache.invalidate(other)
+        return deleted
 
-                        session.add(intercom_model)
-                session.commit()
-            return GoodResponse(message="Данные домофонов успешно обновлены")
+    def _cascaded_logins(
+        self,
+        session: Session,
+        rows: dict[str, dict[str, Any]],
+        login_id: int,
+    ) -> set[int]:
+        """
+        Логины, устройства которых ссылаются на камеры логина, которых больше нет в Rt
 
-        return GoodResponse()
+        :param rows: Полный список камер из Rt
+        :return: Id логинов, чьи устройства удалятся каскадно вместе с камерами
+        """
+        cameras, devices = self.models.Cameras, self.models.Devices
+        stmt = (
+            select(devices.login_id)
+            .join(cameras, cameras.rt_id == devices.camera_id)
+            .where(cameras.login_id == login_id, cameras.rt_id.not_in(list(rows)))
+            .distinct()
+        )
+        return set(session.execute(stmt).scalars())
+
+    @staticmethod
+    def _delete_missing(
+        session: Session,
+        model: type[models.Cameras] | type[models.Devices],
+        rows: dict[str, dict[str, Any]],
+        login_id: int,
+    ) -> int:
+        """
+        Удаление строк логина, которых больше нет в Rt, одним запросом
+
+        :param model: :class:`Cameras` или :class:`Devices`
+        :param rows: Полный список строк из Rt
+        :return: Количество удаленных строк
+        """
+        stmt = delete(model).where(model.login_id == login_id, model.rt_id.not_in(list(rows)))
+        return cast(CursorResult[Any], session.execute(stmt)).rowcount
+
+    async def _fetch_devices(self, target_url: str) -> list[dict[str, Any]]:
+        """
+        Список устройств одного типа из Rt
+
+        :param target_url: `URL_GET_INTERCOM` или `URL_GET_BARRIER`
+        :raises UpstreamStatusError: Rt ответил ошибкой
+        """
+        if self._token_rejected():
+            raise UpstreamStatusError(target_url, HTTPStatus.UNAUTHORIZED)
+
+        response = await self.client.get(
+            target_url,
+            headers=self.auth_manager.headers_auth,
+            endpoint=ENDPOINT_DEVICES.get(target_url),
+        )
+        if response.status_code == HTTPStatus.UNAUTHORIZED:
+            await self._on_token_invalid()
+        if response.status_code != HTTPStatus.OK:
+            raise UpstreamStatusError(response.url, response.status_code)
+
+        return response.json().get("data", {}).get("devices", [])  # type: ignore[no-any-return]
+
+    def device_rows(
+        self,
+        response_data: list[dict[str, Any]],
+        login_id: int,
+    ) -> dict[str, dict[str, Any]]:
+        """
+        Строки таблицы устройств из ответа Rt с хэшем данных каждого устройства
+
+        Повтор rt_id в одном INSERT ... ON CONFLICT недопустим, остается последний
+        """
+        rows: dict[str, dict[str, Any]] = {}
+        for device in response_data:
+            if not device.get("id"):
+                continue
+            values = {column: device.get(column) for column in DEVICE_HASH_COLUMNS}
+            values["is_favorite"] = bool(values["is_favorite"])
+            rows[device["id"]] = {
+                "rt_id": device["id"],
+                "login_id": login_id,
+                **values,
+                "device_type": self.models.DeviceType(values["device_type"]),
+                "content_hash": content_hash(values),
+            }
+        return rows
+
+    @staticmethod
+    def _devices_not_saved(
+        cameras: list[dict[str, Any]] | None,
+        intercom: list[dict[str, Any]] | None,
+        barrier: list[dict[str, Any]] | None,
+    ) -> str | None:
+        """Почему устройства нельзя сохранить (None - можно)"""
+        if intercom is None and barrier is None:
+            return "Списки домофонов и шлагбаумов не получены"
+        if cameras is None:
+            # Устройства ссылаются на камеры, которых без свежего списка может не быть в базе
+            return "Список камер не получен"
+        return None
+
+    async def _sync_devices(
+        self,
+        devices: list[dict[str, Any]],
+        login_id: int,
+        stored_fingerprint: str | None,
+        complete: bool,
+    ) -> tuple[dict[str, int], bool]:
+        """
+        Сохранение домофонов и шлагбаумов, если они изменились
+
+        :param devices: Устройства из Rt
+        :param login_id: Логин
+        :param stored_fingerprint: Отпечаток последнего сохраненного списка
+        :param complete: Получены оба списка (только тогда отпечаток запоминается, а пропавшие
+            устройства удаляются)
+        :return: Количество изменений и были ли устройства записаны
+        """
+        rows = self.device_rows(devices, login_id)
+        fingerprint = rows_fingerprint(rows) if complete else None
+        if fingerprint is not None and fingerprint == stored_fingerprint:
+            return {"inserted": 0, "updated": 0, "unchanged": len(rows), "deleted": 0}, False
+
+        return await asyncio.to_thread(self._save_devices, rows, login_id, fingerprint), True
+
+    def _save_devices(
+        self,
+        rows: dict[str, dict[str, Any]],
+        login_id: int,
+        fingerprint: str | None = None,
+    ) -> dict[str, int]:
+        """
+        Сохранение устройств в базу одним запросом INSERT ... ON CONFLICT (rt_id) DO UPDATE
+
+        У существующих устройств логина, хэш которых изменился, перезаписываются все колонки
+        `DEVICE_HASH_COLUMNS`, кроме `is_favorite`: оно только повышается с False до True
+        (избранное, снятое в Rt, у нас сохраняется). Устройства другого логина с тем же rt_id
+        не трогаются.
+        Если передан отпечаток (список полный), устройства логина, которых нет в списке, удаляются
+
+        :param rows: Строки из :meth:`device_rows`
+        :param login_id: Логин
+        :param fingerprint: Отпечаток полного списка, сохраняется в той же транзакции
+        :return: Количество добавленных, обновленных, неизмененных и удаленных устройств
+        """
+        devices = self.models.Devices
+        result: list[bool] = []
+        deleted = 0
+        with self.db_helper.sessionmanager() as session:
+            if rows:
+                stmt = insert(devices).values(list(rows.values()))
+                upsert = stmt.on_conflict_do_update(
+                    index_elements=[devices.rt_id],
+                    set_={
+                        **{column: stmt.excluded[column] for column in DEVICE_HASH_COLUMNS},
+                        "is_favorite": or_(devices.is_favorite, stmt.excluded.is_favorite),
+                        "content_hash": stmt.excluded.content_hash,
+                    },
+                    where=and_(
+                        devices.login_id == stmt.excluded.login_id,
+                        devices.content_hash.is_distinct_from(stmt.excluded.content_hash),
+                    ),
+                ).returning(literal_column("xmax = 0", Boolean).label("inserted"))
+                # Возвращаются только вставленные (xmax = 0) и обновленные строки
+                result = list(session.execute(upsert).scalars().all())
+
+            if fingerprint is not None:
+                deleted = self._delete_missing(session, devices, rows, login_id)
+                session.query(self.models.Login).filter(self.models.Login.id == login_id).update(
+                    {self.models.Login.devices_fingerprint: fingerprint}
+                )
+
+        inserted = sum(1 for is_inserted in result if is_inserted)
+        return {
+            "inserted": inserted,
+            "updated": len(result) - inserted,
+            "unchanged": len(rows) - len(result),
+            "deleted": deleted,
+        }
 
     async def open_device(
         self,
     ) -> GoodResponse | BadResponse:
         """Открытие устройства"""
-        response = requests.post(URL_OPEN, headers=self.auth_manager.headers_auth)
+        if token_rejected := self._token_rejected():
+            return token_rejected
+
+        response = await self.client.post(
+            URL_OPEN, headers=self.auth_manager.headers_auth, endpoint=ENDPOINT_OPEN
+        )
 
         if response.status_code == HTTPStatus.OK:
             return GoodResponse(message="Успешно")
@@ -357,7 +961,5 @@ class RTHelper:
             #         "title": "Некорректный токен",
             #     }
             # }
-            # response_data = response.json()
-            # Пока так, придумать что делать в этом случае
-            return BadResponse(message="Токен устарел, мы работаем над этой проблемой")
+            return await self._on_token_invalid()
         return BadResponse()
@@ -4,9 +4,20 @@
 .. moduleauthor:: ilya Barinov <i-barinov@it-serv.ru>
 """
 
+import asyncio
+from collections.abc import Callable
 from logging import getLogger, Logger
+from time import monotonic
+from typing import Any
 
+from ext_rt_key.models.request import Response
+from ext_rt_key.rest.devices.cache import DevicesReadCache
+from ext_rt_key.rest.devices.snapshots import DeviceSnapshots
 from ext_rt_key.rest.helper import RTHelper
+from ext_rt_key.rest.sync.jobs import SyncJob, SyncJobs
+from ext_rt_key.rest.upstream.cache import TTLCache
+from ext_rt_key.rest.upstream.client import UpstreamClient
+from ext_rt_key.rest.upstream.rate_limit import AuthRateLimiter
 from ext_rt_key.utils.db_helper import DBHelper
 
 
@@ -17,13 +28,40 @@ class RTManger:
         self,
         db_helper: DBHelper,
         logger: Logger | None = None,
+        client: UpstreamClient | None = None,
+        cameras_cache: TTLCache[str, list[dict[str, Any]]] | None = None,
+        auth_limiter: AuthRateLimiter | None = None,
+        invalid_tokens: TTLCache[str, bool] | None = None,
+        sync_jobs: SyncJobs | None = None,
+        read_cache: DevicesReadCache | None = None,
+        helpers_ttl: float = 3600.0,
+        helpers_max_size: int = 10000,
     ) -> None:
         self.logger = logger or getLogger(__name__)
 
+        # Один клиент (и пул соединений) на все хелперы
+        self.client = client or UpstreamClient(logger=self.logger)
+        self.cameras_cache: TTLCache[str, list[dict[str, Any]]] = (
+            cameras_cache if cameras_cache is not None else TTLCache()
+        )
+        self.auth_limiter = auth_limiter or AuthRateLimiter()
+        self.invalid_tokens: TTLCache[str, bool] = (
+            invalid_tokens if invalid_tokens is not None else TTLCache()
+        )
+        self.sync_jobs = sync_jobs or SyncJobs(logger=self.logger)
+        # Списки устройств для маршрутов чтения, сбрасываются синхронизацией
+        self.read_cache = read_cache or DevicesReadCache(metrics=self.client.metrics)
+
         # TODO: На будущее чтоб работать с несколькими ключами
         # self.helpers: dict[str, list[RTHelper]] = dict()
-        self.helpers: dict[str, RTHelper] = dict()
+        # Хелпер, к которому не обращались `helpers_ttl` секунд, забывается (токен хранится в
+        # базе, при следующем обращении хелпер создается заново)
+        self.helpers: TTLCache[str, RTHelper] = TTLCache(ttl=helpers_ttl, max_size=helpers_max_size)
         self.db_helper = db_helper
+        self.snapshots = DeviceSnapshots(db_helper)
+
+        # Время последнего обращения к данным логина (для приоритета фоновой синхронизации)
+        self._activity: TTLCache[int, float] = TTLCache(ttl=86400.0, max_size=100000)
 
     def add_helper(self, login: str) -> RTHelper:
         """
@@ -32,18 +70,44 @@ class RTManger:
         :param login: Логин str
         :return: None
         """
-        if login in self.helpers:
+        helper = self.helpers.get(login)
+        if helper is not None:
             self.logger.info(f"RTHelper для {login} уже есть")
-            return self.helpers[login]
+        else:
+            helper = self._new_helper(login)
+        # Продлеваем жизнь хелпера при каждом обращении
+        self.helpers.set(login, helper)
+        return helper
+
+    async def helper(self, login: str) -> RTHelper:
+        """
+        Хелпер логина для асинхронного кода
 
-        self.helpers[login] = RTHelper(
+        Новый хелпер создается в отдельном потоке: при создании он читает токен из базы
+
+        :param login: Логин
+        """
+        helper = self.helpers.get(login)
+        if helper is None:
+            helper = await asyncio.to_thread(self._new_helper, login)
+            # Пока хелпер создавался, его мог создать другой запрос
+            helper = self.helpers.get(login) or helper
+        self.helpers.set(login, helper)
+        return helper
+
+    def _new_helper(self, login: str) -> RTHelper:
+        return RTHelper(
             login=login,
             logger=self.logger,
             db_helper=self.db_helper,
+            client=self.client,
+            cameras_cache=self.cameras_cache,
+            auth_limiter=self.auth_limiter,
+            invalid_tokens=self.invalid_tokens,
+            read_cache=self.read_cache,
+            snapshots=self.snapshots,
         )
 
-        return self.helpers[login]
-
     def get_helpers(self, login: str) -> RTHelper | None:
         """
         Возвращает все хелперы для номера телефона
@@ -51,4 +115,34 @@ class RTManger:
         :param login: Логин
         :return: list[RTHelper]
         """
-        return self.helpers.get(login, None)
+        return self.helpers.get(login)
+
+    def mark_active(self, login_id: int) -> None:
+        """Отметка обращения к данным логина"""
+        self._activity.set(login_id, monotonic())
+
+    def last_active(self, login_id: int) -> float | None:
+        """Время последнего обращения к данным логина (`time.monotonic`)"""
+        return self._activity.get(login_id)
+
+    def sync(self, login_id: int, login: str) -> SyncJob:
+        """
+        Запуск синхронизации устройств логина в фоне
+
+        Если синхронизация логина уже идет, возвращается выполняющаяся задача
+
+        :param login_id: Id логина
+        :param login: Логин
+        :return: Задача синхронизации
+        """
+
+        async def run(progress: Callable[[str], None]) -> Response:
+            helper = await self.helper(login)
+            return await helper.load_devices(progress=progress)
+
+        return self.sync_jobs.submit(login_id, run)
+
+    async def aclose(self) -> None:
+        """Отмена задач синхронизации и закрытие соединений с Rt"""
+        await self.sync_jobs.aclose()
+        await self.client.aclose()
@@ -0,0 +1,68 @@
+"""
+:mod:`MonitoringRouter` -- Роутер для мониторинга
+===================================
+.. moduleauthor:: ilya Barinov <i-barinov@it-serv.ru>
+"""
+
+from fastapi.responses import PlainTextResponse
+
+from ext_rt_key.models.request import GoodResponse
+from ext_rt_key.rest.common import RoutsCommon
+from ext_rt_key.utils.metrics import CONTENT_TYPE
+
+__all__ = ("MonitoringRouter",)
+
+
+class MonitoringRouter(RoutsCommon):
+    """Роутер для мониторинга состояния сервиса"""
+
+    def setup_routes(self) -> None:
+        """Функция назначения маршрутов"""
+        self._router.add_api_route("/upstream_pool", self.upstream_pool, methods=["GET"])
+        self._router.add_api_route("/single_flight", self.single_flight, methods=["GET"])
+        self._router.add_api_route("/upstream_hosts", self.upstream_hosts, methods=["GET"])
+        self._router.add_api_route("/cameras_cache", self.cameras_cache, methods=["GET"])
+        self._router.add_api_route("/devices_cache", self.devices_cache, methods=["GET"])
+        self._router.add_api_route("/auth_limiter", self.auth_limiter, methods=["GET"])
+        self._router.add_api_route("/sync_jobs", self.sync_jobs, methods=["GET"])
+        self._router.add_api_route(
+            "/metrics",
+            self.metrics,
+            methods=["GET"],
+            response_class=PlainTextResponse,
+        )
+
+    async def upstream_pool(self) -> GoodResponse:
+        """Статистика использования пула соединений к Rt"""
+        return self.good_response(data=self.rt_manger.client.pool.stats())
+
+    async def single_flight(self) -> GoodResponse:
+        """Статистика объединения одинаковых запросов к Rt"""
+        return self.good_response(data=self.rt_manger.client.single_flight.stats())
+
+    async def cameras_cache(self) -> GoodResponse:
+        """Статистика кэша списка камер"""
+        return self.good_response(data=self.rt_manger.cameras_cache.stats())
+
+    async def devices_cache(self) -> GoodResponse:
+        """Статистика кэша списков устройств"""
+        return self.good_response(data=self.rt_manger.read_cache.stats())
+
+    async def upstream_hosts(self) -> GoodResponse:
+        """Состояние предохранителей и адаптивных лимитов по хостам Rt"""
+        return self.good_response(data=self.rt_manger.client.guards.stats())
+
+    async def auth_limiter(self) -> GoodResponse:
+        """Статистика ограничения запросов к авторизации Rt"""
+        return self.good_response(data=self.rt_manger.auth_limiter.stats())
+
+    async def sync_jobs(self) -> GoodResponse:
+        """Статистика задач синхронизации устройств"""
+        return self.good_response(data=self.rt_manger.sync_jobs.stats())
+
+    async def metrics(self) -> PlainTextResponse:
+        """Метрики сервиса и запросов к Rt в текстовом формате Prometheus"""
+        return PlainTextResponse(
+            self.rt_manger.client.metrics.render(),
+            media_type=CONTENT_TYPE,
+        )
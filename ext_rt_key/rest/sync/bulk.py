@@ -0,0 +1,583 @@
+"""
+:mod:`bulk` -- Массовая синхронизация устройств многих логинов
+===================================
+.. moduleauthor:: ilya Barinov <i-barinov@it-serv.ru>
+
+Данные логинов запрашиваются из Rt одновременно, загружаются во временные таблицы через
+``COPY`` и переносятся в ``cameras``/``devices`` одним запросом на таблицу в одной транзакции
+на пачку логинов.
+
+Процесс CLI не может сбросить кэш списков устройств сервера (:class:`DevicesReadCache` живет
+в памяти воркеров): готовые ответы логинов удаляются из базы в транзакции переноса и собираются
+заново после нее, а ответы в кэше воркеров устаревают не дольше его времени жизни
+(``READ_CACHE_TTL``).
+
+Запуск::
+
+    ext-rt-key-bulk-sync --concurrency 16 --batch-size 200
+    python -m ext_rt_key.rest.sync.bulk --login-id 1 --login-id 2
+"""
+
+import argparse
+import asyncio
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+from enum import Enum
+from logging import getLogger, Logger
+from time import monotonic
+from typing import Any
+
+from ext_rt_key.di.rest import RestDI
+from ext_rt_key.models import db as models
+from ext_rt_key.rest.devices.snapshots import DeviceSnapshots
+from ext_rt_key.rest.helper import CAMERA_UPDATE_COLUMNS, rows_fingerprint
+from ext_rt_key.rest.manager import RTManger
+from ext_rt_key.rest.upstream.deadline import deadline_scope
+from ext_rt_key.utils.db_helper import DBHelper
+
+__all__ = (
+    "BulkSync",
+    "BulkSyncResult",
+)
+
+CAMERA_COLUMNS = ("rt_id", "login_id", *CAMERA_UPDATE_COLUMNS, "content_hash")
+DEVICE_COLUMNS = (
+    "rt_id",
+    "device_type",
+    "login_id",
+    "camera_id",
+    "description",
+    "is_favorite",
+    "name_by_user",
+    "content_hash",
+)
+
+# Счетчики строк :class:`BulkSyncResult`, которые заполняет перенос в основные таблицы
+ROW_COUNTERS = (
+    "cameras_copied",
+    "devices_copied",
+    "cameras_merged",
+    "devices_inserted",
+    "devices_updated",
+    "cameras_deleted",
+    "devices_deleted",
+)
+
+# region SQL
+CREATE_STAGING = """
+CREATE TEMP TABLE sync_logins (
+    login_id integer PRIMARY KEY,
+    cameras_fingerprint text,
+    devices_fingerprint text
+) ON COMMIT DROP;
+CREATE TEMP TABLE sync_cameras (
+    position integer,
+    rt_id text,
+    login_id integer,
+    archive_length integer,
+    screenshot_url_template text,
+    screenshot_token text,
+    streamer_token text,
+    content_hash text
+) ON COMMIT DROP;
+CREATE TEMP TABLE sync_devices (
+    position integer,
+    rt_id text,
+    device_type text,
+    login_id integer,
+    camera_id text,
+    description text,
+    is_favorite boolean,
+    name_by_user text,
+    content_hash text
+) ON COMMIT DROP;
+"""
+
+# Камера, которую в пачке вернули несколько логинов, достается логину, который идет в пачке
+# раньше (`position` - номер логина в пачке), как и при синхронизации логинов по очереди
+MERGE_CAMERAS = """
+INSERT INTO cameras (rt_id, login_id, archive_length, screenshot_url_template,
+                     screenshot_token, streamer_token, content_hash)
+SELECT DISTINCT ON (rt_id) rt_id, login_id, archive_length, screenshot_url_template,
+                           screenshot_token, streamer_token, content_hash
+FROM sync_cameras
+ORDER BY rt_id, position
+ON CONFLICT (rt_id) DO UPDATE SET
+    archive_length = excluded.archive_length,
+    screenshot_url_template = excluded.screenshot_url_template,
+    screenshot_token = excluded.screenshot_token,
+    streamer_token = excluded.streamer_token,
+    content_hash = excluded.content_hash
+WHERE cameras.content_hash IS DISTINCT FROM excluded.content_hash
+"""
+
+# Камеры логинов с полным новым списком, которых в списке нет. Для каждой удаленной камеры
+# возвращаются владелец и логины устройств, которые удалятся каскадно (запрос видит устройства
+# до удаления)
+DELETE_MISSING_CAMERAS = """
+WITH deleted AS (
+    DELETE FROM cameras
+    USING sync_logins
+    WHERE cameras.login_id = sync_logins.login_id
+      AND sync_logins.cameras_fingerprint IS NOT NULL
+      AND NOT EXISTS (
+          SELECT 1 FROM sync_cameras
+          WHERE sync_cameras.rt_id = cameras.rt_id AND sync_cameras.login_id = cameras.login_id
+      )
+    RETURNING cameras.rt_id, cameras.login_id
+)
+SELECT DISTINCT deleted.rt_id, deleted.login_id, devices.login_id
+FROM deleted
+LEFT JOIN devices ON devices.camera_id = deleted.rt_id
+"""
+
+# Перезаписываются все колонки из хэша (DEVICE_HASH_COLUMNS), is_favorite только повышается
+# с False до True, устройства другого логина не трогаются. Устройство нескольких логинов пачки,
+# как и камера, достается логину, который идет в пачке раньше
+MERGE_DEVICES = """
+INSERT INTO devices (rt_id, device_type, login_id, camera_id, description, is_favorite,
+                     name_by_user, content_hash)
+SELECT DISTINCT ON (rt_id) rt_id, device_type::devicetype, login_id, camera_id, description,
+                           is_favorite, name_by_user, content_hash
+FROM sync_devices
+ORDER BY rt_id, position
+ON CONFLICT (rt_id) DO UPDATE SET
+    device_type = excluded.device_type,
+    camera_id = excluded.camera_id,
+    description = excluded.description,
+    is_favorite = devices.is_favorite OR excluded.is_favorite,
+    name_by_user = excluded.name_by_user,
+    content_hash = excluded.content_hash
+WHERE devices.login_id = excluded.login_id
+  AND devices.content_hash IS DISTINCT FROM excluded.content_hash
+RETURNING xmax = 0
+"""
+
+DELETE_MISSING_DEVICES = """
+DELETE FROM devices
+USING sync_logins
+WHERE devices.login_id = sync_logins.login_id
+  AND sync_logins.devices_fingerprint IS NOT NULL
+  AND NOT EXISTS (
+      SELECT 1 FROM sync_devices
+      WHERE sync_devices.rt_id = devices.rt_id AND sync_devices.login_id = devices.login_id
+  )
+"""
+
+# Устройства логинов, у которых каскадно удалились устройства, надо будет сохранить заново
+UPDATE_FINGERPRINTS = """
+UPDATE login SET
+    cameras_fingerprint = COALESCE(sync_logins.cameras_fingerprint, login.cameras_fingerprint),
+    devices_fingerprint = CASE
+        WHEN login.id = ANY(%(cascaded)s) THEN NULL
+        ELSE COALESCE(sync_logins.devices_fingerprint, login.devices_fingerprint)
+    END
+FROM sync_logins
+WHERE login.id = sync_logins.login_id
+"""
+
+# Логины, устройства которых ссылались на чужие удаленные камеры: следующая синхронизация
+# должна заново сохранить и камеру (отпечаток камер совпал бы), и устройства
+RESET_FINGERPRINTS = """
+UPDATE login SET cameras_fingerprint = NULL, devices_fingerprint = NULL
+WHERE id = ANY(%(orphaned)s)
+"""
+
+# Готовые ответы со списками устройств собираются заново после переноса
+DELETE_SNAPSHOTS = """
+DELETE FROM device_snapshots
+WHERE login_id IN (SELECT login_id FROM sync_logins) OR login_id = ANY(%(orphaned)s)
+"""
+# endregion
+
+
+def _copy_value(value: Any) -> str:
+    """Значение в текстовом формате COPY"""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, Enum):
+        value = value.value
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+class CopyStream:
+    """Файлоподобный поток строк COPY, строки формируются по мере чтения"""
+
+    def __init__(self, rows: Iterable[Iterable[Any]]) -> None:
+        self._lines: Iterator[str] = (
+            "\t".join(_copy_value(value) for value in row) + "\n" for row in rows
+        )
+        self._buffer = ""
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._buffer) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buffer += line
+
+        if size < 0:
+            size = len(self._buffer)
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+
+@dataclass
+class LoginSnapshot:
+    """Данные логина из Rt, подготовленные к загрузке (None - список не меняется)"""
+
+    login_id: int
+    cameras: dict[str, dict[str, Any]] | None = None
+    devices: dict[str, dict[str, Any]] | None = None
+    cameras_fingerprint: str | None = None
+    devices_fingerprint: str | None = None
+
+
+@dataclass
+class BulkSyncResult:
+    """Итоги массовой синхронизации"""
+
+    logins: int = 0
+    failed: int = 0
+    unchanged: int = 0
+    cameras_copied: int = 0
+    devices_copied: int = 0
+    cameras_merged: int = 0
+    devices_inserted: int = 0
+    devices_updated: int = 0
+    cameras_deleted: int = 0
+    devices_deleted: int = 0
+    fetch_seconds: float = 0.0
+    merge_seconds: float = 0.0
+    batches: list[dict[str, float]] = field(default_factory=list)
+
+    def add_rows(self, other: "BulkSyncResult") -> None:
+        """Добавить счетчики строк другого результата (перенос одной пачки или логина)"""
+        for name in ROW_COUNTERS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def to_json(self) -> dict[str, Any]:
+        """Получить словарь с пропускной способностью"""
+        total = self.fetch_seconds + self.merge_seconds
+        rows = self.cameras_copied + self.devices_copied
+        return {
+            "logins": self.logins,
+            "failed": self.failed,
+            "unchanged": self.unchanged,
+            "cameras": {
+                "copied": self.cameras_copied,
+                "merged": self.cameras_merged,
+                "deleted": self.cameras_deleted,
+            },
+            "devices": {
+                "copied": self.devices_copied,
+                "inserted": self.devices_inserted,
+                "updated": self.devices_updated,
+                "deleted": self.devices_deleted,
+            },
+            "fetch_seconds": round(self.fetch_seconds, 3),
+            "merge_seconds": round(self.merge_seconds, 3),
+            "logins_per_second": round(self.logins / total, 1) if total else None,
+            "rows_per_second_merge": (
+                round(rows / self.merge_seconds, 1) if self.merge_seconds else None
+            ),
+        }
+
+
+class BulkSync:
+    """
+    Массовая синхронизация логинов
+
+    Логины обрабатываются пачками по `batch_size`: данные пачки запрашиваются из Rt не больше
+    `concurrency` логинов одновременно, списки, отпечаток которых не изменился, отбрасываются,
+    остальное загружается через COPY во временные таблицы и переносится в основные таблицы
+    одним запросом на таблицу. Пачка сохраняется в одной транзакции, а если она не сохранилась
+    (например, данные одного логина нарушили ограничение), логины пачки сохраняются по одному
+    и неудачные учитываются в `failed`
+    """
+
+    def __init__(
+        self,
+        rt_manger: RTManger,
+        db_helper: DBHelper,
+        concurrency: int = 16,
+        batch_size: int = 200,
+        budget: float = 60.0,
+        logger: Logger | None = None,
+    ) -> None:
+        """
+        :param rt_manger: Менеджер хелперов Rt
+        :param db_helper: Подключение к базе
+        :param concurrency: Сколько логинов запрашивается из Rt одновременно
+        :param batch_size: Сколько логинов сохраняется в одной транзакции
+        :param budget: Бюджет времени на запросы к Rt по одному логину, сек.
+        :param logger: Логгер
+        """
+        self.rt_manger = rt_manger
+        self.db_helper = db_helper
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.budget = budget
+        self.logger = logger or getLogger(__name__)
+        self.snapshots = DeviceSnapshots(db_helper)
+
+    def _load_logins(
+        self,
+        login_ids: list[int] | None,
+    ) -> list[tuple[int, str, str | None, str | None]]:
+        """Логины без требования повторной авторизации и их сохраненные отпечатки"""
+        with self.db_helper.sessionmanager() as session:
+            query = session.query(
+                models.Login.id,
+                models.Login.login,
+                models.Login.cameras_fingerprint,
+                models.Login.devices_fingerprint,
+            ).filter(models.Login.needs_reauth.is_(False))
+            if login_ids:
+                query = query.filter(models.Login.id.in_(login_ids))
+            return [
+                (login_id, login, cameras_fingerprint, devices_fingerprint)
+                for login_id, login, cameras_fingerprint, devices_fingerprint in query.order_by(
+                    models.Login.id
+                ).all()
+            ]
+
+    async def _fetch(
+        self,
+        semaphore: asyncio.Semaphore,
+        login_id: int,
+        login: str,
+        cameras_fingerprint: str | None,
+        devices_fingerprint: str | None,
+    ) -> LoginSnapshot | None:
+        """Данные логина из Rt, None если получить их не удалось"""
+        async with semaphore:
+            helper = await self.rt_manger.helper(login)
+            try:
+                with deadline_scope(self.budget):
+                    cameras, intercom, barrier = await helper.fetch_device_lists()
+            except Exception as e:  # noqa: BLE001
+                self.logger.info(f"Массовая синхронизация {login} не удалась: {e}")
+                return None
+
+        snapshot = LoginSnapshot(login_id=login_id)
+        if cameras is not None:
+            rows = helper.camera_rows(cameras, login_id)
+            camera_fingerprint = rows_fingerprint(rows)
+            if camera_fingerprint != cameras_fingerprint:
+                snapshot.cameras, snapshot.cameras_fingerprint = rows, camera_fingerprint
+
+        # Без списка камер устройства не сохраняются: они ссылаются на камеры, которых может не
+        # быть в базе, и нарушение внешнего ключа откатило бы всю пачку
+        if cameras is not None and (intercom is not None or barrier is not None):
+            rows = helper.device_rows([*(intercom or []), *(barrier or [])], login_id)
+            # Отпечаток (и удаление пропавших устройств) - только для полного списка
+            device_fingerprint = (
+                rows_fingerprint(rows) if intercom is not None and barrier is not None else None
+            )
+            if device_fingerprint is None or device_fingerprint != devices_fingerprint:
+                snapshot.devices, snapshot.devices_fingerprint = rows, device_fingerprint
+
+        return snapshot
+
+    def _merge(self, snapshots: list[LoginSnapshot]) -> BulkSyncResult:
+        """
+        Загрузка пачки через COPY и перенос в основные таблицы в одной транзакции
+
+        :return: Счетчики перенесенных строк
+        """
+        result = BulkSyncResult()
+        camera_rows = [
+            [position, *(row[column] for column in CAMERA_COLUMNS)]
+            for position, snapshot in enumerate(snapshots)
+            for row in (snapshot.cameras or {}).values()
+        ]
+        device_rows = [
+            [position, *(row[column] for column in DEVICE_COLUMNS)]
+            for position, snapshot in enumerate(snapshots)
+            for row in (snapshot.devices or {}).values()
+        ]
+        login_rows = [
+            (snapshot.login_id, snapshot.cameras_fingerprint, snapshot.devices_fingerprint)
+            for snapshot in snapshots
+        ]
+
+        connection = self.db_helper.engine.raw_connection()  # type: ignore[union-attr]
+        try:
+            cursor = connection.cursor()
+            cursor.execute(CREATE_STAGING)
+            cursor.copy_expert(
+                "COPY sync_logins (login_id, cameras_fingerprint, devices_fingerprint) "
+                "FROM STDIN",
+                CopyStream(login_rows),
+            )
+            cursor.copy_expert(
+                f"COPY sync_cameras (position, {', '.join(CAMERA_COLUMNS)}) FROM STDIN",
+                CopyStream(camera_rows),
+            )
+            cursor.copy_expert(
+                f"COPY sync_devices (position, {', '.join(DEVICE_COLUMNS)}) FROM STDIN",
+                CopyStream(device_rows),
+            )
+
+            cursor.execute(MERGE_CAMERAS)
+            result.cameras_merged += max(cursor.rowcount, 0)
+            cursor.execute(DELETE_MISSING_CAMERAS)
+            deleted = cursor.fetchall()
+            result.cameras_deleted += len({rt_id for rt_id, _, _ in deleted})
+            cascaded = sorted({device_login for _, _, device_login in deleted if device_login})
+            orphaned = sorted(
+                {
+                    device_login
+                    for _, owner, device_login in deleted
+                    if device_login and device_login != owner
+                }
+            )
+
+            cursor.execute(MERGE_DEVICES)
+            merged = [is_inserted for (is_inserted,) in cursor.fetchall()]
+            result.devices_inserted += sum(1 for is_inserted in merged if is_inserted)
+            result.devices_updated += sum(1 for is_inserted in merged if not is_inserted)
+            cursor.execute(DELETE_MISSING_DEVICES)
+            result.devices_deleted += max(cursor.rowcount, 0)
+
+            cursor.execute(UPDATE_FINGERPRINTS, {"cascaded": cascaded})
+            cursor.execute(RESET_FINGERPRINTS, {"orphaned": orphaned})
+            cursor.execute(DELETE_SNAPSHOTS, {"orphaned": orphaned})
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+
+        result.cameras_copied += len(camera_rows)
+        result.devices_copied += len(device_rows)
+        self._materialize(sorted({*(snapshot.login_id for snapshot in snapshots), *orphaned}))
+        return result
+
+    def _materialize(self, login_ids: list[int]) -> None:
+        """
+        Сборка готовых ответов логинов, удаленных переносом
+
+        Перенос уже сохранен, поэтому ошибка сборки его не отменяет: пока ответа нет, маршруты
+        чтения собирают его сами, а следующая синхронизация логина сохранит
+        """
+        for login_id in login_ids:
+            try:
+                self.snapshots.materialize(login_id)
+            except Exception as e:  # noqa: BLE001
+                self.logger.warning(f"Готовые ответы логина {login_id} не собраны: {e}")
+
+    def _merge_batch(self, snapshots: list[LoginSnapshot], result: BulkSyncResult) -> None:
+        """Перенос пачки, при ошибке - перенос каждого логина отдельной транзакцией"""
+        try:
+            result.add_rows(self._merge(snapshots))
+            return
+        except Exception as e:  # noqa: BLE001
+            self.logger.warning(
+                f"Пачка {len(snapshots)} логинов не сохранилась, логины сохраняются по одному: {e}"
+            )
+
+        for snapshot in snapshots:
+            try:
+                result.add_rows(self._merge([snapshot]))
+            except Exception as e:  # noqa: BLE001
+                self.logger.warning(f"Логин {snapshot.login_id} не сохранился: {e}")
+                result.failed += 1
+
+    async def run(self, login_ids: list[int] | None = None) -> BulkSyncResult:
+        """
+        Синхронизация логинов
+
+        :param login_ids: Id логинов (по умолчанию все, кроме требующих повторной авторизации)
+        :return: Итоги синхронизации
+        """
+        result = BulkSyncResult()
+        logins = await asyncio.to_thread(self._load_logins, login_ids)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        for start in range(0, len(logins), self.batch_size):
+            batch = logins[start : start + self.batch_size]
+
+            started = monotonic()
+            fetched = await asyncio.gather(*(self._fetch(semaphore, *login) for login in batch))
+            fetch_seconds = monotonic() - started
+
+            snapshots = [
+                snapshot
+                for snapshot in fetched
+                if snapshot is not None
+                and (snapshot.cameras is not None or snapshot.devices is not None)
+            ]
+            failed = sum(1 for snapshot in fetched if snapshot is None)
+            result.logins += len(batch)
+            result.failed += failed
+            result.unchanged += len(batch) - failed - len(snapshots)
+
+            started = monotonic()
+            if snapshots:
+                await asyncio.to_thread(self._merge_batch, snapshots, result)
+            merge_seconds = monotonic() - started
+
+            result.fetch_seconds += fetch_seconds
+            result.merge_seconds += merge_seconds
+            result.batches.append(
+                {"logins": len(batch), "fetch": fetch_seconds, "merge": merge_seconds}
+            )
+            self.logger.info(
+                f"Пачка {len(batch)} логинов: Rt {fetch_seconds:.2f} сек., "
+                f"база {merge_seconds:.2f} сек."
+            )
+
+        return result
+
+
+def main() -> None:
+    """Точка входа CLI"""
+    parser = argparse.ArgumentParser(description="Массовая синхронизация устройств логинов")
+    parser.add_argument("--login-id", type=int, action="append", dest="login_ids")
+    parser.add_argument("--concurrency", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=None)
+    args = parser.parse_args()
+
+    di = RestDI()
+    di.init_resources()
+    try:
+        settings = di.common_di.settings()
+        rt_manger = di.rt_manger()
+
+        bulk = BulkSync(
+            rt_manger=rt_manger,
+            db_helper=rt_manger.db_helper,
+            concurrency=args.concurrency or settings.BULK_SYNC_CONCURRENCY,
+            batch_size=args.batch_size or settings.BULK_SYNC_BATCH_SIZE,
+            budget=settings.SYNC_BUDGET,
+            logger=di.common_di.logger(),
+        )
+
+        async def run() -> BulkSyncResult:
+            try:
+                return await bulk.run(args.login_ids)
+            finally:
+                # Клиенты Rt привязаны к циклу событий и закрываются до его завершения
+                await rt_manger.aclose()
+
+        result = asyncio.run(run())
+    finally:
+        di.shutdown_resources()
+
+    for key, value in result.to_json().items():
+        print(f"{key}: {value}")  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+:mod:`jobs` -- Асинхронные задачи синхронизации устройств
+===================================
+.. moduleauthor:: ilya Barinov <i-barinov@it-serv.ru>
+"""
+
+import asyncio
+import contextvars
+import uuid
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from enum import StrEnum
+from logging import getLogger, Logger
+from time import time
+from typing import Any
+
+from ext_rt_key.models.request import GoodResponse, Response
+from ext_rt_key.rest.upstream.cache import TTLCache
+from ext_rt_key.rest.upstream.deadline import deadline_scope
+
+__all__ = (
+    "SyncJob",
+    "SyncJobStatus",
+    "SyncJobs",
+)
+
+# Функция синхронизации: получает колбэк, которому сообщает начало каждого этапа
+SyncRunner = Callable[[Callable[[str], None]], Awaitable[Response]]
+
+
+class SyncJobStatus(StrEnum):
+    """Состояние задачи"""
+
+    pending = "pending"
+    running = "running"
+    done = "done"
+    failed = "failed"
+
+
+@dataclass
+class SyncJob:
+    """Задача синхронизации устройств логина"""
+
+    id: str
+    login_id: int
+    status: SyncJobStatus = SyncJobStatus.pending
+    # Текущий этап (fetch, save_cameras, save_devices, snapshots)
+    phase: str | None = None
+    message: str | None = None
+    # Результат `RTHelper.load_devices` (статусы списков, количество изменений, время этапов)
+    result: dict[str, Any] | None = None
+    created_at: float = field(default_factory=time)
+    started_at: float | None = None
+    finished_at: float | None = None
+
+    _task: asyncio.Task[None] | None = field(default=None, init=False, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        """Задача завершена"""
+        return self.status in {SyncJobStatus.done, SyncJobStatus.failed}
+
+    async def wait(self) -> "SyncJob":
+        """Ожидание завершения (отмена ожидающего не отменяет задачу)"""
+        if self._task is not None:
+            await asyncio.shield(self._task)
+        return self
+
+    def to_json(self) -> dict[str, Any]:
+        """Получить словарь"""
+        return {
+            "job_id": self.id,
+            "login_id": self.login_id,
+            "status": self.status.value,
+            "phase": self.phase,
+            "message": self.message,
+            "result": self.result,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class SyncJobs:
+    """
+    Запуск синхронизаций в фоне с опросом состояния по id задачи
+
+    На логин выполняется не больше одной задачи: повторный запуск, пока задача идет,
+    возвращает уже выполняющуюся задачу. Завершенные задачи хранятся `ttl` секунд
+    """
+
+    def __init__(
+        self,
+        budget: float = 60.0,
+        ttl: float = 3600.0,
+        max_size: int = 10000,
+        logger: Logger | None = None,
+    ) -> None:
+        """
+        :param budget: Бюджет времени одной синхронизации на запросы к Rt, сек.
+        :param ttl: Сколько хранится задача для опроса состояния, сек.
+        :param max_size: Сколько задач хранится одновременно
+        :param logger: Логгер
+        """
+        self.budget = budget
+        self.logger = logger or getLogger(__name__)
+        self._jobs: TTLCache[str, SyncJob] = TTLCache(ttl=ttl, max_size=max_size)
+        self._running: dict[int, SyncJob] = {}
+        self.started = 0
+        self.attached = 0
+
+    def get(self, job_id: str) -> SyncJob | None:
+        """Задача по id"""
+        return self._jobs.get(job_id)
+
+    def running(self, login_id: int) -> SyncJob | None:
+        """Выполняющаяся задача логина"""
+        return self._running.get(login_id)
+
+    def submit(self, login_id: int, run: SyncRunner) -> SyncJob:
+        """
+        Запуск синхронизации логина
+
+        :param login_id: Id логина
+        :param run: Функция синхронизации
+        :return: Новая задача или уже выполняющаяся задача логина
+        """
+        job = self._running.get(login_id)
+        if job is not None:
+            self.attached += 1
+            return job
+
+        self.started += 1
+        job = SyncJob(id=uuid.uuid4().hex, login_id=login_id)
+        self._jobs.set(job.id, job)
+        self._running[login_id] = job
+        # Пустой контекст: задача не наследует бюджет маршрута, который ее запустил
+        job._task = asyncio.create_task(self._run(job, run), context=contextvars.Context())
+        return job
+
+    async def _run(self, job: SyncJob, run: SyncRunner) -> None:
+        job.status = SyncJobStatus.running
+        job.started_at = time()
+
+        def progress(phase: str) -> None:
+            job.phase = phase
+
+        try:
+            with deadline_scope(self.budget):
+                response = await run(progress)
+            job.message = response.message
+            job.result = response.data
+            job.status = (
+                SyncJobStatus.done if isinstance(response, GoodResponse) else SyncJobStatus.failed
+            )
+        except Exception as e:  # noqa: BLE001
+            self.logger.warning(f"Задача синхронизации {job.id} завершилась ошибкой: {e}")
+            job.message = getattr(e, "message", str(e))
+            job.status = SyncJobStatus.failed
+        finally:
+            if not job.finished:
+                # Задачу отменили (например, при остановке приложения)
+                job.status = SyncJobStatus.failed
+            job.phase = None
+            job.finished_at = time()
+            self._running.pop(job.login_id, None)
+
+    async def aclose(self) -> None:
+        """Отмена выполняющихся задач"""
+        tasks = [job._task for job in self._running.values() if job._task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict[str, Any]:
+        """Статистика задач"""
+        return {
+            "started": self.started,
+            "attached": self.attached,
+            "running": len(self._running),
+            "stored": len(self._jobs),
+        }
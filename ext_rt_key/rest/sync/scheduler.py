@@ -0,0 +1,294 @@
+"""
+:mod:`scheduler` -- Фоновая синхронизация устройств всех логинов
+===================================
+.. moduleauthor:: ilya Barinov <i-barinov@it-serv.ru>
+"""
+
+import asyncio
+import contextlib
+import functools
+import random
+from dataclasses import dataclass
+from logging import getLogger, Logger
+from time import monotonic
+from typing import Any
+
+from sqlalchemy import Connection, func, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from ext_rt_key.models import db as models
+from ext_rt_key.rest.manager import RTManger
+from ext_rt_key.rest.sync.jobs import SyncJobStatus
+from ext_rt_key.utils.db_helper import DBHelper
+from ext_rt_key.utils.metrics import DEFAULT_TIME_BUCKETS
+
+__all__ = ("SyncScheduler",)
+
+# Ключ advisory-блокировки PostgreSQL, которую держит процесс, ведущий расписание
+LEADER_LOCK_KEY = 0x52545359
+
+
+@dataclass
+class LoginSyncState:
+    """Расписание синхронизации логина"""
+
+    next_due: float
+    failures: int = 0
+
+
+class SyncScheduler:
+    """
+    Периодическая синхронизация устройств всех логинов из Rt
+
+    Раз в `poll_interval` выбираются логины, которым пора обновиться, и синхронизируются не
+    больше `concurrency` одновременно. Логины, к данным которых недавно обращались, обновляются
+    раз в `interval` и идут первыми, остальные - раз в `idle_interval`. После неудачи интервал
+    удваивается (до `backoff_max`). Ко всем интервалам добавляется случайный разброс `jitter`,
+    чтобы логины не синхронизировались одновременно, а первая синхронизация каждого логина после
+    запуска назначается на случайный момент в пределах `interval`. Логины, которым нужна
+    повторная авторизация, пропускаются.
+
+    Проверка не ждет синхронизаций, а запускает их в фоне: одновременно ждут места или
+    синхронизируются не больше `queue_size` логинов, остальные дожидаются следующих проверок.
+
+    Расписание создается в каждом воркере uvicorn, но ведет его только процесс, который держит
+    advisory-блокировку PostgreSQL (`LEADER_LOCK_KEY`). Блокировка держится отдельным
+    соединением, поэтому после остановки ведущего процесса ее забирает другой воркер.
+
+    Синхронизация запускается через задачи :class:`SyncJobs`, поэтому фоновая синхронизация и
+    запрос `/devices/load_devices` по одному логину не выполняются одновременно (в пределах
+    процесса)
+    """
+
+    def __init__(
+        self,
+        rt_manger: RTManger,
+        db_helper: DBHelper,
+        interval: float = 900.0,
+        idle_interval: float = 3600.0,
+        active_window: float = 3600.0,
+        jitter: float = 0.2,
+        concurrency: int = 4,
+        queue_size: int = 100,
+        backoff_max: float = 21600.0,
+        poll_interval: float = 30.0,
+        logger: Logger | None = None,
+    ) -> None:
+        """
+        :param rt_manger: Менеджер хелперов Rt
+        :param db_helper: Подключение к базе
+        :param interval: Интервал синхронизации активного логина, сек.
+        :param idle_interval: Интервал синхронизации неактивного логина, сек.
+        :param active_window: Логин активен, если к нему обращались за это время, сек.
+        :param jitter: Случайный разброс интервалов (доля интервала)
+        :param concurrency: Сколько логинов синхронизируется одновременно
+        :param queue_size: Сколько логинов может ждать места или синхронизироваться одновременно
+        :param backoff_max: Максимальный интервал после неудач подряд, сек.
+        :param poll_interval: Как часто проверяется, каким логинам пора обновиться, сек.
+        :param logger: Логгер
+        """
+        self.rt_manger = rt_manger
+        self.db_helper = db_helper
+        self.interval = interval
+        self.idle_interval = idle_interval
+        self.active_window = active_window
+        self.jitter = jitter
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.backoff_max = backoff_max
+        self.poll_interval = poll_interval
+        self.logger = logger or getLogger(__name__)
+
+        self._states: dict[int, LoginSyncState] = {}
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._task: asyncio.Task[None] | None = None
+        # Запущенные синхронизации по id логина
+        self._running: dict[int, asyncio.Task[bool]] = {}
+        # Соединение, которое держит блокировку ведущего процесса
+        self._lock_connection: Connection | None = None
+
+        meter = rt_manger.client.metrics.meter
+        # Метки: result
+        self.runs = meter.create_counter(
+            "rt_sync_runs_total",
+            description="Фоновые синхронизации логинов по результату",
+        )
+        self.duration = meter.create_histogram(
+            "rt_sync_duration_seconds",
+            description="Время фоновой синхронизации логина",
+            explicit_bucket_boundaries_advisory=DEFAULT_TIME_BUCKETS,
+        )
+
+    def _jittered(self, delay: float) -> float:
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def is_active(self, login_id: int) -> bool:
+        """К данным логина недавно обращались"""
+        last_active = self.rt_manger.last_active(login_id)
+        return last_active is not None and monotonic() - last_active < self.active_window
+
+    def _load_logins(self) -> list[tuple[int, str]]:
+        """Логины, которые можно синхронизировать (без требования повторной авторизации)"""
+        with self.db_helper.sessionmanager() as session:
+            return [
+                (login_id, login)
+                for login_id, login in session.query(models.Login.id, models.Login.login)
+                .filter(models.Login.needs_reauth.is_(False))
+                .all()
+            ]
+
+    def _due_logins(self, logins: list[tuple[int, str]]) -> list[tuple[int, str]]:
+        """Логины, которым пора обновиться, активные первыми"""
+        now = monotonic()
+        known = {login_id for login_id, _ in logins}
+        # Удаленные логины и логины, требующие авторизации, забываются
+        for login_id in self._states.keys() - known:
+            del self._states[login_id]
+
+        due: list[tuple[int, str]] = []
+        for login_id, login in logins:
+            if login_id in self._running:
+                continue
+            state = self._states.get(login_id)
+            if state is None:
+                # Первая синхронизация после запуска размазывается по всему интервалу, чтобы
+                # перезапуск не отправлял в Rt запросы всех логинов разом
+                state = self._states[login_id] = LoginSyncState(
+                    next_due=now + random.uniform(0, self.interval)
+                )
+            if state.next_due <= now:
+                due.append((login_id, login))
+
+        due.sort(key=lambda item: (not self.is_active(item[0]), self._states[item[0]].next_due))
+        return due
+
+    def _reschedule(self, login_id: int, ok: bool) -> None:
+        state = self._states.get(login_id)
+        if state is None:
+            return
+
+        state.failures = 0 if ok else state.failures + 1
+        delay = self.interval if self.is_active(login_id) else self.idle_interval
+        if state.failures:
+            delay = min(delay * 2**state.failures, self.backoff_max)
+        state.next_due = monotonic() + self._jittered(delay)
+
+    async def sync_login(self, login_id: int, login: str) -> bool:
+        """
+        Синхронизация одного логина
+
+        :return: Синхронизация прошла успешно
+        """
+        async with self._semaphore:
+            started = monotonic()
+            job = await self.rt_manger.sync(login_id, login).wait()
+            ok = job.status == SyncJobStatus.done
+            if not ok:
+                self.logger.info(f"Синхронизация {login} не удалась: {job.message}")
+
+            self.duration.record(monotonic() - started)
+            self.runs.add(1, {"result": "ok" if ok else "failed"})
+            self._reschedule(login_id, ok)
+            return ok
+
+    def _is_leader(self) -> bool:
+        """Процесс держит блокировку ведущего (если ее никто не держит - забирает)"""
+        if self._lock_connection is not None:
+            try:
+                self._lock_connection.execute(select(1))
+                return True
+            except SQLAlchemyError:
+                # Соединение потеряно, а с ним и блокировка
+                self._release_leadership()
+
+        connection = self.db_helper.engine.connect()  # type: ignore[union-attr]
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        try:
+            locked = connection.execute(select(func.pg_try_advisory_lock(LEADER_LOCK_KEY))).scalar()
+        except SQLAlchemyError:
+            connection.close()
+            raise
+
+        if not locked:
+            connection.close()
+            return False
+        self.logger.info("Процесс ведет расписание фоновой синхронизации")
+        self._lock_connection = connection
+        return True
+
+    def _release_leadership(self) -> None:
+        """
+        Снятие блокировки и закрытие соединения
+
+        Блокировка снимается явно: после закрытия соединения сервер освобождает ее не сразу.
+        Соединение не возвращается в пул, чтобы сессия с блокировкой не досталась другому коду
+        """
+        if self._lock_connection is None:
+            return
+        with contextlib.suppress(SQLAlchemyError):
+            self._lock_connection.execute(select(func.pg_advisory_unlock(LEADER_LOCK_KEY)))
+        with contextlib.suppress(SQLAlchemyError):
+            self._lock_connection.invalidate()
+            self._lock_connection.close()
+        self._lock_connection = None
+
+    def _on_sync_done(self, login_id: int, task: asyncio.Task[bool]) -> None:
+        self._running.pop(login_id, None)
+        if not task.cancelled() and (error := task.exception()) is not None:
+            self.logger.warning(f"Ошибка фоновой синхронизации логина {login_id}: {error}")
+
+    async def tick(self) -> None:
+        """
+        Одна проверка: запуск синхронизации логинов, которым пора обновиться
+
+        Синхронизации не ожидаются, за проверку запускается не больше свободных мест очереди
+        """
+        if not await asyncio.to_thread(self._is_leader):
+            return
+
+        logins = await asyncio.to_thread(self._load_logins)
+        due = self._due_logins(logins)
+        for login_id, login in due[: max(self.queue_size - len(self._running), 0)]:
+            task = asyncio.create_task(self.sync_login(login_id, login))
+            self._running[login_id] = task
+            task.add_done_callback(functools.partial(self._on_sync_done, login_id))
+
+    async def run(self) -> None:
+        """Бесконечный цикл проверок"""
+        while True:
+            try:
+                await self.tick()
+            except Exception as e:  # noqa: BLE001
+                self.logger.warning(f"Ошибка фоновой синхронизации: {e}")
+            await asyncio.sleep(self._jittered(self.poll_interval))
+
+    def start(self) -> None:
+        """Запуск фоновой синхронизации"""
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Остановка фоновой синхронизации"""
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+        running = list(self._running.values())
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+        await asyncio.to_thread(self._release_leadership)
+
+    def stats(self) -> dict[str, Any]:
+        """Состояние расписания"""
+        now = monotonic()
+        return {
+            "running": self._task is not None,
+            "leader": self._lock_connection is not None,
+            "in_progress": len(self._running),
+            "logins": len(self._states),
+            "failing": sum(1 for state in self._states.values() if state.failures),
+            "due": sum(1 for state in self._states.values() if state.next_due <= now),
+        }
@@ -0,0 +1,83 @@
+"""
+:mod:`cache` -- Кэш ответов Rt с временем жизни
+===================================
+.. moduleauthor:: ilya Barinov <i-barinov@it-serv.ru>
+"""
+
+from collections import OrderedDict
+from collections.abc import Hashable
+from time import monotonic
+
+__all__ = ("TTLCache",)
+
+
+class TTLCache[K: Hashable, V]:
+    """
+    LRU кэш с ограничением размера и временем жизни записей
+
+    При превышении размера вытесняется запись, к которой дольше всего не обращались
+    """
+
+    def __init__(self, ttl: float = 60.0, max_size: int = 1000) -> None:
+        """
+        :param ttl: Время жизни записи в секундах
+        :param max_size: Максимальное количество записей
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: K) -> V | None:
+        """Значение по ключу, None если записи нет или она устарела"""
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = item
+        if expires_at <= monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: K, value: V, ttl: float | None = None) -> None:
+        """
+        Сохранение значения
+
+        :param ttl: Время жизни именно этой записи, по умолчанию общее для кэша
+        """
+        self._data[key] = (monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: K) -> None:
+        """Удаление записи"""
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Удаление всех записей"""
+        self._data.clear()
+
+    def __len__(self) -> int:  # noqa: D105
+        return len(self._data)
+
+    def stats(self) -> dict[str, int | float]:
+        """Статистика использования кэша"""
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
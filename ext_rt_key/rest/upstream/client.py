@@ -0,0 +1,329 @@
+"""
+:mod:`client` -- Асинхронный клиент для запросов к API Rt
+===================================
+.. moduleauthor:: ilya Barinov <i-barinov@it-serv.ru>
+"""
+
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from logging import getLogger, Logger
+from time import monotonic
+from typing import Any
+from urllib.parse import urlsplit, urlunsplit
+
+import httpx
+
+from ext_rt_key.rest.upstream.deadline import current_deadline, detached_context
+from ext_rt_key.rest.upstream.errors import (
+    DeadlineExceededError,
+    UpstreamError,
+    UpstreamTimeoutError,
+    UpstreamUnavailableError,
+)
+from ext_rt_key.rest.upstream.pool import UpstreamPool
+from ext_rt_key.rest.upstream.resilience import HostGuards
+from ext_rt_key.rest.upstream.single_flight import SingleFlight
+from ext_rt_key.utils import json_codec
+from ext_rt_key.utils.metrics import (
+    DEFAULT_SIZE_BUCKETS,
+    DEFAULT_TIME_BUCKETS,
+    MetricsRegistry,
+    REGISTRY,
+)
+
+__all__ = (
+    "UpstreamClient",
+    "UpstreamResponse",
+    "endpoint_label",
+)
+
+
+def endpoint_label(url: str) -> str:
+    """
+    Метка эндпоинта Rt по адресу запроса
+
+    Используется, если вызывающий код не передал метку явно. Сегменты пути с цифрами
+    (идентификаторы устройств, камер) заменяются на `{id}`, чтобы число меток было конечным
+    """
+    path = urlsplit(url).path
+    return "/".join(
+        "{id}" if any(ch.isdigit() for ch in segment) else segment for segment in path.split("/")
+    )
+
+
+@dataclass
+class UpstreamResponse:
+    """Ответ от API Rt"""
+
+    status_code: int
+    content: bytes
+    url: str
+
+    _json: Any = field(default=None, init=False, repr=False)
+    _parsed: bool = field(default=False, init=False, repr=False)
+
+    def json(self) -> Any:
+        """
+        Тело ответа в виде json
+
+        Разбор выполняется один раз, повторные вызовы возвращают тот же объект.
+        Если тело пустое или не является json - возвращается пустой словарь
+        """
+        if not self._parsed:
+            try:
+                self._json = json_codec.loads(self.content) if self.content else {}
+            except ValueError:
+                self._json = {}
+            self._parsed = True
+
+        return self._json
+
+
+class UpstreamClient:
+    """Асинхронный клиент к API Rt поверх общего пула keep-alive соединений"""
+
+    def __init__(
+        self,
+        pool: UpstreamPool | None = None,
+        guards: HostGuards | None = None,
+        call_timeout: float = 10.0,
+        connect_timeout: float = 3.0,
+        base_url_override: str | None = None,
+        metrics: MetricsRegistry | None = None,
+        logger: Logger | None = None,
+    ) -> None:
+        """
+        :param pool: Пул соединений по хостам Rt
+        :param guards: Предохранители и адаптивные лимиты по хостам Rt
+        :param call_timeout: Таймаут одного запроса, если маршрут не задал меньший бюджет
+        :param connect_timeout: Таймаут установки соединения
+        :param base_url_override: Адрес, на который перенаправляются все запросы к хостам Rt
+            (например, локальный стенд `tools/rt_stub.py`)
+        :param metrics: Реестр метрик (по умолчанию реестр процесса)
+        :param logger: Логгер
+        """
+        self.logger = logger or getLogger(__name__)
+        self.pool = pool or UpstreamPool()
+        self.guards = guards or HostGuards()
+        self.call_timeout = call_timeout
+        self.connect_timeout = connect_timeout
+        self.base_url_override = base_url_override
+        self.single_flight = SingleFlight()
+
+        self.metrics = metrics = metrics or REGISTRY
+        # Метки: endpoint, method
+        self.latency = metrics.meter.create_histogram(
+            "rt_upstream_request_duration_seconds",
+            description="Время запроса к Rt",
+            explicit_bucket_boundaries_advisory=DEFAULT_TIME_BUCKETS,
+        )
+        # Метки: endpoint, status
+        self.responses = metrics.meter.create_counter(
+            "rt_upstream_responses_total",
+            description=(
+                "Ответы Rt по статусу (timeout, error, unavailable, deadline - ответа не было)"
+            ),
+        )
+        # Метки: endpoint
+        self.payload_size = metrics.meter.create_histogram(
+            "rt_upstream_response_size_bytes",
+            description="Размер тела ответа Rt",
+            explicit_bucket_boundaries_advisory=DEFAULT_SIZE_BUCKETS,
+        )
+
+    def resolve(self, url: str) -> str:
+        """
+        Итоговый адрес запроса к Rt
+
+        Если задан `base_url_override`, хост заменяется на него, путь и параметры сохраняются.
+        Для websocket адресов схема подбирается по схеме `base_url_override` (http -> ws)
+        """
+        if not self.base_url_override:
+            return url
+
+        target = urlsplit(self.base_url_override)
+        source = urlsplit(url)
+        scheme = target.scheme
+        if source.scheme in {"ws", "wss"}:
+            scheme = "wss" if target.scheme == "https" else "ws"
+
+        return urlunsplit((scheme, target.netloc, source.path, source.query, source.fragment))
+
+    def _timeout(self, url: str) -> httpx.Timeout:
+        """
+        Таймаут запроса с учетом бюджета маршрута
+
+        :raises DeadlineExceededError: Бюджет маршрута уже исчерпан
+        """
+        timeout = self.call_timeout
+        deadline = current_deadline()
+        if deadline is not None:
+            if deadline.expired:
+                raise DeadlineExceededError(url, deadline.budget)
+            timeout = min(timeout, deadline.remaining())
+
+        return httpx.Timeout(timeout, connect=min(timeout, self.connect_timeout))
+
+    @staticmethod
+    def _clean_headers(headers: dict[str, str | None] | None) -> dict[str, str]:
+        """Убирает заголовки без значения (например, токен еще не получен)"""
+        if not headers:
+            return {}
+        return {key: value for key, value in headers.items() if value is not None}
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str | None] | None = None,
+        json: Any = None,
+        params: dict[str, Any] | None = None,
+        endpoint: str | None = None,
+    ) -> UpstreamResponse:
+        """
+        Выполнение запроса к Rt
+
+        :param method: HTTP-метод
+        :param url: Адрес запроса
+        :param headers: Заголовки
+        :param json: Тело запроса
+        :param params: Query параметры
+        :param endpoint: Метка эндпоинта для метрик (по умолчанию - шаблон пути)
+        :raises DeadlineExceededError: Исчерпан бюджет времени маршрута
+        :raises UpstreamUnavailableError: Хост деградировал, запрос не отправлялся
+        :raises UpstreamTimeoutError: Rt не ответил вовремя
+        :raises UpstreamError: Ошибка соединения с Rt
+        :return: :class:`UpstreamResponse`
+        """
+        endpoint = endpoint or endpoint_label(url)
+        started = monotonic()
+        try:
+            response = await self._send(method, url, headers, json, params)
+        except DeadlineExceededError:
+            self.responses.add(1, {"endpoint": endpoint, "status": "deadline"})
+            raise
+        except UpstreamTimeoutError:
+            self.responses.add(1, {"endpoint": endpoint, "status": "timeout"})
+            raise
+        except UpstreamUnavailableError:
+            self.responses.add(1, {"endpoint": endpoint, "status": "unavailable"})
+            raise
+        except UpstreamError:
+            self.responses.add(1, {"endpoint": endpoint, "status": "error"})
+            raise
+        finally:
+            self.latency.record(monotonic() - started, {"endpoint": endpoint, "method": method})
+
+        self.responses.add(1, {"endpoint": endpoint, "status": str(response.status_code)})
+        self.payload_size.record(len(response.content), {"endpoint": endpoint})
+        return response
+
+    async def _send(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str | None] | None,
+        json: Any,
+        params: dict[str, Any] | None,
+    ) -> UpstreamResponse:
+        """Запрос к Rt через предохранитель хоста и пул соединений"""
+        url = self.resolve(url)
+        timeout = self._timeout(url)
+        guard = self.guards.for_url(url)
+        async with guard.call(url):
+            started = monotonic()
+            try:
+                async with self.pool.track(url):
+                    response = await self.pool.client_for(url).request(
+                        method,
+                        url,
+                        headers=self._clean_headers(headers),
+                        json=json,
+                        params=params,
+                        timeout=timeout,
+                    )
+            except httpx.TimeoutException as e:
+                deadline = current_deadline()
+                if deadline is not None and deadline.expired:
+                    # Закончился бюджет маршрута, хост в этом не виноват
+                    raise DeadlineExceededError(url, deadline.budget) from e
+                guard.on_failure()
+                raise UpstreamTimeoutError(url, "Превышено время ожидания ответа от Rt") from e
+            except httpx.HTTPError as e:
+                guard.on_failure()
+                raise UpstreamError(url) from e
+
+            if response.status_code >= HTTPStatus.INTERNAL_SERVER_ERROR:
+                guard.on_failure()
+            else:
+                guard.on_success(monotonic() - started)
+
+        return UpstreamResponse(
+            status_code=response.status_code,
+            content=response.content,
+            url=url,
+        )
+
+    async def get(
+        self,
+        url: str,
+        headers: dict[str, str | None] | None = None,
+        params: dict[str, Any] | None = None,
+        coalesce: bool = True,
+        endpoint: str | None = None,
+    ) -> UpstreamResponse:
+        """
+        GET запрос к Rt
+
+        Одинаковые одновременные запросы (тот же url, параметры и токен) объединяются в один,
+        все ожидающие получают общий :class:`UpstreamResponse`, json которого разбирается один раз.
+        Общий запрос выполняется без бюджета маршрута, который его запустил (только с таймаутом
+        запроса), а каждый ожидающий ждет его не дольше своего бюджета
+
+        :param coalesce: Объединять с одинаковыми запросами, которые уже выполняются
+        :param endpoint: Метка эндпоинта для метрик
+        :raises DeadlineExceededError: Бюджет маршрута закончился раньше, чем пришел ответ
+        """
+        if not coalesce:
+            return await self.request(
+                "GET", url, headers=headers, params=params, endpoint=endpoint
+            )
+
+        key = (
+            url,
+            tuple(sorted((params or {}).items())),
+            (headers or {}).get("Authorization"),
+        )
+        deadline = current_deadline()
+        if deadline is not None and deadline.expired:
+            raise DeadlineExceededError(url, deadline.budget)
+
+        try:
+            return await self.single_flight.do(  # type: ignore[no-any-return]
+                key,
+                lambda: self.request("GET", url, headers=headers, params=params, endpoint=endpoint),
+                context=detached_context(),
+                timeout=deadline.remaining() if deadline is not None else None,
+            )
+        except TimeoutError as e:
+            if deadline is None:
+                raise
+            # Истек бюджет этого ожидающего, общий запрос продолжается для остальных
+            self.responses.add(
+                1, {"endpoint": endpoint or endpoint_label(url), "status": "deadline"}
+            )
+            raise DeadlineExceededError(url, deadline.budget) from e
+
+    async def post(
+        self,
+        url: str,
+        headers: dict[str, str | None] | None = None,
+        json: Any = None,
+        endpoint: str | None = None,
+    ) -> UpstreamResponse:
+        """POST запрос к Rt"""
+        return await self.request("POST", url, headers=headers, json=json, endpoint=endpoint)
+
+    async def aclose(self) -> None:
+        """Закрытие пула соединений"""
+        await self.pool.aclose()
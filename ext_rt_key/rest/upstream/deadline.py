@@ -0,0 +1,79 @@
+"""
+:mod:`deadline` -- Бюджет времени маршрута на запросы к Rt
+===================================
+.. moduleauthor:: ilya Barinov <i-barinov@it-serv.ru>
+"""
+
+from collections.abc import Generator
+from contextlib import contextmanager
+from contextvars import Context, ContextVar, copy_context
+from dataclasses import dataclass
+from time import monotonic
+
+__all__ = (
+    "Deadline",
+    "current_deadline",
+    "deadline_scope",
+    "detached_context",
+)
+
+
+@dataclass(frozen=True)
+class Deadline:
+    """Момент, к которому все запросы к Rt в рамках маршрута должны завершиться"""
+
+    budget: float
+    expires_at: float
+
+    def remaining(self) -> float:
+        """Оставшееся время в секундах"""
+        return max(0.0, self.expires_at - monotonic())
+
+    @property
+    def expired(self) -> bool:
+        """Бюджет исчерпан"""
+        return self.remaining() <= 0
+
+
+_current_deadline: ContextVar[Deadline | None] = ContextVar("upstream_deadline", default=None)
+
+
+def current_deadline() -> Deadline | None:
+    """Бюджет текущего маршрута (None если маршрут не ограничен)"""
+    return _current_deadline.get()
+
+
+def detached_context() -> Context:
+    """
+    Копия текущего контекста без бюджета маршрута
+
+    Для задач, результат которых ждут несколько маршрутов с разными бюджетами (например,
+    объединенный GET запрос): задача ограничена только таймаутом запроса, а каждый ожидающий
+    ждет ее не дольше своего бюджета
+    """
+    context = copy_context()
+    context.run(_current_deadline.set, None)
+    return context
+
+
+@contextmanager
+def deadline_scope(budget: float) -> Generator[Deadline]:
+    """
+    Ограничение всех запросов к Rt внутри блока общим бюджетом времени
+
+    Каждый запрос получает таймаут не больше оставшегося бюджета, так что последовательные
+    запросы делят бюджет между собой. Вложенный блок не может продлить внешний бюджет
+
+    :param budget: Бюджет в секундах
+    """
+    expires_at = monotonic() + budget
+    parent = _current_deadline.get()
+    if parent is not None:
+        expires_at = min(expires_at, parent.expires_at)
+
+    deadline = Deadline(budget=budget, expires_at=expires_at)
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
@@ -0,0 +1,76 @@
+"""
+:mod:`errors` -- Исключения при работе с API Rt
+===================================
+.. moduleauthor:: ilya Barinov <i-barinov@it-serv.ru>
+"""
+
+__all__ = (
+    "CircuitOpenError",
+    "DeadlineExceededError",
+    "UpstreamError",
+    "UpstreamOverloadedError",
+    "UpstreamStatusError",
+    "UpstreamTimeoutError",
+    "UpstreamUnavailableError",
+)
+
+
+class UpstreamError(Exception):
+    """Базовый класс для всех исключений, связанных с запросами к API Rt."""
+
+    def __init__(self, url: str, message: str = "Ошибка при обращении к Rt") -> None:
+        """
+        :param url: Адрес запроса
+        :param message: Описание ошибки
+        """
+        super().__init__(f"{message}: {url}")
+        self.url = url
+        self.message = message
+
+
+class UpstreamStatusError(UpstreamError):
+    """Исключение, выбрасываемое если Rt ответил неуспешным статусом."""
+
+    def __init__(self, url: str, status_code: int) -> None:
+        """
+        :param url: Адрес запроса
+        :param status_code: HTTP статус ответа
+        """
+        super().__init__(url, f"Rt ответил статусом {status_code}")
+        self.status_code = status_code
+
+
+class UpstreamTimeoutError(UpstreamError):
+    """Исключение, выбрасываемое если Rt не ответил за отведенное время."""
+
+
+class DeadlineExceededError(UpstreamTimeoutError):
+    """Исключение, выбрасываемое если исчерпан бюджет времени маршрута на запросы к Rt."""
+
+    def __init__(self, url: str, budget: float) -> None:
+        """
+        :param url: Адрес запроса, на котором закончился бюджет
+        :param budget: Бюджет маршрута в секундах
+        """
+        super().__init__(url, f"Исчерпан бюджет времени запроса ({budget:g} сек.)")
+        self.budget = budget
+
+
+class UpstreamUnavailableError(UpstreamError):
+    """Базовый класс для отказов без запроса к Rt, чтобы не нагружать деградировавший хост."""
+
+
+class CircuitOpenError(UpstreamUnavailableError):
+    """Исключение, выбрасываемое если предохранитель хоста разомкнут."""
+
+    def __init__(self, url: str) -> None:
+        """:param url: Адрес запроса"""
+        super().__init__(url, "Rt временно недоступен, попробуйте позже")
+
+
+class UpstreamOverloadedError(UpstreamUnavailableError):
+    """Исключение, выбрасываемое если превышен лимит одновременных запросов к хосту."""
+
+    def __init__(self, url: str) -> None:
+        """:param url: Адрес запроса"""
+        super().__init__(url, "Rt перегружен, попробуйте позже")
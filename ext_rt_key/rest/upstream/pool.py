@@ -0,0 +1,104 @@
+"""
+:mod:`pool` -- Пул keep-alive соединений к хостам Rt
+===================================
+.. moduleauthor:: ilya Barinov <i-barinov@it-serv.ru>
+"""
+
+from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass
+from typing import Any
+from urllib.parse import urlsplit
+
+import httpx
+
+__all__ = (
+    "HostStats",
+    "UpstreamPool",
+)
+
+
+@dataclass
+class HostStats:
+    """Статистика использования пула для одного хоста"""
+
+    requests: int = 0
+    errors: int = 0
+    in_flight: int = 0
+    max_in_flight: int = 0
+
+
+class UpstreamPool:
+    """
+    Общий на процесс пул соединений к Rt
+
+    Для каждого хоста (keyapis, household, vc) создается свой :class:`httpx.AsyncClient`,
+    поэтому лимит соединений и время жизни простаивающих соединений действуют на хост,
+    а медленный хост не забирает соединения у остальных
+    """
+
+    def __init__(
+        self,
+        max_connections_per_host: int = 20,
+        max_keepalive_per_host: int = 10,
+        keepalive_expiry: float = 30.0,
+    ) -> None:
+        """
+        :param max_connections_per_host: Максимум одновременных соединений к одному хосту
+        :param max_keepalive_per_host: Количество простаивающих соединений, удерживаемых для хоста
+        :param keepalive_expiry: Через сколько секунд простоя соединение закрывается
+        """
+        self._limits = httpx.Limits(
+            max_connections=max_connections_per_host,
+            max_keepalive_connections=max_keepalive_per_host,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._clients: dict[str, httpx.AsyncClient] = {}
+        self._stats: dict[str, HostStats] = {}
+
+    @staticmethod
+    def host_of(url: str) -> str:
+        """Хост (с портом) из url"""
+        return urlsplit(url).netloc
+
+    def client_for(self, url: str) -> httpx.AsyncClient:
+        """Клиент для хоста из url, создается при первом обращении"""
+        host = self.host_of(url)
+        client = self._clients.get(host)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(limits=self._limits)
+            self._clients[host] = client
+
+        return client
+
+    @asynccontextmanager
+    async def track(self, url: str) -> AsyncGenerator[None]:
+        """Учет запроса к хосту в статистике пула"""
+        stats = self._stats.setdefault(self.host_of(url), HostStats())
+        stats.requests += 1
+        stats.in_flight += 1
+        stats.max_in_flight = max(stats.max_in_flight, stats.in_flight)
+        try:
+            yield
+        except BaseException:
+            stats.errors += 1
+            raise
+        finally:
+            stats.in_flight -= 1
+
+    def stats(self) -> dict[str, Any]:
+        """Статистика использования пула по хостам"""
+        return {
+            "limits": {
+                "max_connections_per_host": self._limits.max_connections,
+                "max_keepalive_per_host": self._limits.max_keepalive_connections,
+                "keepalive_expiry": self._limits.keepalive_expiry,
+            },
+            "hosts": {host: asdict(stats) for host, stats in self._stats.items()},
+        }
+
+    async def aclose(self) -> None:
+        """Закрытие всех соединений"""
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
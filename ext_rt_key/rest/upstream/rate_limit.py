@@ -0,0 +1,148 @@
+"""
+:mod:`rate_limit` -- Ограничение частоты запросов к авторизации Rt
+===================================
+.. moduleauthor:: ilya Barinov <i-barinov@it-serv.ru>
+"""
+
+from time import monotonic
+from typing import Any
+
+from ext_rt_key.rest.upstream.cache import TTLCache
+
+__all__ = (
+    "AuthRateLimiter",
+    "TokenBucket",
+)
+
+
+class TokenBucket:
+    """Корзина токенов: `capacity` запросов сразу, дальше `rate` запросов в секунду"""
+
+    def __init__(self, rate: float, capacity: int) -> None:
+        """
+        :param rate: Скорость пополнения, токенов в секунду
+        :param capacity: Размер корзины (допустимый всплеск)
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = monotonic()
+
+    def _refill(self) -> None:
+        now = monotonic()
+        self.tokens = min(float(self.capacity), self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self) -> float:
+        """Через сколько секунд появится токен (0 - токен есть)"""
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        """Забрать токен (перед этим надо убедиться, что `wait_time` равен 0)"""
+        self.tokens -= 1
+
+
+class AuthRateLimiter:
+    """
+    Ограничение запросов к авторизации Rt по логину и в целом по сервису
+
+    Помимо корзин токенов запоминает паузу, которую Rt требует после ответа `intervalExceeded`:
+    пока пауза не прошла, запросы по логину отклоняются без обращения к Rt. Каждый следующий
+    `intervalExceeded` подряд удваивает паузу, успешный запрос сбрасывает ее
+    """
+
+    def __init__(
+        self,
+        login_rate_per_minute: float = 5.0,
+        login_burst: int = 5,
+        global_rate_per_second: float = 10.0,
+        global_burst: int = 20,
+        cooldown_initial: float = 60.0,
+        cooldown_max: float = 900.0,
+        max_logins: int = 10000,
+    ) -> None:
+        """
+        :param login_rate_per_minute: Запросов в минуту для одного логина
+        :param login_burst: Допустимый всплеск запросов одного логина
+        :param global_rate_per_second: Запросов в секунду для всего сервиса
+        :param global_burst: Допустимый всплеск запросов всего сервиса
+        :param cooldown_initial: Пауза после первого `intervalExceeded`, сек.
+        :param cooldown_max: Максимальная пауза, сек.
+        :param max_logins: Сколько логинов отслеживается одновременно
+        """
+        self.login_rate = login_rate_per_minute / 60
+        self.login_burst = login_burst
+        self.cooldown_initial = cooldown_initial
+        self.cooldown_max = cooldown_max
+
+        self._global = TokenBucket(rate=global_rate_per_second, capacity=global_burst)
+        # Неактивная корзина за это время все равно наполнилась бы, ее можно забыть
+        bucket_ttl = max(login_burst / self.login_rate, cooldown_max)
+        self._buckets: TTLCache[str, TokenBucket] = TTLCache(ttl=bucket_ttl, max_size=max_logins)
+        # Момент окончания паузы по логину
+        self._cooldown_until: TTLCache[str, float] = TTLCache(
+            ttl=cooldown_max, max_size=max_logins
+        )
+        # Последняя назначенная пауза по логину (для удвоения)
+        self._cooldown_last: TTLCache[str, float] = TTLCache(
+            ttl=cooldown_max * 2, max_size=max_logins
+        )
+        self.rejected = 0
+
+    def _bucket(self, login: str) -> TokenBucket:
+        bucket = self._buckets.get(login)
+        if bucket is None:
+            bucket = TokenBucket(rate=self.login_rate, capacity=self.login_burst)
+        # Продлеваем жизнь корзины при каждом обращении
+        self._buckets.set(login, bucket)
+        return bucket
+
+    def acquire(self, login: str) -> float:
+        """
+        Попытка выполнить запрос к авторизации Rt
+
+        :param login: Логин
+        :return: 0 если запрос разрешен, иначе через сколько секунд можно повторить
+        """
+        until = self._cooldown_until.get(login)
+        if until is not None and until > monotonic():
+            self.rejected += 1
+            return until - monotonic()
+
+        bucket = self._bucket(login)
+        wait = max(bucket.wait_time(), self._global.wait_time())
+        if wait > 0:
+            self.rejected += 1
+            return wait
+
+        bucket.take()
+        self._global.take()
+        return 0.0
+
+    def on_interval_exceeded(self, login: str) -> float:
+        """
+        Rt ответил `intervalExceeded`
+
+        :return: Назначенная пауза в секундах
+        """
+        last = self._cooldown_last.get(login)
+        cooldown = self.cooldown_initial if last is None else min(last * 2, self.cooldown_max)
+        self._cooldown_last.set(login, cooldown)
+        self._cooldown_until.set(login, monotonic() + cooldown, ttl=cooldown)
+        return cooldown
+
+    def on_success(self, login: str) -> None:
+        """Запрос по логину прошел, выученная пауза сбрасывается"""
+        self._cooldown_last.invalidate(login)
+        self._cooldown_until.invalidate(login)
+
+    def stats(self) -> dict[str, Any]:
+        """Статистика ограничений"""
+        return {
+            "rejected": self.rejected,
+            "tracked_logins": len(self._buckets),
+            "cooling_down": len(self._cooldown_until),
+        }
@@ -0,0 +1,292 @@
+"""
+:mod:`resilience` -- Защита от деградации хостов Rt
+===================================
+.. moduleauthor:: ilya Barinov <i-barinov@it-serv.ru>
+"""
+
+import asyncio
+from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
+from enum import Enum
+from time import monotonic
+from typing import Any
+from urllib.parse import urlsplit
+
+from ext_rt_key.rest.upstream.deadline import current_deadline
+from ext_rt_key.rest.upstream.errors import CircuitOpenError, UpstreamOverloadedError
+
+__all__ = (
+    "AdaptiveLimiter",
+    "BreakerState",
+    "CircuitBreaker",
+    "HostGuard",
+    "HostGuards",
+)
+
+
+class BreakerState(Enum):
+    """Состояния предохранителя"""
+
+    closed = "closed"
+    open = "open"
+    half_open = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Предохранитель для хоста Rt
+
+    После `failure_threshold` ошибок подряд размыкается и сразу отклоняет запросы. Через
+    `recovery_timeout` секунд пропускает пробный запрос (half-open): успех замыкает
+    предохранитель, ошибка снова размыкает
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+    ) -> None:
+        """
+        :param failure_threshold: Количество ошибок подряд для размыкания
+        :param recovery_timeout: Время в разомкнутом состоянии до пробного запроса
+        :param half_open_max_calls: Количество одновременных пробных запросов
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self.state = BreakerState.closed
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.half_open_calls = 0
+        self.rejected = 0
+
+    def before_call(self, url: str) -> None:
+        """
+        Проверка перед запросом
+
+        :raises CircuitOpenError: Предохранитель разомкнут
+        """
+        if self.state == BreakerState.open:
+            if self.opened_at is not None and monotonic() - self.opened_at < self.recovery_timeout:
+                self.rejected += 1
+                raise CircuitOpenError(url)
+            self.state = BreakerState.half_open
+            self.half_open_calls = 0
+            self.opened_at = monotonic()
+
+        if self.state == BreakerState.half_open:
+            # Пробный запрос мог быть отменен и не сообщить результат - тогда разрешаем новый
+            probe_stale = (
+                self.opened_at is not None and monotonic() - self.opened_at >= self.recovery_timeout
+            )
+            if self.half_open_calls >= self.half_open_max_calls and not probe_stale:
+                self.rejected += 1
+                raise CircuitOpenError(url)
+            if probe_stale:
+                self.half_open_calls = 0
+                self.opened_at = monotonic()
+            self.half_open_calls += 1
+
+    def on_success(self) -> None:
+        """Успешный запрос"""
+        self.state = BreakerState.closed
+        self.failures = 0
+        self.opened_at = None
+
+    def on_failure(self) -> None:
+        """Неудачный запрос"""
+        self.failures += 1
+        if self.state == BreakerState.half_open or self.failures >= self.failure_threshold:
+            self.state = BreakerState.open
+            self.opened_at = monotonic()
+
+    def stats(self) -> dict[str, Any]:
+        """Состояние предохранителя"""
+        return {
+            "state": self.state.value,
+            "failures": self.failures,
+            "rejected": self.rejected,
+        }
+
+
+class AdaptiveLimiter:
+    """
+    Адаптивный лимит одновременных запросов к хосту (AIMD)
+
+    Пока хост отвечает быстрее `latency_target`, лимит растет примерно на единицу за "окно"
+    запросов. Ошибка или медленный ответ уменьшают лимит в `1 / backoff` раз
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 10,
+        min_limit: int = 1,
+        max_limit: int = 50,
+        latency_target: float = 2.0,
+        backoff: float = 0.5,
+        max_wait: float = 1.0,
+    ) -> None:
+        """
+        :param initial_limit: Начальный лимит
+        :param min_limit: Минимальный лимит
+        :param max_limit: Максимальный лимит
+        :param latency_target: Время ответа, выше которого хост считается перегруженным
+        :param backoff: Множитель уменьшения лимита
+        :param max_wait: Сколько запрос может ждать свободного места, прежде чем будет отклонен
+        """
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.max_wait = max_wait
+
+        self.in_flight = 0
+        self.rejected = 0
+        self._condition = asyncio.Condition()
+
+    def _has_capacity(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    @asynccontextmanager
+    async def slot(self, url: str) -> AsyncGenerator[None]:
+        """
+        Место для запроса в рамках текущего лимита
+
+        :raises UpstreamOverloadedError: Место не освободилось за `max_wait`
+        """
+        wait = self.max_wait
+        deadline = current_deadline()
+        if deadline is not None:
+            wait = min(wait, deadline.remaining())
+
+        async with self._condition:
+            if not self._has_capacity():
+                try:
+                    await asyncio.wait_for(self._condition.wait_for(self._has_capacity), wait)
+                except TimeoutError:
+                    self.rejected += 1
+                    raise UpstreamOverloadedError(url) from None
+            self.in_flight += 1
+
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.in_flight -= 1
+                self._condition.notify()
+
+    def on_success(self, latency: float) -> None:
+        """Успешный ответ за `latency` секунд"""
+        if latency > self.latency_target:
+            self._decrease()
+            return
+        self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+
+    def on_failure(self) -> None:
+        """Ошибка запроса"""
+        self._decrease()
+
+    def _decrease(self) -> None:
+        self.limit = max(float(self.min_limit), self.limit * self.backoff)
+
+    def stats(self) -> dict[str, Any]:
+        """Состояние лимита"""
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "rejected": self.rejected,
+        }
+
+
+class HostGuard:
+    """Предохранитель и адаптивный лимит одного хоста"""
+
+    def __init__(self, breaker: CircuitBreaker, limiter: AdaptiveLimiter) -> None:  # noqa: D107
+        self.breaker = breaker
+        self.limiter = limiter
+
+    @asynccontextmanager
+    async def call(self, url: str) -> AsyncGenerator[None]:
+        """
+        Запрос через предохранитель и лимит
+
+        :raises CircuitOpenError: Предохранитель разомкнут
+        :raises UpstreamOverloadedError: Превышен лимит одновременных запросов
+        """
+        self.breaker.before_call(url)
+        async with self.limiter.slot(url):
+            yield
+
+    def on_success(self, latency: float) -> None:
+        """Хост ответил"""
+        self.breaker.on_success()
+        self.limiter.on_success(latency)
+
+    def on_failure(self) -> None:
+        """Хост не ответил или ответил ошибкой 5xx"""
+        self.breaker.on_failure()
+        self.limiter.on_failure()
+
+    def stats(self) -> dict[str, Any]:
+        """Состояние защиты хоста"""
+        return {
+            "breaker": self.breaker.stats(),
+            "limiter": self.limiter.stats(),
+        }
+
+
+class HostGuards:
+    """Защита хостов Rt, создается отдельно на каждый хост"""
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        initial_limit: int = 10,
+        min_limit: int = 1,
+        max_limit: int = 50,
+        latency_target: float = 2.0,
+    ) -> None:
+        """
+        :param failure_threshold: Количество ошибок подряд для размыкания предохранителя
+        :param recovery_timeout: Время в разомкнутом состоянии до пробного запроса
+        :param initial_limit: Начальный лимит одновременных запросов
+        :param min_limit: Минимальный лимит одновременных запросов
+        :param max_limit: Максимальный лимит одновременных запросов
+        :param latency_target: Время ответа, выше которого хост считается перегруженным
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self._guards: dict[str, HostGuard] = {}
+
+    def for_url(self, url: str) -> HostGuard:
+        """Защита хоста из url"""
+        host = urlsplit(url).netloc
+        guard = self._guards.get(host)
+        if guard is None:
+            guard = HostGuard(
+                breaker=CircuitBreaker(
+                    failure_threshold=self.failure_threshold,
+                    recovery_timeout=self.recovery_timeout,
+                ),
+                limiter=AdaptiveLimiter(
+                    initial_limit=self.initial_limit,
+                    min_limit=self.min_limit,
+                    max_limit=self.max_limit,
+                    latency_target=self.latency_target,
+                ),
+            )
+            self._guards[host] = guard
+
+        return guard
+
+    def stats(self) -> dict[str, Any]:
+        """Состояние защиты по хостам"""
+        return {host: guard.stats() for host, guard in self._guards.items()}
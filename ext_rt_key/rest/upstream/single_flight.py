@@ -0,0 +1,75 @@
+"""
+:mod:`single_flight` -- Объединение одинаковых одновременных запросов к Rt
+===================================
+.. moduleauthor:: ilya Barinov <i-barinov@it-serv.ru>
+"""
+
+import asyncio
+from collections.abc import Callable, Coroutine, Hashable
+from contextvars import Context
+from typing import Any
+
+__all__ = ("SingleFlight",)
+
+
+class SingleFlight:
+    """
+    Выполняет не более одного запроса на ключ одновременно
+
+    Первый вызов с ключом запускает запрос, остальные вызовы с тем же ключом, пришедшие до его
+    завершения, ждут и получают тот же результат (или то же исключение)
+    """
+
+    def __init__(self) -> None:  # noqa: D107
+        self._calls: dict[Hashable, asyncio.Task[Any]] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(
+        self,
+        key: Hashable,
+        fn: Callable[[], Coroutine[Any, Any, Any]],
+        context: Context | None = None,
+        timeout: float | None = None,
+    ) -> Any:
+        """
+        Выполнение запроса с объединением по ключу
+
+        Запрос выполняется в отдельной задаче, поэтому отмена одного из ожидающих (например,
+        клиент закрыл соединение или истек его `timeout`) не отменяет запрос для остальных
+
+        :param key: Ключ запроса
+        :param fn: Функция, выполняющая запрос
+        :param context: Контекст, в котором запускается запрос (если запрос еще не выполняется)
+        :param timeout: Сколько этот вызов ждет результата, сек.
+        :raises TimeoutError: Результат не получен за `timeout`
+        :return: Результат запроса
+        """
+        task = self._calls.get(key)
+        if task is None:
+            self.started += 1
+            task = asyncio.get_running_loop().create_task(fn(), context=context)
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+            task.add_done_callback(self._consume_exception)
+        else:
+            self.coalesced += 1
+
+        return await asyncio.wait_for(asyncio.shield(task), timeout)
+
+    @staticmethod
+    def _consume_exception(task: asyncio.Task[Any]) -> None:
+        """
+        Исключение запроса считается полученным, даже если все ожидающие ушли по `timeout`
+        или были отменены (иначе asyncio пишет "Task exception was never retrieved")
+        """
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict[str, int]:
+        """Статистика объединения запросов"""
+        return {
+            "in_flight": len(self._calls),
+            "started": self.started,
+            "coalesced": self.coalesced,
+        }
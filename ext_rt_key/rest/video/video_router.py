@@ -5,17 +5,26 @@
 """
 
 import datetime
+from http import HTTPStatus
+from time import monotonic
 
-import requests
 import websockets
 from fastapi import WebSocket, WebSocketDisconnect
 from fastapi.responses import HTMLResponse
 
 from ext_rt_key.models.db import Login
 from ext_rt_key.rest.common import RoutsCommon
+from ext_rt_key.rest.upstream.errors import UpstreamError
 
 __all__ = ("VideoRouter",)
 
+URL_STREAM = (
+    "wss://live-vdk4.camera.rt.ru/stream/{}/{}.mp4"
+    "?mp4-fragment-length=0.5&mp4-use-speed=0&mp4-afiller=1&token={}"
+)
+# Метка трансляции в метриках upstream запросов
+ENDPOINT_STREAM = "stream"
+
 
 class VideoRouter(RoutsCommon):
     """Роутер для авторизации и видео трансляции"""
@@ -89,34 +98,57 @@ class VideoRouter(RoutsCommon):
         self.logger.info(f"Подключение к WebSocket... с  {login}")
 
         with self.db_helper.sessionmanager() as session:
-            user_model = session.query(Login).filter(Login.login == login).first()
-            if not user_model:
+            user_login = session.query(Login.login).filter(Login.login == login).scalar()
+            if not user_login:
                 await websocket.close()
                 return
-            rt_key = user_model.token
 
         # Получение всех токенов к камере
-        # Он тяжелый аккуратно надо, учитывая что их будет несоклько
-        headers = {
-            "Authorization": rt_key,
-        }
-        response = requests.get(
-            "https://vc.key.rt.ru/api/v1/cameras?limit=100&offset=0",
-            headers=headers,
-        )
+        # Он тяжелый, поэтому берется из общего с выгрузкой устройств кэша
+        rt_helper = await self.rt_manger.helper(user_login)
+        try:
+            response_data = await rt_helper.fetch_cameras()
+        except UpstreamError as e:
+            self.logger.info(f"Не удалось получить камеры: {e}")
+            await websocket.close()
+            return
 
-        response_data = response.json().get("data").get("items")
+        if not response_data:
+            await websocket.close()
+            return
 
         id_ = response_data[10].get("id", {})
         streamer_token = response_data[10].get("streamer_token", {})
 
-        ws_steam_url = f"wss://live-vdk4.camera.rt.ru/stream/{id_}/{int(datetime.datetime.now(datetime.UTC).timestamp())}.mp4?mp4-fragment-length=0.5&mp4-use-speed=0&mp4-afiller=1&token={streamer_token}"
+        ws_steam_url = self.rt_manger.client.resolve(
+            URL_STREAM.format(
+                id_,
+                int(datetime.datetime.now(datetime.UTC).timestamp()),
+                streamer_token,
+            )
+        )
 
+        # Время подключения и размеры фрагментов пишутся в те же метрики, что и http запросы
+        client = self.rt_manger.client
+        connected = False
+        started = monotonic()
         try:
             async with websockets.connect(ws_steam_url) as ws_client:
+                connected = True
+                client.latency.record(
+                    monotonic() - started, {"endpoint": ENDPOINT_STREAM, "method": "WS"}
+                )
+                client.responses.add(
+                    1,
+                    {
+                        "endpoint": ENDPOINT_STREAM,
+                        "status": str(HTTPStatus.SWITCHING_PROTOCOLS.value),
+                    },
+                )
                 while True:
                     data = await ws_client.recv()
                     if isinstance(data, bytes):
+                        client.payload_size.record(len(data), {"endpoint": ENDPOINT_STREAM})
                         await websocket.send_bytes(data)
                     else:
                         self.logger.info(f"Получено текстовое сообщение: {data}")
@@ -126,6 +158,8 @@ class VideoRouter(RoutsCommon):
         except WebSocketDisconnect:
             self.logger.info("WebSocket клиент отключился.")
         except Exception as e:
+            if not connected:
+                client.responses.add(1, {"endpoint": ENDPOINT_STREAM, "status": "error"})
             self.logger.info(f"Ошибка при подключении к WebSocket: {e}")
         finally:
             await websocket.close()
@@ -0,0 +1,111 @@
+"""
+:mod:`json_codec` -- Кодек JSON для ответов Rt и ответов сервиса
+===================================
+.. moduleauthor:: ilya Barinov <i-barinov@it-serv.ru>
+"""
+
+import json
+from dataclasses import dataclass
+from typing import Any, Protocol
+
+import orjson
+
+__all__ = (
+    "JSONCodec",
+    "OrjsonCodec",
+    "StdlibCodec",
+    "dumps",
+    "get_codec",
+    "loads",
+    "set_codec",
+)
+
+
+class JSONCodec(Protocol):
+    """Интерфейс кодека"""
+
+    name: str
+
+    def loads(self, data: bytes | str) -> Any:
+        """Разбор JSON"""
+
+    def dumps(self, obj: Any) -> bytes:
+        """Сериализация в JSON (utf-8)"""
+
+
+class StdlibCodec:
+    """Кодек на стандартном модуле :mod:`json`"""
+
+    name = "stdlib"
+
+    @staticmethod
+    def loads(data: bytes | str) -> Any:  # noqa: D102
+        return json.loads(data)
+
+    @staticmethod
+    def dumps(obj: Any) -> bytes:  # noqa: D102
+        return json.dumps(
+            obj,
+            ensure_ascii=False,
+            allow_nan=False,
+            separators=(",", ":"),
+        ).encode("utf-8")
+
+
+class OrjsonCodec:
+    """Кодек на :mod:`orjson`"""
+
+    name = "orjson"
+
+    @staticmethod
+    def loads(data: bytes | str) -> Any:  # noqa: D102
+        return orjson.loads(data)
+
+    @staticmethod
+    def dumps(obj: Any) -> bytes:  # noqa: D102
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+
+_CODECS: dict[str, type[StdlibCodec] | type[OrjsonCodec]] = {
+    StdlibCodec.name: StdlibCodec,
+    OrjsonCodec.name: OrjsonCodec,
+}
+
+
+@dataclass
+class _CodecHolder:
+    """Текущий кодек модуля (меняется через :func:`set_codec`)"""
+
+    codec: JSONCodec
+
+
+_current = _CodecHolder(OrjsonCodec())
+
+
+def set_codec(name: str = OrjsonCodec.name) -> JSONCodec:
+    """
+    Выбор кодека
+
+    :param name: `orjson` (по умолчанию) или `stdlib`
+    :return: Выбранный кодек
+    """
+    if name not in _CODECS:
+        raise ValueError(f"Неизвестный кодек JSON: {name}")
+
+    _current.codec = _CODECS[name]()
+    return _current.codec
+
+
+def get_codec() -> JSONCodec:
+    """Текущий кодек"""
+    return _current.codec
+
+
+def loads(data: bytes | str) -> Any:
+    """Разбор JSON текущим кодеком"""
+    return _current.codec.loads(data)
+
+
+def dumps(obj: Any) -> bytes:
+    """Сериализация в JSON текущим кодеком"""
+    return _current.codec.dumps(obj)
@@ -0,0 +1,63 @@
+"""
+:mod:`metrics` -- Метрики процесса
+===================================
+.. moduleauthor:: ilya Barinov <i-barinov@it-serv.ru>
+"""
+
+from opentelemetry.exporter.prometheus import PrometheusMetricReader
+from opentelemetry.metrics import Meter
+from opentelemetry.sdk.metrics import MeterProvider
+from prometheus_client import CollectorRegistry, CONTENT_TYPE_LATEST, generate_latest
+
+__all__ = (
+    "CONTENT_TYPE",
+    "DEFAULT_SIZE_BUCKETS",
+    "DEFAULT_TIME_BUCKETS",
+    "REGISTRY",
+    "MetricsRegistry",
+)
+
+# Границы корзин для времени в секундах
+DEFAULT_TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Границы корзин для размеров в байтах
+DEFAULT_SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Тип содержимого выгрузки метрик
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+
+class MetricsRegistry:
+    """
+    Метрики процесса на OpenTelemetry
+
+    Инструменты создаются через :attr:`meter` (повторное создание с тем же именем возвращает
+    тот же инструмент), выгрузка в текстовом формате Prometheus - через `PrometheusMetricReader`.
+    У каждого реестра свой `CollectorRegistry`, поэтому несколько реестров в одном процессе
+    (например, в тестах) не конфликтуют
+    """
+
+    def __init__(self, name: str = "ext_rt_key") -> None:
+        """:param name: Имя meter'а (область инструментирования)"""
+        self.collector_registry = CollectorRegistry()
+        self.provider = MeterProvider(
+            metric_readers=[
+                PrometheusMetricReader(
+                    disable_target_info=True,
+                    scope_info_enabled=False,
+                    registry=self.collector_registry,
+                )
+            ]
+        )
+        self.meter: Meter = self.provider.get_meter(name)
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        return generate_latest(self.collector_registry).decode()
+
+    def shutdown(self) -> None:
+        """Остановка провайдера метрик"""
+        self.provider.shutdown()
+
+
+# Реестр процесса по умолчанию
+REGISTRY = MetricsRegistry()
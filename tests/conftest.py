@@ -0,0 +1,71 @@
+"""
+Общие фикстуры тестов
+
+Тесты, которым нужна база, запускаются только на PostgreSQL (upsert и COPY не переносимы) и
+пропускаются, если не задана переменная окружения TEST_DATABASE_URL, например::
+
+    TEST_DATABASE_URL=postgresql://postgres@127.0.0.1:5432/test python -m pytest tests
+"""
+
+import os
+from collections.abc import Iterator
+
+import pytest
+from sqlalchemy import create_engine
+
+from ext_rt_key.models import db as models
+from ext_rt_key.utils.db_helper import DBHelper
+
+# Настройки приложения читаются при импорте DI-контейнера (например, из модуля bulk)
+for name, value in {
+    "POSTGRES_USER": "postgres",
+    "POSTGRES_PASSWORD": "postgres",
+    "POSTGRES_HOST": "127.0.0.1",
+    "POSTGRES_PORT": "5432",
+    "POSTGRES_DB": "test",
+}.items():
+    os.environ.setdefault(name, value)
+
+
+@pytest.fixture
+def db_helper() -> Iterator[DBHelper]:
+    """Подключение к пустой тестовой базе (таблицы создаются заново для каждого теста)"""
+    url = os.environ.get("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL не задан")
+
+    engine = create_engine(url)
+    models.Base.metadata.drop_all(engine)
+    models.Base.metadata.create_all(engine)
+    try:
+        yield DBHelper(engine=engine)
+    finally:
+        models.Base.metadata.drop_all(engine)
+        engine.dispose()
+
+
+class Clock:
+    """Подменяемый `monotonic`: время идет только через :meth:`advance`"""
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> Clock:
+    """Часы модулей `ext_rt_key.rest.upstream`"""
+    clock = Clock()
+    for module in (
+        "ext_rt_key.rest.upstream.cache",
+        "ext_rt_key.rest.upstream.deadline",
+        "ext_rt_key.rest.upstream.rate_limit",
+        "ext_rt_key.rest.upstream.resilience",
+    ):
+        monkeypatch.setattr(f"{module}.monotonic", clock)
+    return clock
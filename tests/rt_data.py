@@ -0,0 +1,62 @@
+"""
+Данные Rt и логины для тестов синхронизации
+"""
+
+import asyncio
+from typing import Any
+
+from ext_rt_key.models import db as models
+from ext_rt_key.rest.helper import RTHelper
+from ext_rt_key.utils.db_helper import DBHelper
+
+
+def add_login(db_helper: DBHelper, login: str, jwt_token: str = "jwt") -> int:
+    """Пользователь с одним логином, возвращается id логина"""
+    with db_helper.sessionmanager() as session:
+        user = models.User(secret_key="secret", jwt_token=jwt_token)
+        row = models.Login(login=login, token=f"token-{login}", user=user)
+        session.add(row)
+        session.flush()
+        return row.id
+
+
+def camera(rt_id: str, **values: Any) -> dict[str, Any]:
+    """Камера в формате ответа Rt"""
+    return {
+        "id": rt_id,
+        "archive_length": 7,
+        "screenshot_url_template": f"https://media.camera.rt.ru/image/{rt_id}",
+        "screenshot_token": "screenshot",
+        "streamer_token": "streamer",
+        **values,
+    }
+
+
+def device(rt_id: str, camera_id: str | None = None, **values: Any) -> dict[str, Any]:
+    """Домофон в формате ответа Rt"""
+    return {
+        "id": rt_id,
+        "device_type": "intercom",
+        "camera_id": camera_id,
+        "description": f"Домофон {rt_id}",
+        "is_favorite": False,
+        "name_by_user": None,
+        **values,
+    }
+
+
+def rt_helper(db_helper: DBHelper, login: str, lists: list[Any]) -> RTHelper:
+    """
+    RTHelper, который вместо обращения к Rt отдает `lists[0]`
+
+    :param lists: Изменяемый список из одного элемента (камеры, домофоны, шлагбаумы), чтобы
+        тест мог подменить ответ Rt между синхронизациями
+    """
+    helper = RTHelper(db_helper, login=login)
+
+    async def fetch_device_lists() -> Any:
+        await asyncio.sleep(0)
+        return lists[0]
+
+    helper.fetch_device_lists = fetch_device_lists  # type: ignore[method-assign]
+    return helper
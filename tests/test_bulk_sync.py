@@ -0,0 +1,101 @@
+"""
+Перенос пачки логинов массовой синхронизации
+"""
+
+import asyncio
+
+from rt_data import add_login, camera, device, rt_helper
+from sqlalchemy import select
+
+from ext_rt_key.models import db as models
+from ext_rt_key.rest.devices.snapshots import DEVICE_LISTS
+from ext_rt_key.rest.helper import rows_fingerprint, RTHelper
+from ext_rt_key.rest.manager import RTManger
+from ext_rt_key.rest.sync.bulk import BulkSync, BulkSyncResult, LoginSnapshot
+
+
+def snapshot(db_helper, login_id, cameras, devices):
+    helper = RTHelper(db_helper, login=str(login_id))
+    camera_rows = helper.camera_rows(cameras, login_id)
+    device_rows = helper.device_rows(devices, login_id)
+    return LoginSnapshot(
+        login_id=login_id,
+        cameras=camera_rows,
+        devices=device_rows,
+        cameras_fingerprint=rows_fingerprint(camera_rows),
+        devices_fingerprint=rows_fingerprint(device_rows),
+    )
+
+
+def test_batch_merges_every_login(db_helper):
+    first = add_login(db_helper, "79000000001")
+    second = add_login(db_helper, "79000000002")
+    snapshots = [
+        snapshot(db_helper, first, [camera("c1")], [device("d1", "c1")]),
+        snapshot(db_helper, second, [camera("c2")], [device("d2"), device("d3", "c2")]),
+    ]
+
+    result = BulkSyncResult()
+    BulkSync(rt_manger=None, db_helper=db_helper)._merge_batch(snapshots, result)
+
+    assert (result.failed, result.cameras_copied, result.devices_inserted) == (0, 2, 3)
+    with db_helper.sessionmanager() as session:
+        fingerprints = session.execute(
+            select(models.Login.devices_fingerprint).order_by(models.Login.id)
+        ).scalars()
+        assert list(fingerprints) == [s.devices_fingerprint for s in snapshots]
+        # Готовые ответы удаляются в транзакции переноса и собираются после нее
+        kinds = session.execute(
+            select(models.DeviceSnapshot.login_id, models.DeviceSnapshot.kind)
+        ).all()
+        assert sorted(kinds) == sorted(
+            (login_id, kind) for login_id in (first, second) for kind in DEVICE_LISTS
+        )
+
+
+def test_bad_login_does_not_roll_back_the_batch(db_helper):
+    good = add_login(db_helper, "79000000001")
+    bad = add_login(db_helper, "79000000002")
+    snapshots = [
+        snapshot(db_helper, good, [camera("c1")], [device("d1", "c1")]),
+        # Устройство ссылается на камеру, которой нет ни в базе, ни в пачке
+        snapshot(db_helper, bad, [], [device("d2", "missing")]),
+    ]
+
+    result = BulkSyncResult()
+    BulkSync(rt_manger=None, db_helper=db_helper)._merge_batch(snapshots, result)
+
+    assert (result.failed, result.devices_inserted) == (1, 1)
+    with db_helper.sessionmanager() as session:
+        assert list(session.execute(select(models.Devices.rt_id)).scalars()) == ["d1"]
+        assert session.get(models.Login, bad).devices_fingerprint is None
+
+
+def test_shared_rows_go_to_the_earlier_login_of_the_batch(db_helper):
+    first = add_login(db_helper, "79000000001")
+    second = add_login(db_helper, "79000000002")
+    snapshots = [
+        snapshot(db_helper, second, [camera("c1")], [device("d1", "c1")]),
+        snapshot(db_helper, first, [camera("c1", archive_length=30)], [device("d1", "c1")]),
+    ]
+
+    BulkSync(rt_manger=None, db_helper=db_helper)._merge_batch(snapshots, BulkSyncResult())
+
+    with db_helper.sessionmanager() as session:
+        owner = session.execute(select(models.Cameras.login_id, models.Cameras.archive_length))
+        assert tuple(owner.one()) == (second, 7)
+        assert session.execute(select(models.Devices.login_id)).scalar_one() == second
+
+
+def test_devices_are_not_fetched_into_batch_without_cameras(db_helper):
+    login_id = add_login(db_helper, "79000000001")
+    rt_manger = RTManger(db_helper)
+    lists = [(None, [device("d1", "c1")], [])]
+    rt_manger.helpers.set("79000000001", rt_helper(db_helper, "79000000001", lists))
+
+    fetched = asyncio.run(
+        BulkSync(rt_manger=rt_manger, db_helper=db_helper)._fetch(
+            asyncio.Semaphore(1), login_id, "79000000001", None, None
+        )
+    )
+    assert (fetched.cameras, fetched.devices) == (None, None)
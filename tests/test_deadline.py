@@ -0,0 +1,62 @@
+"""
+Бюджет времени маршрута на запросы к Rt
+"""
+
+import asyncio
+
+import pytest
+
+from ext_rt_key.rest.upstream.client import UpstreamClient
+from ext_rt_key.rest.upstream.deadline import current_deadline, deadline_scope
+from ext_rt_key.rest.upstream.errors import DeadlineExceededError
+
+URL = "https://household.key.rt.ru/api/v2/app/devices/intercom"
+
+
+def test_scope_sets_and_resets_deadline(clock):
+    assert current_deadline() is None
+    with deadline_scope(5.0) as deadline:
+        assert current_deadline() is deadline
+        clock.advance(2.0)
+        assert deadline.remaining() == 3.0
+        assert not deadline.expired
+        clock.advance(3.0)
+        assert deadline.expired
+    assert current_deadline() is None
+
+
+def test_nested_scope_cannot_extend_outer_budget(clock):
+    with deadline_scope(5.0) as outer:
+        clock.advance(4.0)
+        with deadline_scope(10.0) as inner:
+            assert inner.expires_at == outer.expires_at
+            assert inner.remaining() == 1.0
+        with deadline_scope(0.5) as shorter:
+            assert shorter.remaining() == 0.5
+        assert current_deadline() is outer
+
+
+def test_request_timeout_is_capped_by_remaining_budget(clock):
+    client = UpstreamClient(call_timeout=10.0, connect_timeout=3.0)
+    with deadline_scope(2.0):
+        clock.advance(0.5)
+        timeout = client._timeout(URL)
+    assert (timeout.read, timeout.connect) == (1.5, 1.5)
+    assert client._timeout(URL).read == 10.0
+
+
+@pytest.mark.parametrize("method", ["get", "post"])
+def test_expired_budget_fails_before_sending(clock, method):
+    client = UpstreamClient()
+
+    async def call():
+        with deadline_scope(1.0):
+            clock.advance(1.0)
+            await getattr(client, method)(URL)
+
+    with pytest.raises(DeadlineExceededError) as error:
+        asyncio.run(call())
+    assert error.value.url == URL
+    assert error.value.message == "Исчерпан бюджет времени запроса (1 сек.)"
+    # Запрос не отправлялся: пул не создавал клиентов
+    assert client.pool.stats()["hosts"] == {}
@@ -0,0 +1,141 @@
+"""
+Маршруты чтения списков устройств
+"""
+
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from rt_data import add_login, camera, device, rt_helper
+from sqlalchemy import delete
+
+from ext_rt_key.models import db as models
+from ext_rt_key.models.request import BadResponse, GoodResponse
+from ext_rt_key.rest.devices.devices_router import DevicesRouter
+from ext_rt_key.rest.devices.snapshots import DEVICE_LISTS
+from ext_rt_key.rest.manager import RTManger
+
+
+@pytest.fixture
+def router(db_helper):
+    return DevicesRouter(rt_manger=RTManger(db_helper), db_helper=db_helper)
+
+
+def test_all_rejects_unknown_token(db_helper, router):
+    add_login(db_helper, "79000000001", jwt_token="jwt")
+
+    response = asyncio.run(router.get_all(jwt_token="unknown"))
+    assert (response.status, response.message) == ("Bad", "Недостаточно прав")
+
+
+def test_all_returns_user_logins(db_helper, router):
+    login_id = add_login(db_helper, "79000000001", jwt_token="jwt")
+    lists = [([camera("c1")], [device("d1", "c1")], [])]
+    asyncio.run(rt_helper(db_helper, "79000000001", lists).load_devices())
+
+    response = asyncio.run(router.get_all(jwt_token="jwt"))
+    assert response.status == "Good"
+    [login] = response.data["logins"]
+    assert login["login_id"] == login_id
+    assert [item["rt_id"] for item in login["cameras"]] == ["c1"]
+    assert [item["rt_id"] for item in login["intercom"]] == ["d1"]
+    assert login["intercom"][0]["camera"]["rt_id"] == "c1"
+    assert login["barrier"] == []
+
+
+@pytest.fixture
+def client(router):
+    app = FastAPI()
+    app.include_router(router.router)
+    return TestClient(app)
+
+
+def load(db_helper, cameras):
+    login_id = add_login(db_helper, "79000000001", jwt_token="jwt")
+    asyncio.run(rt_helper(db_helper, "79000000001", [(cameras, [], [])]).load_devices())
+    return login_id
+
+
+def test_page_of_empty_list(db_helper, router):
+    login_id = load(db_helper, [])
+
+    response = router.device_page(login_id, "cameras", fields="rt_id", limit=10)
+    assert response.data == {"cameras": [], "next_cursor": None}
+
+
+def test_pages_up_to_the_last(db_helper, router):
+    login_id = load(db_helper, [camera("c1"), camera("c2"), camera("c3")])
+
+    first = router.device_page(login_id, "cameras", fields="rt_id", limit=2)
+    assert first.data["cameras"] == [{"rt_id": "c1"}, {"rt_id": "c2"}]
+    assert first.data["next_cursor"] is not None
+
+    last = router.device_page(
+        login_id, "cameras", fields="rt_id", cursor=first.data["next_cursor"], limit=2
+    )
+    assert last.data == {"cameras": [{"rt_id": "c3"}], "next_cursor": None}
+
+    # Страница ровно до конца списка тоже последняя
+    exact = router.device_page(login_id, "cameras", fields="rt_id", limit=3)
+    assert exact.data["next_cursor"] is None
+
+
+def test_invalid_cursor(db_helper, client):
+    login_id = load(db_helper, [camera("c1")])
+    params = {"jwt_token": "jwt", "login_id": login_id, "fields": "rt_id"}
+
+    assert client.get("/get_cameras", params={**params, "cursor": "abc"}).status_code == 422
+    # Курсор за концом списка - пустая страница
+    response = client.get("/get_cameras", params={**params, "cursor": 10**6, "limit": 10})
+    assert response.json()["data"] == {"cameras": [], "next_cursor": None}
+
+
+def test_unknown_fields(db_helper, client):
+    login_id = load(db_helper, [camera("c1")])
+    params = {"jwt_token": "jwt", "login_id": login_id}
+
+    body = client.get("/get_cameras", params={**params, "fields": "rt_id,secret"}).json()
+    assert (body["status"], body["message"]) == ("Bad", "Неизвестные поля: secret")
+    assert "rt_id" in body["data"]["fields"]
+
+    body = client.get("/get_cameras", params={**params, "fields": " , "}).json()
+    assert body["status"] == "Bad"
+
+
+def test_snapshot_matches_rendered_response(db_helper, router):
+    login_id = add_login(db_helper, "79000000001", jwt_token="jwt")
+    lists = [([camera("c1")], [device("d1", "c1")], [device("b1", device_type="barrier")])]
+    asyncio.run(rt_helper(db_helper, "79000000001", lists).load_devices())
+
+    def rendered(kind: str):
+        """Ответ, собранный из моделей маршрутом без готовых ответов"""
+        with db_helper.sessionmanager() as session:
+            login = session.get(models.Login, login_id, options=models.LOGIN_DEVICES_LOADING)
+            return router.good_response(data={kind: getattr(login, DEVICE_LISTS[kind])})
+
+    router.router.add_api_route(
+        "/rendered/{kind}", rendered, methods=["GET"], response_model=GoodResponse | BadResponse
+    )
+    app = FastAPI()
+    app.include_router(router.router)
+    client = TestClient(app)
+
+    params = {"jwt_token": "jwt", "login_id": login_id}
+    for kind in DEVICE_LISTS:
+        expected = client.get(f"/rendered/{kind}").content
+        assert '"message":"Успешно"'.encode() in expected
+        assert client.get(f"/get_{kind}", params=params).content == expected
+
+
+def test_missing_snapshot_is_built_without_writing(db_helper, router):
+    login_id = load(db_helper, [camera("c1")])
+    snapshots = router.rt_manger.snapshots
+    stored = snapshots.get(login_id, "cameras")
+    with db_helper.sessionmanager() as session:
+        session.execute(delete(models.DeviceSnapshot))
+
+    assert snapshots.get(login_id, "cameras") == stored
+    with db_helper.sessionmanager() as session:
+        assert session.query(models.DeviceSnapshot).count() == 0
+    assert snapshots.get(login_id + 1, "cameras") is None
@@ -0,0 +1,93 @@
+"""
+Кэш токенов, которые Rt отклонил (401)
+
+Базе здесь нужен только логин, поэтому используется SQLite в памяти
+"""
+
+import asyncio
+
+import httpx
+import pytest
+from rt_data import add_login
+
+from ext_rt_key.models import db as models
+from ext_rt_key.rest.helper import RTHelper, TOKEN_INVALID_MESSAGE
+from ext_rt_key.rest.upstream.cache import TTLCache
+from ext_rt_key.utils.db_helper import create_engine, DBHelper
+
+LOGIN = "79000000000"
+
+
+@pytest.fixture
+def sqlite_helper():
+    engine = create_engine("sqlite://", dialect="sqlite")
+    # DBHelper при создании пересоздает соединения, а с ними и базу в памяти
+    db_helper = DBHelper(engine=engine)
+    models.Base.metadata.create_all(engine)
+    try:
+        yield db_helper
+    finally:
+        engine.dispose()
+
+
+def rejecting_helper(db_helper, invalid_tokens, requests):
+    """RTHelper, которому Rt на любой запрос отвечает 401"""
+    helper = RTHelper(db_helper, login=LOGIN, invalid_tokens=invalid_tokens)
+
+    def handle(request):
+        requests.append(request.url.path)
+        return httpx.Response(401, json={})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handle))
+    helper.client.pool.client_for = lambda _: client
+    return helper
+
+
+def needs_reauth(db_helper):
+    with db_helper.sessionmanager() as session:
+        return session.query(models.Login.needs_reauth).filter_by(login=LOGIN).scalar()
+
+
+def test_rejected_token_is_not_sent_again(sqlite_helper):
+    add_login(sqlite_helper, LOGIN)
+    invalid_tokens = TTLCache[str, bool]()
+    requests = []
+    helper = rejecting_helper(sqlite_helper, invalid_tokens, requests)
+
+    response = asyncio.run(helper.open_device())
+    assert response.message == TOKEN_INVALID_MESSAGE
+    assert invalid_tokens.get(f"token-{LOGIN}")
+    assert needs_reauth(sqlite_helper)
+    assert len(requests) == 1
+
+    # Ни этот, ни новый экземпляр RTHelper того же логина в Rt больше не обращаются
+    other = rejecting_helper(sqlite_helper, invalid_tokens, requests)
+    for rt_helper in (helper, other):
+        assert asyncio.run(rt_helper.open_device()).message == TOKEN_INVALID_MESSAGE
+        assert asyncio.run(rt_helper.load_devices()).message == TOKEN_INVALID_MESSAGE
+    assert len(requests) == 1
+
+
+def test_new_token_is_not_rejected(sqlite_helper):
+    add_login(sqlite_helper, LOGIN)
+    invalid_tokens = TTLCache[str, bool]()
+    invalid_tokens.set(f"token-{LOGIN}", True)
+    helper = RTHelper(sqlite_helper, login=LOGIN, invalid_tokens=invalid_tokens)
+    assert helper._token_rejected() is not None
+
+    helper.auth_manager.authorization_token = "token-new"
+    assert helper._token_rejected() is None
+
+
+def test_concurrent_401_mark_login_once(sqlite_helper, monkeypatch):
+    add_login(sqlite_helper, LOGIN)
+    helper = RTHelper(sqlite_helper, login=LOGIN)
+    marks = []
+    monkeypatch.setattr(helper, "_mark_needs_reauth", lambda: marks.append(LOGIN))
+
+    async def run():
+        return await asyncio.gather(*(helper._on_token_invalid() for _ in range(3)))
+
+    responses = asyncio.run(run())
+    assert {response.message for response in responses} == {TOKEN_INVALID_MESSAGE}
+    assert marks == [LOGIN]
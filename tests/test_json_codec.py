@@ -0,0 +1,36 @@
+"""
+Выбор кодека JSON
+"""
+
+import pytest
+
+from ext_rt_key.utils import json_codec
+
+
+@pytest.fixture(autouse=True)
+def restore_codec():
+    codec = json_codec.get_codec()
+    yield
+    json_codec.set_codec(codec.name)
+
+
+def test_orjson_is_default():
+    assert json_codec.set_codec().name == "orjson"
+    assert json_codec.get_codec().name == "orjson"
+
+
+@pytest.mark.parametrize("name", ["orjson", "stdlib"])
+def test_codecs_produce_same_json(name):
+    json_codec.set_codec(name)
+    data = {"message": "Успешно", "data": {"items": [1, 2.5, None, True]}}
+
+    raw = json_codec.dumps(data)
+    assert raw == '{"message":"Успешно","data":{"items":[1,2.5,null,true]}}'.encode()
+    assert json_codec.loads(raw) == data
+    assert json_codec.get_codec().name == name
+
+
+def test_unknown_codec_is_rejected():
+    with pytest.raises(ValueError, match="ujson"):
+        json_codec.set_codec("ujson")
+    assert json_codec.get_codec().name == "orjson"
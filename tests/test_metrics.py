@@ -0,0 +1,42 @@
+"""Выгрузка метрик OpenTelemetry в текстовом формате Prometheus"""
+
+from ext_rt_key.utils.metrics import DEFAULT_SIZE_BUCKETS, MetricsRegistry
+
+
+def test_counter_is_rendered_with_labels() -> None:
+    metrics = MetricsRegistry()
+    requests = metrics.meter.create_counter("rt_test_requests_total", description="Запросы")
+    requests.add(1, {"kind": "cameras", "result": "hit"})
+    requests.add(2, {"kind": "cameras", "result": "hit"})
+
+    text = metrics.render()
+
+    assert "# HELP rt_test_requests_total Запросы" in text
+    assert "# TYPE rt_test_requests_total counter" in text
+    assert 'rt_test_requests_total{kind="cameras",result="hit"} 3.0' in text
+
+
+def test_histogram_uses_advisory_buckets() -> None:
+    metrics = MetricsRegistry()
+    size = metrics.meter.create_histogram(
+        "rt_test_size_bytes",
+        description="Размер",
+        explicit_bucket_boundaries_advisory=DEFAULT_SIZE_BUCKETS,
+    )
+    size.record(300, {"endpoint": "/api"})
+    size.record(5000, {"endpoint": "/api"})
+
+    text = metrics.render()
+
+    assert 'rt_test_size_bytes_bucket{endpoint="/api",le="256"} 0.0' in text
+    assert 'rt_test_size_bytes_bucket{endpoint="/api",le="1024"} 1.0' in text
+    assert 'rt_test_size_bytes_bucket{endpoint="/api",le="+Inf"} 2.0' in text
+    assert 'rt_test_size_bytes_sum{endpoint="/api"} 5300.0' in text
+
+
+def test_instrument_is_shared_by_name() -> None:
+    metrics = MetricsRegistry()
+    metrics.meter.create_counter("rt_test_runs_total").add(1)
+    metrics.meter.create_counter("rt_test_runs_total").add(1)
+
+    assert "rt_test_runs_total 2.0" in metrics.render()
@@ -0,0 +1,64 @@
+"""
+Ограничение частоты запросов к авторизации Rt
+"""
+
+import pytest
+
+from ext_rt_key.rest.upstream.rate_limit import AuthRateLimiter, TokenBucket
+
+
+def test_bucket_allows_burst_then_refills(clock):
+    bucket = TokenBucket(rate=2.0, capacity=2)
+    for _ in range(2):
+        assert bucket.wait_time() == 0.0
+        bucket.take()
+    assert bucket.wait_time() == 0.5
+
+    clock.advance(0.5)
+    assert bucket.wait_time() == 0.0
+    # Корзина не наполняется сверх `capacity`
+    clock.advance(60.0)
+    bucket.wait_time()
+    assert bucket.tokens == 2.0
+
+
+def test_login_limit_is_per_login(clock):
+    limiter = AuthRateLimiter(login_rate_per_minute=6.0, login_burst=1)
+    assert limiter.acquire("a") == 0.0
+    assert limiter.acquire("a") == 10.0
+    assert limiter.acquire("b") == 0.0
+    clock.advance(10.0)
+    assert limiter.acquire("a") == 0.0
+    assert limiter.rejected == 1
+
+
+@pytest.mark.usefixtures("clock")
+def test_global_limit_applies_to_all_logins():
+    limiter = AuthRateLimiter(global_rate_per_second=1.0, global_burst=2)
+    assert limiter.acquire("a") == 0.0
+    assert limiter.acquire("b") == 0.0
+    assert limiter.acquire("c") == 1.0
+
+
+def test_interval_exceeded_cooldown_doubles_up_to_max(clock):
+    limiter = AuthRateLimiter(cooldown_initial=60.0, cooldown_max=200.0)
+    assert limiter.on_interval_exceeded("a") == 60.0
+    assert limiter.acquire("a") == 60.0
+    assert limiter.acquire("b") == 0.0
+
+    clock.advance(60.0)
+    assert limiter.acquire("a") == 0.0
+    assert limiter.on_interval_exceeded("a") == 120.0
+    assert limiter.on_interval_exceeded("a") == 200.0
+    assert limiter.on_interval_exceeded("a") == 200.0
+
+
+@pytest.mark.usefixtures("clock")
+def test_success_resets_cooldown():
+    limiter = AuthRateLimiter()
+    limiter.on_interval_exceeded("a")
+    limiter.on_interval_exceeded("a")
+    limiter.on_success("a")
+    assert limiter.acquire("a") == 0.0
+    assert limiter.on_interval_exceeded("a") == 60.0
+    assert limiter.stats() == {"rejected": 0, "tracked_logins": 1, "cooling_down": 1}
@@ -0,0 +1,62 @@
+"""
+Кэш списков устройств для маршрутов чтения
+"""
+
+from ext_rt_key.rest.devices.cache import DevicesReadCache
+
+
+def loader(*values):
+    """Чтение из базы, которое по очереди отдает `values` и считает вызовы"""
+    rows = iter(values)
+    calls = []
+
+    def load():
+        calls.append(None)
+        return next(rows)
+
+    return load, calls
+
+
+def test_second_read_is_served_from_cache():
+    cache = DevicesReadCache()
+    load, calls = loader(["a"])
+    assert cache.get_or_load(1, "cameras", load) == ["a"]
+    assert cache.get_or_load(1, "cameras", load) == ["a"]
+    assert len(calls) == 1
+
+
+def test_invalidate_makes_all_kinds_of_login_stale():
+    cache = DevicesReadCache()
+    load, calls = loader(["a"], ["b"])
+    cache.get_or_load(1, "cameras", load)
+    cache.get_or_load(2, "cameras", lambda: ["other"])
+
+    cache.invalidate(1)
+    assert cache.version(1) == 1
+    assert cache.get(1, "cameras") is None
+    assert cache.get_or_load(1, "cameras", load) == ["b"]
+    assert len(calls) == 2
+    # Версии логинов независимы
+    assert cache.get(2, "cameras") == ["other"]
+
+
+def test_sync_during_load_does_not_cache_stale_rows():
+    cache = DevicesReadCache()
+
+    def load_while_sync_writes():
+        rows = ["old"]
+        cache.invalidate(1)  # синхронизация записала новые данные, пока шло чтение
+        return rows
+
+    assert cache.get_or_load(1, "intercom", load_while_sync_writes) == ["old"]
+    assert cache.get(1, "intercom") is None
+    assert cache.get_or_load(1, "intercom", lambda: ["new"]) == ["new"]
+    assert cache.get(1, "intercom") == ["new"]
+
+
+def test_entry_expires_after_ttl(clock):
+    cache = DevicesReadCache(ttl=10.0)
+    cache.get_or_load(1, "barrier", lambda: ["a"])
+    clock.advance(10.0)
+    assert cache.get(1, "barrier") is None
+    assert cache.stats()["size"] == 0
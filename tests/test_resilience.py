@@ -0,0 +1,113 @@
+"""
+Предохранитель и адаптивный лимит хостов Rt
+"""
+
+import asyncio
+
+import pytest
+
+from ext_rt_key.rest.upstream.errors import CircuitOpenError, UpstreamOverloadedError
+from ext_rt_key.rest.upstream.resilience import (
+    AdaptiveLimiter,
+    BreakerState,
+    CircuitBreaker,
+    HostGuards,
+)
+
+URL = "https://household.key.rt.ru/api/v2/app/devices/intercom"
+
+
+def open_breaker(**kwargs):
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=30.0, **kwargs)
+    for _ in range(2):
+        breaker.before_call(URL)
+        breaker.on_failure()
+    return breaker
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=2)
+    breaker.on_failure()
+    breaker.on_success()
+    breaker.on_failure()
+    assert breaker.state == BreakerState.closed
+
+    breaker.on_failure()
+    assert breaker.state == BreakerState.open
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call(URL)
+    assert breaker.rejected == 1
+
+
+def test_half_open_probe_closes_on_success(clock):
+    breaker = open_breaker()
+    clock.advance(30.0)
+    breaker.before_call(URL)
+    assert breaker.state == BreakerState.half_open
+    # Пока пробный запрос не завершился, остальные отклоняются
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call(URL)
+
+    breaker.on_success()
+    assert breaker.state == BreakerState.closed
+    breaker.before_call(URL)
+
+
+def test_half_open_probe_failure_reopens(clock):
+    breaker = open_breaker()
+    clock.advance(30.0)
+    breaker.before_call(URL)
+    breaker.on_failure()
+    assert breaker.state == BreakerState.open
+    clock.advance(29.0)
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call(URL)
+
+
+def test_stale_probe_lets_next_probe_through(clock):
+    breaker = open_breaker()
+    clock.advance(30.0)
+    breaker.before_call(URL)  # пробный запрос отменен и не сообщил результат
+    clock.advance(30.0)
+    breaker.before_call(URL)
+    assert breaker.state == BreakerState.half_open
+
+
+def test_limit_grows_additively_up_to_max():
+    limiter = AdaptiveLimiter(initial_limit=2, max_limit=3, latency_target=1.0)
+    limiter.on_success(0.1)
+    assert limiter.limit == 2.5  # +1 / limit за каждый быстрый ответ
+    for _ in range(3):
+        limiter.on_success(0.1)
+    assert limiter.limit == 3.0
+
+
+def test_limit_shrinks_multiplicatively_down_to_min():
+    limiter = AdaptiveLimiter(initial_limit=8, min_limit=2, latency_target=1.0)
+    limiter.on_success(1.5)
+    assert limiter.limit == 4.0
+    limiter.on_failure()
+    limiter.on_failure()
+    assert limiter.limit == 2.0
+
+
+def test_slot_rejects_when_limit_is_busy():
+    limiter = AdaptiveLimiter(initial_limit=1, max_wait=0.01)
+
+    async def run():
+        async with limiter.slot(URL):
+            with pytest.raises(UpstreamOverloadedError):
+                async with limiter.slot(URL):
+                    pass
+        # После освобождения места запрос проходит
+        async with limiter.slot(URL):
+            assert limiter.in_flight == 1
+
+    asyncio.run(run())
+    assert limiter.stats() == {"limit": 1, "in_flight": 0, "rejected": 1}
+
+
+def test_guards_are_per_host():
+    guards = HostGuards()
+    assert guards.for_url(URL) is guards.for_url("https://household.key.rt.ru/other")
+    assert guards.for_url(URL) is not guards.for_url("https://keyapis.key.rt.ru/x")
@@ -0,0 +1,71 @@
+"""
+Удаление камеры, на которую ссылаются устройства другого логина
+"""
+
+import asyncio
+
+from rt_data import add_login, camera, device, rt_helper
+from sqlalchemy import select
+
+from ext_rt_key.models import db as models
+from ext_rt_key.rest.helper import rows_fingerprint
+from ext_rt_key.rest.sync.bulk import BulkSync, LoginSnapshot
+
+
+def device_ids(db_helper):
+    with db_helper.sessionmanager() as session:
+        return set(session.execute(select(models.Devices.rt_id)).scalars())
+
+
+def fingerprints(db_helper, login_id):
+    with db_helper.sessionmanager() as session:
+        return tuple(
+            session.execute(
+                select(models.Login.cameras_fingerprint, models.Login.devices_fingerprint).where(
+                    models.Login.id == login_id
+                )
+            ).one()
+        )
+
+
+def test_other_login_devices_are_restored(db_helper):
+    add_login(db_helper, "79000000001")
+    other_id = add_login(db_helper, "79000000002")
+    owner = rt_helper(db_helper, "79000000001", [([camera("c1")], [], [])])
+    other_lists = [([camera("c1")], [device("d2", "c1")], [])]
+    other = rt_helper(db_helper, "79000000002", other_lists)
+    asyncio.run(owner.load_devices())
+    asyncio.run(other.load_devices())
+
+    # Камера пропала у первого владельца, устройство второго логина удалено каскадно
+    owner.fetch_device_lists = rt_helper(
+        db_helper, "79000000001", [([], [], [])]
+    ).fetch_device_lists
+    result = asyncio.run(owner.load_devices())
+    assert result.data["CAMERAS_DELETED"] == 1
+    assert device_ids(db_helper) == set()
+    assert fingerprints(db_helper, other_id) == (None, None)
+
+    result = asyncio.run(other.load_devices())
+    assert result.data["SKIPPED"] == []
+    assert device_ids(db_helper) == {"d2"}
+
+
+def test_bulk_resets_other_login_fingerprints(db_helper):
+    owner_id = add_login(db_helper, "79000000001")
+    other_id = add_login(db_helper, "79000000002")
+    asyncio.run(rt_helper(db_helper, "79000000001", [([camera("c1")], [], [])]).load_devices())
+    other = rt_helper(db_helper, "79000000002", [([camera("c1")], [device("d2", "c1")], [])])
+    asyncio.run(other.load_devices())
+
+    snapshot = LoginSnapshot(
+        login_id=owner_id, cameras={}, cameras_fingerprint=rows_fingerprint({})
+    )
+    result = BulkSync(rt_manger=None, db_helper=db_helper)._merge([snapshot])
+
+    assert result.cameras_deleted == 1
+    assert device_ids(db_helper) == set()
+    assert fingerprints(db_helper, other_id) == (None, None)
+
+    asyncio.run(other.load_devices())
+    assert device_ids(db_helper) == {"d2"}
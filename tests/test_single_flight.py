@@ -0,0 +1,81 @@
+"""Объединение GET запросов: у каждого ожидающего свой бюджет"""
+
+import asyncio
+import gc
+
+import pytest
+
+from ext_rt_key.rest.upstream.deadline import current_deadline, deadline_scope, detached_context
+from ext_rt_key.rest.upstream.single_flight import SingleFlight
+
+
+def test_waiter_deadline_does_not_cancel_shared_call() -> None:
+    flight = SingleFlight()
+    seen_deadlines = []
+
+    async def call() -> str:
+        seen_deadlines.append(current_deadline())
+        await asyncio.sleep(0.2)
+        return "ok"
+
+    async def short_waiter() -> str:
+        with deadline_scope(0.05) as deadline:
+            return await flight.do(
+                "key", call, context=detached_context(), timeout=deadline.remaining()
+            )
+
+    async def long_waiter() -> str:
+        await asyncio.sleep(0.01)
+        with deadline_scope(5.0) as deadline:
+            return await flight.do(
+                "key", call, context=detached_context(), timeout=deadline.remaining()
+            )
+
+    async def main() -> tuple[BaseException | str, BaseException | str]:
+        return await asyncio.gather(short_waiter(), long_waiter(), return_exceptions=True)
+
+    short, long = asyncio.run(main())
+
+    assert isinstance(short, TimeoutError)
+    assert long == "ok"
+    # Общий запрос выполнялся один раз и без бюджета того, кто его запустил
+    assert seen_deadlines == [None]
+    assert flight.stats()["coalesced"] == 1
+
+
+def test_shared_call_error_reaches_every_waiter() -> None:
+    flight = SingleFlight()
+
+    async def call() -> str:
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main() -> list[BaseException | str]:
+        return await asyncio.gather(
+            flight.do("key", call), flight.do("key", call), return_exceptions=True
+        )
+
+    results = asyncio.run(main())
+    assert [str(result) for result in results] == ["boom", "boom"]
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_error_without_waiters_is_retrieved() -> None:
+    flight = SingleFlight()
+    unhandled: list[dict[str, object]] = []
+
+    async def call() -> str:
+        await asyncio.sleep(0.05)
+        raise ValueError("boom")
+
+    async def main() -> None:
+        asyncio.get_running_loop().set_exception_handler(
+            lambda _loop, context: unhandled.append(context)
+        )
+        with pytest.raises(TimeoutError):
+            await flight.do("key", call, timeout=0.01)
+        await asyncio.sleep(0.1)
+        gc.collect()
+
+    asyncio.run(main())
+    assert unhandled == []
@@ -0,0 +1,99 @@
+"""
+Пропуск записи неизмененных списков и обновление только измененных строк
+"""
+
+import asyncio
+
+from rt_data import add_login, camera, device, rt_helper
+from sqlalchemy import delete, select
+
+from ext_rt_key.models import db as models
+
+
+def test_unchanged_payload_is_skipped(db_helper):
+    add_login(db_helper, "79000000001")
+    lists = [([camera("c1")], [device("d1", "c1"), device("d2")], [])]
+    helper = rt_helper(db_helper, "79000000001", lists)
+
+    first = asyncio.run(helper.load_devices())
+    assert first.data["SKIPPED"] == []
+    assert first.data["COUNTS"]["inserted"] == 2
+
+    second = asyncio.run(helper.load_devices())
+    assert second.data["SKIPPED"] == ["cameras", "devices"]
+    assert second.data["COUNTS"] == {"inserted": 0, "updated": 0, "unchanged": 2, "deleted": 0}
+    assert "snapshots" not in second.data["TIMINGS"]
+
+
+def test_missing_snapshots_are_rebuilt_without_changes(db_helper):
+    login_id = add_login(db_helper, "79000000001")
+    helper = rt_helper(db_helper, "79000000001", [([camera("c1")], [device("d1", "c1")], [])])
+    asyncio.run(helper.load_devices())
+    with db_helper.sessionmanager() as session:
+        session.execute(delete(models.DeviceSnapshot))
+
+    result = asyncio.run(helper.load_devices())
+    assert result.data["SKIPPED"] == ["cameras", "devices"]
+    assert "snapshots" in result.data["TIMINGS"]
+    assert helper.snapshots.get(login_id, "cameras") is not None
+    with db_helper.sessionmanager() as session:
+        assert session.query(models.DeviceSnapshot).count() == 3
+
+
+def test_single_changed_row_is_updated(db_helper):
+    add_login(db_helper, "79000000001")
+    lists = [([camera("c1"), camera("c2")], [device("d1", "c1"), device("d2")], [])]
+    helper = rt_helper(db_helper, "79000000001", lists)
+    asyncio.run(helper.load_devices())
+
+    lists[0] = (
+        [camera("c1"), camera("c2")],
+        [device("d1", "c2", name_by_user="Подъезд 1"), device("d2")],
+        [],
+    )
+    result = asyncio.run(helper.load_devices())
+
+    assert result.data["SKIPPED"] == ["cameras"]
+    assert result.data["COUNTS"] == {"inserted": 0, "updated": 1, "unchanged": 1, "deleted": 0}
+    with db_helper.sessionmanager() as session:
+        row = session.execute(
+            select(models.Devices.camera_id, models.Devices.name_by_user).where(
+                models.Devices.rt_id == "d1"
+            )
+        ).one()
+    assert tuple(row) == ("c2", "Подъезд 1")
+
+
+def test_devices_are_not_saved_without_cameras(db_helper):
+    add_login(db_helper, "79000000001")
+    lists = [([camera("c1")], [device("d1", "c1")], [])]
+    helper = rt_helper(db_helper, "79000000001", lists)
+    asyncio.run(helper.load_devices())
+
+    # Камера c2 не сохранена, устройство со ссылкой на нее нарушило бы внешний ключ
+    lists[0] = (None, [device("d1", "c2"), device("d2", "c2")], [])
+    result = asyncio.run(helper.load_devices())
+
+    assert result.status == "Good"
+    assert result.data["DEVICES_NOT_SAVED"] == "Список камер не получен"
+    assert "COUNTS" not in result.data
+    assert "snapshots" not in result.data["TIMINGS"]
+    with db_helper.sessionmanager() as session:
+        rows = session.execute(select(models.Devices.rt_id, models.Devices.camera_id)).all()
+    assert [tuple(row) for row in rows] == [("d1", "c1")]
+
+
+def test_nothing_is_written_without_device_lists(db_helper):
+    add_login(db_helper, "79000000001")
+    lists = [([camera("c1")], [device("d1", "c1")], [])]
+    helper = rt_helper(db_helper, "79000000001", lists)
+    asyncio.run(helper.load_devices())
+
+    lists[0] = ([camera("c1")], None, None)
+    result = asyncio.run(helper.load_devices())
+
+    assert result.data["DEVICES_NOT_SAVED"] == "Списки домофонов и шлагбаумов не получены"
+    assert result.data["SKIPPED"] == ["cameras"]
+    assert "snapshots" not in result.data["TIMINGS"]
+    with db_helper.sessionmanager() as session:
+        assert session.query(models.Devices.rt_id).all() == [("d1",)]
@@ -0,0 +1,105 @@
+"""
+Состояния и этапы задач синхронизации
+"""
+
+import asyncio
+
+from ext_rt_key.models.request import BadResponse, GoodResponse
+from ext_rt_key.rest.sync.jobs import SyncJobs, SyncJobStatus
+
+
+def test_job_goes_through_phases_to_done():
+    async def scenario():
+        jobs = SyncJobs()
+        proceed = asyncio.Event()
+        phases = []
+
+        async def run(progress):
+            progress("fetch")
+            await proceed.wait()
+            progress("save_devices")
+            phases.append(job.phase)
+            return GoodResponse(message="ok", data={"COUNTS": {"inserted": 1}})
+
+        job = jobs.submit(1, run)
+        assert job.status == SyncJobStatus.pending
+        await asyncio.sleep(0)
+        assert (job.status, job.phase) == (SyncJobStatus.running, "fetch")
+        assert jobs.running(1) is job
+
+        proceed.set()
+        await job.wait()
+        assert phases == ["save_devices"]
+        assert (job.status, job.phase, job.message) == (SyncJobStatus.done, None, "ok")
+        assert job.result == {"COUNTS": {"inserted": 1}}
+        assert job.finished_at is not None
+        assert jobs.running(1) is None
+        assert jobs.get(job.id) is job
+
+    asyncio.run(scenario())
+
+
+def test_second_submit_attaches_to_running_job():
+    async def scenario():
+        jobs = SyncJobs()
+        proceed = asyncio.Event()
+
+        async def run(_progress):
+            await proceed.wait()
+            return GoodResponse()
+
+        first = jobs.submit(1, run)
+        assert jobs.submit(1, run) is first
+        proceed.set()
+        await first.wait()
+
+        second = jobs.submit(1, run)
+        assert second is not first
+        await second.wait()
+        assert jobs.stats()["started"] == 2
+        assert jobs.stats()["attached"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_bad_response_and_error_fail_the_job():
+    async def scenario():
+        jobs = SyncJobs()
+
+        async def rejected(_progress):
+            await asyncio.sleep(0)
+            return BadResponse(message="Токен устарел")
+
+        async def broken(progress):
+            progress("fetch")
+            await asyncio.sleep(0)
+            raise RuntimeError("нет соединения")
+
+        job = await jobs.submit(1, rejected).wait()
+        assert (job.status, job.message) == (SyncJobStatus.failed, "Токен устарел")
+
+        job = await jobs.submit(2, broken).wait()
+        assert (job.status, job.phase, job.message) == (
+            SyncJobStatus.failed,
+            None,
+            "нет соединения",
+        )
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_job_is_failed():
+    async def scenario():
+        jobs = SyncJobs()
+
+        async def run(progress):
+            progress("fetch")
+            await asyncio.Event().wait()
+
+        job = jobs.submit(1, run)
+        await asyncio.sleep(0)
+        await jobs.aclose()
+        assert (job.status, job.phase) == (SyncJobStatus.failed, None)
+        assert jobs.running(1) is None
+
+    asyncio.run(scenario())
@@ -0,0 +1,66 @@
+"""
+Фоновая синхронизация: очередь проверки и блокировка ведущего процесса
+"""
+
+import asyncio
+
+from rt_data import add_login, rt_helper
+
+from ext_rt_key.rest.manager import RTManger
+from ext_rt_key.rest.sync.scheduler import SyncScheduler
+
+
+def blocked_manager(db_helper, logins, release):
+    """RTManger, хелперы которого ждут `release`, прежде чем отдать пустые списки"""
+    rt_manger = RTManger(db_helper)
+    for login in logins:
+        add_login(db_helper, login)
+        helper = rt_helper(db_helper, login, [([], [], [])])
+        fetch = helper.fetch_device_lists
+
+        async def fetch_device_lists(fetch=fetch):
+            await release.wait()
+            return await fetch()
+
+        helper.fetch_device_lists = fetch_device_lists
+        rt_manger.helpers.set(login, helper)
+    return rt_manger
+
+
+def test_tick_does_not_wait_and_caps_queue(db_helper):
+    release = asyncio.Event()
+    logins = ["79000000001", "79000000002", "79000000003"]
+    rt_manger = blocked_manager(db_helper, logins, release)
+    # Нулевой интервал: всем логинам пора обновиться сразу
+    scheduler = SyncScheduler(rt_manger, db_helper, interval=0.0, queue_size=2)
+
+    async def run():
+        await asyncio.wait_for(scheduler.tick(), 5)
+        assert scheduler.stats()["in_progress"] == 2
+        # Мест в очереди нет, уже запущенные логины повторно не запускаются
+        await scheduler.tick()
+        assert scheduler.stats()["in_progress"] == 2
+
+        release.set()
+        assert await asyncio.gather(*scheduler._running.values()) == [True, True]
+
+        await scheduler.tick()
+        assert scheduler.stats()["in_progress"] == 1
+        await scheduler.stop()
+        await rt_manger.aclose()
+
+    asyncio.run(run())
+
+
+def test_only_one_scheduler_leads(db_helper):
+    first = SyncScheduler(RTManger(db_helper), db_helper)
+    second = SyncScheduler(RTManger(db_helper), db_helper)
+
+    assert first._is_leader()
+    assert first._is_leader()
+    assert not second._is_leader()
+
+    first._release_leadership()
+    assert second._is_leader()
+    assert not first._is_leader()
+    second._release_leadership()
@@ -0,0 +1,60 @@
+"""
+LRU кэш ответов Rt с временем жизни записей
+"""
+
+from ext_rt_key.rest.upstream.cache import TTLCache
+
+
+def test_entry_expires_after_ttl(clock):
+    cache = TTLCache[str, int](ttl=10.0)
+    cache.set("a", 1)
+    clock.advance(9.9)
+    assert cache.get("a") == 1
+    clock.advance(0.1)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_per_entry_ttl_overrides_default(clock):
+    cache = TTLCache[str, int](ttl=10.0)
+    cache.set("short", 1, ttl=1.0)
+    cache.set("long", 2)
+    clock.advance(1.0)
+    assert cache.get("short") is None
+    assert cache.get("long") == 2
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache[str, int](max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" становится самой старой записью
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+def test_overwrite_does_not_evict():
+    cache = TTLCache[str, int](max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.set("a", 10)
+    assert (cache.get("a"), cache.get("b")) == (10, 2)
+    assert cache.evictions == 0
+
+
+def test_invalidate_and_stats():
+    cache = TTLCache[str, int](ttl=5.0, max_size=1)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("b")
+    cache.invalidate("b")
+    cache.get("b")
+    assert cache.stats() == {
+        "size": 0,
+        "max_size": 1,
+        "ttl": 5.0,
+        "hits": 1,
+        "misses": 1,
+        "evictions": 1,
+    }
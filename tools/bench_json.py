@@ -0,0 +1,120 @@
+"""
+:mod:`bench_json` -- Сравнение кодеков JSON на данных камер и устройств
+===================================
+.. moduleauthor:: ilya Barinov <i-barinov@it-serv.ru>
+
+Запуск::
+
+    python -m tools.bench_json --cameras 100 --devices 50
+
+Сравниваются разбор ответа Rt со списком камер (как в :meth:`UpstreamResponse.json`) и
+сериализация ответа сервиса со списком устройств (как в :class:`FastJSONResponse`).
+Базовая линия - стандартный :mod:`json` с параметрами Starlette ``JSONResponse``.
+"""
+
+import argparse
+import json
+import timeit
+from collections.abc import Callable
+from typing import Any
+
+from ext_rt_key.utils.json_codec import OrjsonCodec, StdlibCodec
+
+
+def camera_payload(count: int) -> bytes:
+    """Ответ Rt на запрос списка камер"""
+    items = [
+        {
+            "id": f"0a1b2c3d-{index:04d}-4e5f-8a9b-0c1d2e3f4a5b",
+            "archive_length": 7,
+            "screenshot_url_template": (
+                f"https://media-vdk4.camera.rt.ru/image/{index}/{{timestamp}}.jpg?token={{token}}"
+            ),
+            "screenshot_token": "eyJhbGciOiJIUzI1NiJ9." + "x" * 180,
+            "streamer_token": "eyJhbGciOiJIUzI1NiJ9." + "y" * 220,
+            "title": f"Подъезд {index}, камера над входом",
+            "is_active": True,
+        }
+        for index in range(count)
+    ]
+    return json.dumps({"data": {"items": items, "total": count}}, ensure_ascii=False).encode()
+
+
+def devices_response(count: int) -> dict[str, Any]:
+    """Ответ сервиса со списком устройств (после `GoodResponse.model_dump`)"""
+    devices = [
+        {
+            "id": index,
+            "rt_id": f"device-{index}",
+            "device_type": "intercom",
+            "login_id": 1,
+            "camera_id": f"camera-{index}",
+            "description": f"Домофон, подъезд {index}",
+            "is_favorite": index % 3 == 0,
+            "name_by_user": None,
+            "camera": {
+                "id": index,
+                "rt_id": f"camera-{index}",
+                "archive_length": 7,
+                "screenshot_url_template": f"https://media-vdk4.camera.rt.ru/image/{index}",
+                "screenshot_token": "eyJhbGciOiJIUzI1NiJ9." + "x" * 180,
+                "streamer_token": "eyJhbGciOiJIUzI1NiJ9." + "y" * 220,
+            },
+        }
+        for index in range(count)
+    ]
+    return {"status": "Good", "message": "Успешно", "data": {"intercom": devices}}
+
+
+def starlette_dumps(obj: Any) -> bytes:
+    """Сериализация как в `starlette.responses.JSONResponse.render`"""
+    return json.dumps(
+        obj, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def bench(fn: Callable[[], Any], number: int) -> float:
+    """Лучшее среднее время одного вызова в микросекундах"""
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cameras", type=int, default=100)
+    parser.add_argument("--devices", type=int, default=50)
+    parser.add_argument("--number", type=int, default=500)
+    args = parser.parse_args()
+
+    raw_cameras = camera_payload(args.cameras)
+    response = devices_response(args.devices)
+    orjson_codec, stdlib_codec = OrjsonCodec(), StdlibCodec()
+
+    cases: list[tuple[str, Callable[[], Any], Callable[[], Any]]] = [
+        (
+            f"loads cameras ({args.cameras}, {len(raw_cameras) // 1024} KiB)",
+            lambda: json.loads(raw_cameras),
+            lambda: orjson_codec.loads(raw_cameras),
+        ),
+        (
+            f"dumps devices ({args.devices})",
+            lambda: starlette_dumps(response),
+            lambda: orjson_codec.dumps(response),
+        ),
+        (
+            "dumps devices, stdlib codec",
+            lambda: starlette_dumps(response),
+            lambda: stdlib_codec.dumps(response),
+        ),
+    ]
+
+    print(f"{'case':<40}{'current, us':>14}{'codec, us':>14}{'speedup':>10}")  # noqa: T201
+    for name, current, candidate in cases:
+        current_us = bench(current, args.number)
+        candidate_us = bench(candidate, args.number)
+        print(  # noqa: T201
+            f"{name:<40}{current_us:>14.1f}{candidate_us:>14.1f}{current_us / candidate_us:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
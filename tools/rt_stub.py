@@ -0,0 +1,282 @@
+"""
+:mod:`rt_stub` -- Локальный стенд API Rt для нагрузочного тестирования
+===================================
+.. moduleauthor:: ilya Barinov <i-barinov@it-serv.ru>
+
+Эмулирует identity (keyapis), household и vc хосты Rt и websocket трансляцию fMP4.
+
+Запуск::
+
+    uvicorn tools.rt_stub:app --port 9000
+
+Приложение перенаправляется на стенд настройкой ``RT_STUB_URL=http://localhost:9000``.
+
+Режимы (``RT_STUB_MODE``):
+
+* ``synthetic`` - ответы генерируются (по умолчанию);
+* ``record`` - запросы проксируются в настоящий Rt, ответы сохраняются в ``RT_STUB_RECORD_DIR``;
+* ``replay`` - отдаются сохраненные ответы, если ответа нет - сгенерированный.
+
+Задержки и ошибки: ``RT_STUB_LATENCY``, ``RT_STUB_JITTER`` (сек.), ``RT_STUB_ERROR_RATE`` (доля
+ответов 503). Размер данных: ``RT_STUB_CAMERAS``, ``RT_STUB_INTERCOMS``, ``RT_STUB_BARRIERS``.
+"""
+
+import asyncio
+import json
+import random
+import struct
+import time
+import uuid
+from pathlib import Path
+from typing import Any
+
+import httpx
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class StubSettings(BaseSettings):
+    """Настройки стенда"""
+
+    MODE: str = "synthetic"
+    RECORD_DIR: str = "rt_stub_records"
+
+    LATENCY: float = 0.05
+    JITTER: float = 0.02
+    ERROR_RATE: float = 0.0
+
+    CAMERAS: int = 150
+    INTERCOMS: int = 30
+    BARRIERS: int = 20
+
+    # Код подтверждения, который принимает стенд
+    CODE: str = "1234"
+    # Минимальный интервал между запросами кода для одного номера
+    CODE_INTERVAL: float = 5.0
+
+    # Параметры трансляции
+    FRAGMENT_SIZE: int = 64 * 1024
+    FRAGMENT_INTERVAL: float = 0.5
+
+    model_config = SettingsConfigDict(env_prefix="RT_STUB_", extra="ignore")
+
+
+settings = StubSettings()
+app = FastAPI(title="RT stub")
+
+# Настоящие хосты Rt для режима record
+RT_HOSTS = {
+    "/identity/": "https://keyapis.key.rt.ru",
+    "/api/v2/app/": "https://household.key.rt.ru",
+    "/api/v1/cameras": "https://vc.key.rt.ru",
+}
+
+_code_requested_at: dict[str, float] = {}
+
+
+# region helpers
+def _record_path(request: Request) -> Path:
+    query = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.items()))
+    name = f"{request.method}{request.url.path}{'?' + query if query else ''}"
+    safe = "".join(ch if ch.isalnum() else "_" for ch in name)
+    return Path(settings.RECORD_DIR) / f"{safe}.json"
+
+
+async def _inject_faults() -> Response | None:
+    """Задержка и случайная ошибка 503"""
+    delay = settings.LATENCY + random.uniform(-settings.JITTER, settings.JITTER)
+    if delay > 0:
+        await asyncio.sleep(delay)
+    if random.random() < settings.ERROR_RATE:
+        return JSONResponse(status_code=503, content={"message": "stub: injected error"})
+    return None
+
+
+def _is_authorized(request: Request) -> bool:
+    return request.headers.get("Authorization", "").startswith("stub-")
+
+
+def _token_invalid() -> JSONResponse:
+    return JSONResponse(
+        status_code=401,
+        content={
+            "error": {
+                "code": "token_invalid",
+                "description": "Некорректный токен",
+                "title": "Некорректный токен",
+            }
+        },
+    )
+
+
+def _camera(index: int) -> dict[str, Any]:
+    return {
+        "id": f"stub-camera-{index}",
+        "archive_length": 7,
+        "screenshot_url_template": f"https://stub/screenshot/{index}/{{timestamp}}.jpg",
+        "screenshot_token": f"screenshot-{index}",
+        "streamer_token": f"streamer-{index}",
+    }
+
+
+def _devices(device_type: str, count: int) -> list[dict[str, Any]]:
+    return [
+        {
+            "id": f"stub-{device_type}-{index}",
+            "device_type": device_type,
+            "camera_id": f"stub-camera-{index}" if index < settings.CAMERAS else None,
+            "description": f"{device_type} {index}",
+            "is_favorite": index % 5 == 0,
+            "name_by_user": None,
+        }
+        for index in range(count)
+    ]
+
+
+# endregion
+
+
+@app.middleware("http")
+async def record_replay(request: Request, call_next: Any) -> Any:
+    """Задержки, ошибки и режимы record/replay для всех http маршрутов"""
+    if fault := await _inject_faults():
+        return fault
+
+    record_path = _record_path(request)
+
+    if settings.MODE == "replay" and record_path.exists():
+        record = json.loads(record_path.read_text(encoding="utf-8"))
+        return Response(
+            content=record["body"].encode(),
+            status_code=record["status"],
+            media_type="application/json",
+        )
+
+    if settings.MODE == "record":
+        host = next(
+            (host for prefix, host in RT_HOSTS.items() if request.url.path.startswith(prefix)),
+            None,
+        )
+        if host is not None:
+            headers = {
+                key: value
+                for key, value in request.headers.items()
+                if key.lower() not in {"host", "content-length"}
+            }
+            async with httpx.AsyncClient() as client:
+                upstream = await client.request(
+                    request.method,
+                    f"{host}{request.url.path}",
+                    params=dict(request.query_params),
+                    headers=headers,
+                    content=await request.body(),
+                )
+            record_path.parent.mkdir(parents=True, exist_ok=True)
+            record_path.write_text(
+                json.dumps({"status": upstream.status_code, "body": upstream.text}),
+                encoding="utf-8",
+            )
+            return Response(
+                content=upstream.content,
+                status_code=upstream.status_code,
+                media_type="application/json",
+            )
+
+    return await call_next(request)
+
+
+# region identity (keyapis.key.rt.ru)
+@app.post("/identity/api/v1/authorization/send_code")
+async def send_code(request: Request) -> JSONResponse:
+    payload = await request.json()
+    phone = payload.get("phoneNumber", "")
+    now = time.monotonic()
+
+    if now - _code_requested_at.get(phone, -settings.CODE_INTERVAL) < settings.CODE_INTERVAL:
+        return JSONResponse(status_code=400, content={"error": {"sso": {"intervalExceeded": {}}}})
+
+    _code_requested_at[phone] = now
+    return JSONResponse(content={"data": {"codeId": f"{phone}:{uuid.uuid4()}", "timeout": 180}})
+
+
+@app.post("/identity/api/v1/authorization/login")
+async def login(request: Request) -> JSONResponse:
+    payload = await request.json()
+    if payload.get("code") != settings.CODE:
+        return JSONResponse(status_code=400, content={"message": "Неверный код"})
+
+    phone = str(payload.get("codeId", "")).split(":", 1)[0]
+    return JSONResponse(content={"data": {"accessToken": f"stub-{phone}-{uuid.uuid4()}"}})
+
+
+# endregion
+
+
+# region vc (vc.key.rt.ru)
+@app.get("/api/v1/cameras")
+async def cameras(request: Request, limit: int = 100, offset: int = 0) -> JSONResponse:
+    if not _is_authorized(request):
+        return _token_invalid()
+
+    items = [_camera(index) for index in range(offset, min(offset + limit, settings.CAMERAS))]
+    return JSONResponse(content={"data": {"items": items, "total": settings.CAMERAS}})
+
+
+# endregion
+
+
+# region household (household.key.rt.ru)
+@app.get("/api/v2/app/devices/intercom")
+async def intercom(request: Request) -> JSONResponse:
+    if not _is_authorized(request):
+        return _token_invalid()
+    return JSONResponse(content={"data": {"devices": _devices("intercom", settings.INTERCOMS)}})
+
+
+@app.get("/api/v2/app/devices/barrier")
+async def barrier(request: Request) -> JSONResponse:
+    if not _is_authorized(request):
+        return _token_invalid()
+    return JSONResponse(content={"data": {"devices": _devices("barrier", settings.BARRIERS)}})
+
+
+@app.post("/api/v2/app/devices/{device_id}/open")
+async def open_device(request: Request, device_id: str) -> JSONResponse:  # noqa: ARG001
+    if not _is_authorized(request):
+        return _token_invalid()
+    return JSONResponse(content={})
+
+
+# endregion
+
+
+# region stream (live-vdk4.camera.rt.ru)
+def _box(box_type: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I", 8 + len(payload)) + box_type + payload
+
+
+@app.websocket("/stream/{camera_id}/{timestamp}.mp4")
+async def stream(websocket: WebSocket, camera_id: str, timestamp: str) -> None:  # noqa: ARG001
+    """
+    Поток фрагментов fMP4 (ftyp + moov, затем moof + mdat)
+
+    Содержимое фрагментов случайное: для нагрузки важны размер и частота, а не картинка
+    """
+    await websocket.accept()
+    try:
+        await websocket.send_bytes(
+            _box(b"ftyp", b"isom\x00\x00\x02\x00isomiso6mp41") + _box(b"moov", b"\x00" * 32)
+        )
+        sequence = 0
+        while True:
+            sequence += 1
+            moof = _box(b"moof", _box(b"mfhd", struct.pack(">II", 0, sequence)))
+            mdat = _box(b"mdat", random.randbytes(settings.FRAGMENT_SIZE))
+            await websocket.send_bytes(moof + mdat)
+            await asyncio.sleep(settings.FRAGMENT_INTERVAL)
+    except WebSocketDisconnect:
+        return
+
+
+# endregion